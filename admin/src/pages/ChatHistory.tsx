@@ -9,18 +9,42 @@ interface ChatRecord {
   created_at: string;
 }
 
+interface ChatHistoryPage {
+  items: ChatRecord[];
+  next_cursor: string | null;
+}
+
 const ChatHistory: React.FC = () => {
   const [history, setHistory] = useState<ChatRecord[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const [dateFrom, setDateFrom] = useState('');
+  const [dateTo, setDateTo] = useState('');
 
   useEffect(() => {
     fetchHistory();
-  }, []);
+  }, [dateFrom, dateTo]);
+
+  // 日付(ローカル時刻)の範囲を created_from / created_to に変換する
+  const buildParams = (cursor?: string) => {
+    const params: Record<string, string> = {};
+    if (cursor) params.cursor = cursor;
+    if (dateFrom) params.created_from = new Date(`${dateFrom}T00:00:00`).toISOString();
+    if (dateTo) {
+      const end = new Date(`${dateTo}T00:00:00`);
+      end.setDate(end.getDate() + 1);
+      params.created_to = end.toISOString();
+    }
+    return params;
+  };
 
   const fetchHistory = async () => {
+    setIsLoading(true);
     try {
-      const response = await axios.get('/api/admin/chat-history');
-      setHistory(response.data);
+      const response = await axios.get<ChatHistoryPage>('/api/admin/chat-history', { params: buildParams() });
+      setHistory(response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('履歴取得エラー:', error);
     } finally {
@@ -28,6 +52,20 @@ const ChatHistory: React.FC = () => {
     }
   };
 
+  const fetchMore = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const response = await axios.get<ChatHistoryPage>('/api/admin/chat-history', { params: buildParams(nextCursor) });
+      setHistory((prev) => [...prev, ...response.data.items]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('履歴取得エラー:', error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const formatDate = (dateString: string) => {
     return new Date(dateString).toLocaleString('ja-JP');
   };
@@ -36,6 +74,22 @@ const ChatHistory: React.FC = () => {
     <div className="px-4 py-6 sm:px-0">
       <h1 className="text-3xl font-bold text-gray-900 mb-6">チャット履歴</h1>
 
+      <div className="flex items-center space-x-2 mb-6">
+        <input
+          type="date"
+          value={dateFrom}
+          onChange={(e) => setDateFrom(e.target.value)}
+          className="px-3 py-2 border border-gray-300 rounded-md text-sm"
+        />
+        <span className="text-gray-500">〜</span>
+        <input
+          type="date"
+          value={dateTo}
+          onChange={(e) => setDateTo(e.target.value)}
+          className="px-3 py-2 border border-gray-300 rounded-md text-sm"
+        />
+      </div>
+
       {isLoading ? (
         <div className="text-center py-12">読み込み中...</div>
       ) : (
@@ -62,6 +116,17 @@ const ChatHistory: React.FC = () => {
               </div>
             </div>
           ))}
+          {nextCursor && (
+            <div className="text-center">
+              <button
+                onClick={fetchMore}
+                disabled={isLoadingMore}
+                className="px-4 py-2 bg-white border border-gray-300 rounded-md text-sm text-gray-700 hover:bg-gray-50 disabled:opacity-50"
+              >
+                {isLoadingMore ? '読み込み中...' : 'さらに読み込む'}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
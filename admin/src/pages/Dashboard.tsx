@@ -1,6 +1,50 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
+import axios from 'axios';
+
+interface DailyStats {
+  date: string;
+  chats: number;
+  sessions: number;
+  faq_answers: number;
+  llm_answers: number;
+  avg_latency_ms: number | null;
+}
+
+interface Stats {
+  total_chats: number;
+  today_chats: number;
+  total_sessions: number;
+  faq_count: number;
+  document_count: number;
+  faq_answers: number;
+  llm_answers: number;
+  avg_latency_ms: number | null;
+  daily: DailyStats[];
+}
 
 const Dashboard: React.FC = () => {
+  const [stats, setStats] = useState<Stats | null>(null);
+
+  useEffect(() => {
+    fetchStats();
+  }, []);
+
+  const fetchStats = async () => {
+    try {
+      const response = await axios.get<Stats>('/api/admin/stats');
+      setStats(response.data);
+    } catch (error) {
+      console.error('統計取得エラー:', error);
+    }
+  };
+
+  const formatNumber = (value: number | undefined) => (value === undefined ? '-' : value.toLocaleString('ja-JP'));
+
+  const answeredTotal = stats ? stats.faq_answers + stats.llm_answers : 0;
+  const faqRate = stats && answeredTotal > 0 ? `${Math.round((stats.faq_answers / answeredTotal) * 100)}%` : '-';
+  const avgLatency = stats && stats.avg_latency_ms !== null ? `${(stats.avg_latency_ms / 1000).toFixed(1)}秒` : '-';
+  const maxDailyChats = stats ? Math.max(1, ...stats.daily.map((day) => day.chats)) : 1;
+
   return (
     <div className="px-4 py-6 sm:px-0">
       <h1 className="text-3xl font-bold text-gray-900 mb-6">ダッシュボード</h1>
@@ -18,7 +62,8 @@ const Dashboard: React.FC = () => {
               <div className="ml-5 w-0 flex-1">
                 <dl>
                   <dt className="text-sm font-medium text-gray-500 truncate">総チャット数</dt>
-                  <dd className="text-3xl font-semibold text-gray-900">-</dd>
+                  <dd className="text-3xl font-semibold text-gray-900">{formatNumber(stats?.total_chats)}</dd>
+                  <dd className="text-sm text-gray-500">今日 {formatNumber(stats?.today_chats)} / セッション {formatNumber(stats?.total_sessions)}</dd>
                 </dl>
               </div>
             </div>
@@ -36,7 +81,8 @@ const Dashboard: React.FC = () => {
               <div className="ml-5 w-0 flex-1">
                 <dl>
                   <dt className="text-sm font-medium text-gray-500 truncate">FAQ数</dt>
-                  <dd className="text-3xl font-semibold text-gray-900">-</dd>
+                  <dd className="text-3xl font-semibold text-gray-900">{formatNumber(stats?.faq_count)}</dd>
+                  <dd className="text-sm text-gray-500">FAQ即答率 {faqRate}</dd>
                 </dl>
               </div>
             </div>
@@ -54,7 +100,8 @@ const Dashboard: React.FC = () => {
               <div className="ml-5 w-0 flex-1">
                 <dl>
                   <dt className="text-sm font-medium text-gray-500 truncate">ドキュメント数</dt>
-                  <dd className="text-3xl font-semibold text-gray-900">-</dd>
+                  <dd className="text-3xl font-semibold text-gray-900">{formatNumber(stats?.document_count)}</dd>
+                  <dd className="text-sm text-gray-500">平均応答時間 {avgLatency}</dd>
                 </dl>
               </div>
             </div>
@@ -62,6 +109,26 @@ const Dashboard: React.FC = () => {
         </div>
       </div>
 
+      {stats && (
+        <div className="mt-8 bg-white shadow rounded-lg p-6">
+          <h2 className="text-xl font-semibold text-gray-900 mb-4">日別チャット数 (過去{stats.daily.length}日)</h2>
+          <div className="flex items-end h-40 space-x-1">
+            {stats.daily.map((day) => (
+              <div
+                key={day.date}
+                className="flex-1 bg-indigo-400 hover:bg-indigo-600 rounded-t"
+                style={{ height: `${(day.chats / maxDailyChats) * 100}%`, minHeight: day.chats > 0 ? '2px' : '0' }}
+                title={`${day.date}: ${day.chats}件 (FAQ即答 ${day.faq_answers} / LLM ${day.llm_answers})`}
+              />
+            ))}
+          </div>
+          <div className="flex justify-between mt-2 text-xs text-gray-500">
+            <span>{stats.daily[0]?.date}</span>
+            <span>{stats.daily[stats.daily.length - 1]?.date}</span>
+          </div>
+        </div>
+      )}
+
       <div className="mt-8 bg-white shadow rounded-lg p-6">
         <h2 className="text-xl font-semibold text-gray-900 mb-4">クイックアクション</h2>
         <div className="grid grid-cols-1 gap-4 sm:grid-cols-2">
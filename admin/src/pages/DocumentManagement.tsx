@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 
 interface Document {
@@ -9,9 +9,26 @@ interface Document {
   is_active: boolean;
 }
 
+interface DocumentPage {
+  items: Document[];
+  next_cursor: string | null;
+}
+
+interface IngestionJob {
+  id: string;
+  filename: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  total_pages: number | null;
+  pages_processed: number;
+  chunks_indexed: number;
+  error: string | null;
+}
+
 const DocumentManagement: React.FC = () => {
   const [documents, setDocuments] = useState<Document[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [showModal, setShowModal] = useState(false);
   const [editingDoc, setEditingDoc] = useState<Document | null>(null);
   const [formData, setFormData] = useState({
@@ -20,15 +37,35 @@ const DocumentManagement: React.FC = () => {
     category: '',
     is_active: true,
   });
+  const [uploadJob, setUploadJob] = useState<IngestionJob | null>(null);
+  const fileInputRef = useRef<HTMLInputElement>(null);
 
   useEffect(() => {
     fetchDocuments();
   }, []);
 
+  // 取り込みジョブが完了するまで進捗をポーリング
+  useEffect(() => {
+    if (!uploadJob || uploadJob.status === 'completed' || uploadJob.status === 'failed') return;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`/api/admin/ingestion-jobs/${uploadJob.id}`);
+        setUploadJob(response.data);
+        if (response.data.status === 'completed') {
+          fetchDocuments();
+        }
+      } catch (error) {
+        console.error('進捗取得エラー:', error);
+      }
+    }, 1000);
+    return () => clearTimeout(timer);
+  }, [uploadJob]);
+
   const fetchDocuments = async () => {
     try {
-      const response = await axios.get('/api/admin/documents');
-      setDocuments(response.data);
+      const response = await axios.get<DocumentPage>('/api/admin/documents');
+      setDocuments(response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('ドキュメント取得エラー:', error);
     } finally {
@@ -36,6 +73,20 @@ const DocumentManagement: React.FC = () => {
     }
   };
 
+  const fetchMore = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const response = await axios.get<DocumentPage>('/api/admin/documents', { params: { cursor: nextCursor } });
+      setDocuments((prev) => [...prev, ...response.data.items]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('ドキュメント取得エラー:', error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     try {
@@ -53,6 +104,28 @@ const DocumentManagement: React.FC = () => {
     }
   };
 
+  const handleUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
+    const file = e.target.files?.[0];
+    if (!file) return;
+    const data = new FormData();
+    data.append('file', file);
+    try {
+      const response = await axios.post('/api/admin/documents/upload', data);
+      setUploadJob(response.data);
+    } catch (error) {
+      console.error('アップロードエラー:', error);
+    } finally {
+      e.target.value = '';
+    }
+  };
+
+  const formatJobProgress = (job: IngestionJob) => {
+    if (job.status === 'completed') return `取り込み完了 (${job.chunks_indexed} チャンク)`;
+    if (job.status === 'failed') return `取り込み失敗: ${job.error}`;
+    const pages = job.total_pages ? `${job.pages_processed} / ${job.total_pages}` : `${job.pages_processed}`;
+    return `取り込み中... ${pages} ページ (${job.chunks_indexed} チャンク)`;
+  };
+
   const handleEdit = (doc: Document) => {
     setEditingDoc(doc);
     setFormData({
@@ -79,18 +152,39 @@ const DocumentManagement: React.FC = () => {
     <div className="px-4 py-6 sm:px-0">
       <div className="flex justify-between items-center mb-6">
         <h1 className="text-3xl font-bold text-gray-900">ドキュメント管理</h1>
-        <button
-          onClick={() => {
-            setEditingDoc(null);
-            setFormData({ title: '', content: '', category: '', is_active: true });
-            setShowModal(true);
-          }}
-          className="px-4 py-2 bg-indigo-600 text-white rounded-md hover:bg-indigo-700"
-        >
-          + ドキュメント追加
-        </button>
+        <div className="flex space-x-2">
+          <input
+            ref={fileInputRef}
+            type="file"
+            accept=".pdf,.docx,.xlsx,.html,.htm,.txt,.md"
+            onChange={handleUpload}
+            className="hidden"
+          />
+          <button
+            onClick={() => fileInputRef.current?.click()}
+            className="px-4 py-2 border border-indigo-600 text-indigo-600 rounded-md hover:bg-indigo-50"
+          >
+            ファイルをアップロード
+          </button>
+          <button
+            onClick={() => {
+              setEditingDoc(null);
+              setFormData({ title: '', content: '', category: '', is_active: true });
+              setShowModal(true);
+            }}
+            className="px-4 py-2 bg-indigo-600 text-white rounded-md hover:bg-indigo-700"
+          >
+            + ドキュメント追加
+          </button>
+        </div>
       </div>
 
+      {uploadJob && (
+        <div className="mb-4 bg-blue-50 border border-blue-200 rounded-md px-4 py-3 text-sm text-blue-800">
+          {uploadJob.filename}: {formatJobProgress(uploadJob)}
+        </div>
+      )}
+
       {isLoading ? (
         <div className="text-center py-12">読み込み中...</div>
       ) : (
@@ -126,6 +220,17 @@ const DocumentManagement: React.FC = () => {
               </li>
             ))}
           </ul>
+          {nextCursor && (
+            <div className="px-6 py-4 text-center border-t border-gray-200">
+              <button
+                onClick={fetchMore}
+                disabled={isLoadingMore}
+                className="px-4 py-2 bg-white border border-gray-300 rounded-md text-sm text-gray-700 hover:bg-gray-50 disabled:opacity-50"
+              >
+                {isLoadingMore ? '読み込み中...' : 'さらに読み込む'}
+              </button>
+            </div>
+          )}
         </div>
       )}
 
@@ -10,9 +10,16 @@ interface FAQ {
   is_active: boolean;
 }
 
+interface FAQPage {
+  items: FAQ[];
+  next_cursor: string | null;
+}
+
 const FAQManagement: React.FC = () => {
   const [faqs, setFaqs] = useState<FAQ[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [showModal, setShowModal] = useState(false);
   const [editingFaq, setEditingFaq] = useState<FAQ | null>(null);
   const [formData, setFormData] = useState({
@@ -28,8 +35,9 @@ const FAQManagement: React.FC = () => {
 
   const fetchFaqs = async () => {
     try {
-      const response = await axios.get('/api/admin/faqs');
-      setFaqs(response.data);
+      const response = await axios.get<FAQPage>('/api/admin/faqs');
+      setFaqs(response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('FAQ取得エラー:', error);
     } finally {
@@ -37,6 +45,20 @@ const FAQManagement: React.FC = () => {
     }
   };
 
+  const fetchMore = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const response = await axios.get<FAQPage>('/api/admin/faqs', { params: { cursor: nextCursor } });
+      setFaqs((prev) => [...prev, ...response.data.items]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('FAQ取得エラー:', error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     try {
@@ -127,6 +149,17 @@ const FAQManagement: React.FC = () => {
               </li>
             ))}
           </ul>
+          {nextCursor && (
+            <div className="px-6 py-4 text-center border-t border-gray-200">
+              <button
+                onClick={fetchMore}
+                disabled={isLoadingMore}
+                className="px-4 py-2 bg-white border border-gray-300 rounded-md text-sm text-gray-700 hover:bg-gray-50 disabled:opacity-50"
+              >
+                {isLoadingMore ? '読み込み中...' : 'さらに読み込む'}
+              </button>
+            </div>
+          )}
         </div>
       )}
 
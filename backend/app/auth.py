@@ -1,22 +1,56 @@
 from datetime import datetime, timedelta
 from typing import Optional
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 from app.config import settings
 from app.database import get_db, User
+from app.executors import auth_executor, run_in_executor
+from app.metrics import metrics
+from app.user_cache import UserCache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# 管理画面は1ページで複数のAPIを呼ぶため、解決済みのユーザーを短時間キャッシュする
+user_cache = UserCache(max_entries=settings.auth_user_cache_size, ttl_seconds=settings.auth_user_cache_ttl_seconds)
+
+bcrypt_queue_seconds = metrics.histogram("auth_bcrypt_queue_seconds", "bcrypt 処理のエグゼキュータ待ち時間(秒)")
+bcrypt_seconds = metrics.histogram("auth_bcrypt_seconds", "bcrypt 処理(ハッシュ化・照合)にかかった時間(秒)")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def _run_bcrypt(func, *args):
+    """
+    bcrypt を専用の上限付きエグゼキュータで実行
+    ログインが集中してもイベントループや共有スレッドプールを占有しない
+    """
+    submitted = time.perf_counter()
+
+    def task():
+        started = time.perf_counter()
+        bcrypt_queue_seconds.observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            bcrypt_seconds.observe(time.perf_counter() - started)
+
+    return await run_in_executor(auth_executor, task)
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_bcrypt(verify_password, plain_password, hashed_password)
+
+async def aget_password_hash(password: str) -> str:
+    return await _run_bcrypt(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -54,9 +88,12 @@ def get_current_user(
     if username is None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
+    user = user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        user_cache.put(user)
 
     return user
 
@@ -66,3 +103,11 @@ def get_current_active_admin_user(current_user: User = Depends(get_current_user)
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="管理者権限が必要です")
     return current_user
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    """ユーザーの変更・削除(無効化や権限変更を含む)時にキャッシュを破棄(ユーザー名の変更前の値も)"""
+    history = inspect(target).attrs.username.history
+    for username in {target.username, *(history.deleted or ())}:
+        user_cache.invalidate(username)
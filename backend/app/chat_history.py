@@ -0,0 +1,82 @@
+# セッションの会話履歴の読み書きと、古いターンの要約(ローリングサマリー)の維持
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.chat_writer import ChatHistoryWriter
+from app.database import ChatHistory, ChatSessionSummary
+from app.prompt_budget import append_to_summary
+from app.session_cache import SessionHistoryCache
+
+# 直近の履歴をメモリから返し、毎メッセージのデータベース読み込みを省く
+session_history_cache = SessionHistoryCache(
+    max_turns=settings.history_max_turns,
+    max_sessions=settings.session_history_cache_sessions,
+    ttl_seconds=settings.session_history_cache_ttl_seconds,
+    max_bytes=int(settings.session_history_cache_max_mb * 1024 * 1024)
+)
+
+# 会話履歴はレスポンスを待たせずにまとめて保存する
+chat_history_writer = ChatHistoryWriter(
+    batch_size=settings.chat_history_batch_size,
+    flush_interval_ms=settings.chat_history_flush_interval_ms,
+    max_queue_size=settings.chat_history_queue_size,
+    summary_max_tokens=settings.prompt_summary_tokens
+)
+
+async def load_session_history(db: AsyncSession, session_id: str) -> tuple[List[Dict], Optional[str]]:
+    """
+    会話履歴(直近 HISTORY_MAX_TURNS 件)と、それより古いターンの要約を取得
+    キャッシュにない場合(再起動後や別ワーカーで始まったセッション)のみデータベースを読む
+    Returns: (history_list, summary)
+    """
+    cached = session_history_cache.get(session_id)
+    if cached is not None:
+        return cached
+
+    result = await db.execute(
+        select(ChatHistory)
+        .where(ChatHistory.session_id == session_id)
+        .order_by(ChatHistory.created_at.desc())
+        .limit(settings.history_max_turns)
+    )
+    session_history = result.scalars().all()
+
+    history_list = [
+        {
+            "user_message": h.user_message,
+            "bot_response": h.bot_response
+        }
+        for h in reversed(session_history)
+    ]
+
+    summary = None
+    if len(history_list) >= settings.history_max_turns:
+        summary_row = await db.get(ChatSessionSummary, session_id)
+        if summary_row is not None and summary_row.summary:
+            summary = summary_row.summary
+
+    session_history_cache.put(session_id, history_list, summary)
+    return history_list, summary
+
+async def save_chat_turn(session_id: str, user_message: str, bot_response: str, context_used: Dict,
+                         history_list: List[Dict], summary: Optional[str],
+                         answer_source: Optional[str] = None, latency_ms: Optional[float] = None):
+    """
+    会話履歴を保存キューに入れ、今回のターンで窓から外れた最古のターンを要約に畳み込む
+    データベースへの書き込みは chat_history_writer がまとめて行い、キャッシュは即座に更新する
+    history_list, summary: 応答生成時に読み込んだ直近の履歴と要約
+    answer_source, latency_ms: 統計用(FAQ即答かLLMか、応答までの時間)
+    """
+    new_session = not history_list and not summary
+    fold_turn = None
+    if len(history_list) >= settings.history_max_turns:
+        fold_turn = history_list[0]
+        summary = append_to_summary(summary or "", fold_turn, settings.prompt_summary_tokens)
+
+    await chat_history_writer.enqueue(
+        session_id, user_message, bot_response, context_used, fold_turn,
+        new_session=new_session, answer_source=answer_source, latency_ms=latency_ms
+    )
+    session_history_cache.append(session_id, {"user_message": user_message, "bot_response": bot_response}, summary)
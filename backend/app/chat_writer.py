@@ -0,0 +1,192 @@
+# 会話履歴の書き込みをキューに溜め、まとめて1トランザクションで保存する(write-behind)
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, select
+
+from app.database import AsyncSessionLocal, ChatHistory, ChatSessionSummary
+from app.metrics import metrics
+from app.prompt_budget import append_to_summary
+from app.stats import aggregate_chat_records, apply_chat_stats
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class ChatHistoryWriter:
+    """
+    会話履歴の書き込みキュー
+    件数(batch_size)か経過時間(flush_interval_ms)のどちらかに達したら、
+    複数行 INSERT・要約の更新・日別集計の加算を1トランザクションでまとめて行う
+    """
+
+    def __init__(self, batch_size: int, flush_interval_ms: float, max_queue_size: int,
+                 summary_max_tokens: int, max_retries: int = 3):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self.summary_max_tokens = summary_max_tokens
+        self.max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.queue_depth = metrics.gauge("chat_history_queue_depth", "保存待ちの会話履歴の件数")
+        self.flush_seconds = metrics.histogram("chat_history_flush_seconds", "会話履歴の一括保存にかかった時間(秒)")
+        self.flush_batch_size = metrics.histogram(
+            "chat_history_flush_batch_size", "一括保存1回あたりの件数",
+            buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+        )
+        self.rows_written = metrics.counter("chat_history_rows_written_total", "保存した会話履歴の件数")
+        self.write_failures = metrics.counter("chat_history_write_failures_total", "保存に失敗して破棄した会話履歴の件数")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """書き込みタスクを開始(イベントループ上で呼ぶ)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """キューに残った分を書き切ってから停止"""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    async def enqueue(self, session_id: str, user_message: str, bot_response: str,
+                      context_used: Dict, fold_turn: Optional[Dict] = None,
+                      new_session: bool = False, answer_source: Optional[str] = None,
+                      latency_ms: Optional[float] = None):
+        """
+        会話履歴を保存キューに追加
+        fold_turn: 今回のターンで履歴の窓から外れ、要約に畳み込むターン
+        new_session / answer_source / latency_ms: 日別集計用
+        キューが満杯の場合は空きが出るまで待つ(バックプレッシャー)
+        """
+        record = {
+            "session_id": session_id,
+            "user_message": user_message,
+            "bot_response": bot_response,
+            "context_used": context_used,
+            "created_at": datetime.utcnow(),
+            "fold_turn": fold_turn,
+            "new_session": new_session,
+            "answer_source": answer_source,
+            "latency_ms": latency_ms,
+        }
+        if not self.running:
+            # 書き込みタスクの停止後(終了処理中など)は直接保存する
+            await self._flush([record])
+            return
+
+        await self._queue.put(record)
+        self.queue_depth.set(self._queue.qsize())
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self.queue_depth.set(self._queue.qsize())
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict]):
+        """
+        1バッチを保存(失敗時は間隔を空けて再試行する)
+        再試行しても失敗する場合は1件ずつ保存し直し、それでも失敗した行だけを破棄する
+        (不正な1件のために同じバッチの他の会話を失わないため)
+        """
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                await self._write(batch)
+            except Exception:
+                logger.exception("Failed to write chat history batch (attempt %d/%d)", attempt, self.max_retries)
+                if attempt < self.max_retries:
+                    await asyncio.sleep(0.5 * attempt)
+                continue
+            self.flush_seconds.observe(time.perf_counter() - start)
+            self.flush_batch_size.observe(len(batch))
+            self.rows_written.inc(len(batch))
+            return
+
+        if len(batch) == 1:
+            self.write_failures.inc()
+            return
+        # 同じセッションの要約が順に更新されるよう、キューの順に1件ずつ書く
+        for record in batch:
+            try:
+                await self._write([record])
+            except Exception:
+                logger.exception("Dropping chat history record for session %s", record["session_id"])
+                self.write_failures.inc()
+                continue
+            self.rows_written.inc()
+
+    async def _write(self, batch: List[Dict]):
+        rows = [
+            {key: record[key] for key in ("session_id", "user_message", "bot_response", "context_used", "created_at")}
+            for record in batch
+        ]
+        folds = [record for record in batch if record["fold_turn"] is not None]
+
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.execute(insert(ChatHistory).values(rows))
+
+                if folds:
+                    session_ids = {record["session_id"] for record in folds}
+                    result = await db.execute(
+                        select(ChatSessionSummary).where(ChatSessionSummary.session_id.in_(session_ids))
+                    )
+                    summaries = {row.session_id: row for row in result.scalars().all()}
+                    for record in folds:
+                        summary_row = summaries.get(record["session_id"])
+                        if summary_row is None:
+                            summary_row = ChatSessionSummary(session_id=record["session_id"], summary="", turns_summarized=0)
+                            db.add(summary_row)
+                            summaries[record["session_id"]] = summary_row
+                        summary_row.summary = append_to_summary(summary_row.summary, record["fold_turn"], self.summary_max_tokens)
+                        summary_row.turns_summarized += 1
+
+                await apply_chat_stats(db, aggregate_chat_records(batch))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
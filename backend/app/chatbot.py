@@ -1,42 +1,463 @@
-from anthropic import Anthropic
 from app.config import settings
 from app.rag import rag_system
-from typing import List, Dict
+from app.executors import embedding_executor, run_in_executor
+from app.response_cache import SemanticResponseCache
+from app.rerank import RerankStage, create_reranker
+from app.rate_limit import LLMAdmission
+from app.llm_resilience import CircuitBreaker, backoff_delay, is_configuration_error, is_retryable, is_upstream_error
+from app.metrics import metrics
+from app.prompt_budget import estimate_tokens, fit_history, fit_texts, truncate_to_tokens
+from app.timing import describe_stage, record_stage, stage
+from contextlib import aclosing
+from typing import List, Dict, AsyncIterator, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 会社概要・サービス・対応方針など、リクエストによらず不変のシステムプロンプト
+SYSTEM_PROMPT = """あなたは株式会社カンマンの公式チャットボットアシスタントです。
+
+【会社概要】
+株式会社カンマンは、生成AIとブランディングで企業の競争力を高めるAI導入支援パートナーです。
+主に徳島県を中心に地方の中小企業向けにサービスを提供しています。
+
+【主要サービス】
+1. 生成AI研修 - 生成AIの基本知識と実務的な活用方法を教育
+2. ホームページ制作 - 目標設定から成果に繋がるサイト制作
+3. システム開発 - 業務効率化やデジタル化推進のためのシステム・アプリ開発
+4. ブランディング研修 - 企業の独自性と目指す姿を導き出す支援
+5. その他 - 集客コンサルティング、Web・SNS広告運用、動画制作、保守サービス
+
+【会社情報】
+- 所在地: 徳島県
+- 電話: 088-611-2333
+- 営業時間: 平日 9:30～18:00
+- 実績: 徳島県内で500プロジェクト以上のホームページ制作実績
+
+【対応方針】
+- 丁寧で親しみやすい日本語で応答してください
+- 専門用語は必要に応じて分かりやすく説明してください
+- ユーザーメッセージに含まれる【参考情報】を活用して、具体的で正確な回答を心がけてください
+- 分からないことは正直に「確認が必要です」と答え、お問い合わせへの誘導を提案してください
+- お問い合わせ先: 088-611-2333 (平日 9:30～18:00)"""
+
+# プロンプトキャッシュが有効になる最小の先頭部分のトークン数(Claude 3.5 Sonnet)
+# これに満たない範囲に付けた cache_control は無視される
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# Claude API を利用できない場合の代替回答
+FALLBACK_INTRO = "申し訳ございません。ただいまAIによる回答を生成できないため、関連する情報をご案内します。"
+FALLBACK_NO_CONTEXT = "申し訳ございません。ただいまAIによる回答を生成できません。"
+FALLBACK_CONTACT = "詳しくはお電話(088-611-2333、平日 9:30～18:00)でお問い合わせください。"
 
 class ChatbotService:
     def __init__(self):
-        self.client = Anthropic(api_key=settings.anthropic_api_key)
+        # Anthropic クライアントは初回利用時(または warm_up)に生成する
+        self._async_client = None
         self.model = "claude-3-5-sonnet-20241022"
 
-    def generate_response(self, user_message: str, session_history: List[Dict] = None) -> tuple[str, List[Dict]]:
+        # 初回の質問に対する回答キャッシュ
+        self.response_cache = SemanticResponseCache(
+            max_entries=settings.response_cache_size,
+            ttl_seconds=settings.response_cache_ttl_seconds,
+            max_distance=settings.response_cache_max_distance
+        )
+
+        # 検索候補の再ランキング(RERANK_BACKEND=none の場合は素通し)
+        self.rerank_stage = RerankStage(
+            create_reranker(settings.rerank_backend, settings.rerank_cross_encoder_model),
+            budget_ms=settings.rerank_budget_ms
+        )
+
+        # 実行中の LLM 呼び出し数の上限(超えた分は待ち行列で待たせ、溢れたら 503)
+        self.llm_admission = LLMAdmission(
+            max_concurrency=settings.llm_max_concurrency,
+            max_queue=settings.llm_max_queue,
+            queue_timeout=settings.llm_queue_timeout_seconds
+        )
+
+        # Claude API の障害が続く間は呼び出さずに代替回答を返す
+        self.circuit_breaker = CircuitBreaker(
+            "anthropic",
+            failure_threshold=settings.anthropic_circuit_failure_threshold,
+            reset_timeout=settings.anthropic_circuit_reset_seconds
+        )
+        self.llm_retries = metrics.counter("anthropic_retries_total", "Claude API 呼び出しの再試行数")
+        self.llm_non_retryable_errors = metrics.counter(
+            "anthropic_non_retryable_errors_total", "Claude API が再試行しても回復しないエラー(400・401・403・404 など)を返した件数"
+        )
+        self.llm_fallback_answers = metrics.counter("llm_fallback_answers_total", "Claude API を利用できず代替回答を返した件数")
+
+        self.token_counters = {
+            name: metrics.counter(f"anthropic_{name}_total", f"Claude API の {name} 累計")
+            for name in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+        }
+        self.faq_fast_path_answers = metrics.counter("faq_fast_path_answers_total", "LLMを呼ばずにFAQで回答した件数")
+        self.prompt_tokens = metrics.histogram(
+            "prompt_input_tokens_estimated", "予算適用後の入力トークン数(概算)",
+            buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+        )
+        self.prompt_untrimmed_tokens = metrics.histogram(
+            "prompt_untrimmed_tokens_estimated", "予算適用前の入力トークン数(概算)",
+            buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+        )
+        # 1回の呼び出しあたりのトークン数(Claude API の応答の usage。応答時間との相関を見る)
+        self.request_tokens = {
+            name: metrics.histogram(
+                f"anthropic_request_{name}", f"Claude API 呼び出し1回あたりの {name}",
+                buckets=(50, 100, 250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+            )
+            for name in ("input_tokens", "output_tokens")
+        }
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from anthropic import AsyncAnthropic
+            # 再試行はブレーカーと連動させるため SDK 側では行わない
+            self._async_client = AsyncAnthropic(api_key=settings.anthropic_api_key, base_url=settings.anthropic_base_url, timeout=settings.anthropic_timeout_seconds, max_retries=0)
+        return self._async_client
+
+    def warm_up(self):
+        """Anthropic クライアントと再ランキングモデルを用意しておく"""
+        self.async_client
+        self.rerank_stage.warm_up()
+
+    async def agenerate_response(self, user_message: str, session_history: List[Dict] = None, use_cache: bool = True, session_summary: Optional[str] = None) -> tuple[str, List[Dict]]:
         """
         ユーザーメッセージに対して応答を生成
+        use_cache: 回答キャッシュを使うか(会話履歴がある場合は常に使わない)
+        session_summary: 履歴の窓から外れた古いターンの要約
         Returns: (response_text, context_used)
         """
-        # RAGで関連情報を検索
-        relevant_docs = rag_system.search(user_message, n_results=3)
+        with stage("retrieve"):
+            query_embedding, relevant_docs = await self._aretrieve(user_message)
+
+        cacheable = use_cache and not session_history
+        shortcut = self._answer_without_llm(query_embedding, relevant_docs, cacheable)
+        if shortcut is not None:
+            return shortcut
+
+        permit = self.circuit_breaker.allow()
+        if permit is None:
+            return self._fallback_answer(relevant_docs)
+        try:
+            with stage("prompt_build"):
+                request_params = self._build_request_params(user_message, relevant_docs, session_history, session_summary)
+            async with self.llm_admission:
+                with stage("llm"):
+                    response = await self._acreate_message(request_params)
+        except Exception as e:
+            if not is_upstream_error(e):
+                raise
+            logger.warning("Claude API の呼び出しに失敗したため代替回答を返します: %r", e)
+            return self._fallback_answer(relevant_docs)
+        finally:
+            self.circuit_breaker.release(permit)
+        self._record_usage(response.usage)
+
+        response_text = response.content[0].text
+        context_used = self._build_context_used(relevant_docs)
+
+        if cacheable:
+            self.response_cache.store(query_embedding, self._source_ids(relevant_docs), response_text, context_used)
+
+        return response_text, context_used
+
+    async def agenerate_response_stream(self, user_message: str, session_history: List[Dict] = None, use_cache: bool = True, session_summary: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        ユーザーメッセージに対する応答をストリーミングで生成
+        Yields: {"type": "context", "context_used": [...]} を最初に1回、
+                その後 {"type": "delta", "text": "..."} をトークン到着ごとに返す
+        """
+        with stage("retrieve"):
+            query_embedding, relevant_docs = await self._aretrieve(user_message)
+
+        cacheable = use_cache and not session_history
+        shortcut = self._answer_without_llm(query_embedding, relevant_docs, cacheable)
+        if shortcut is not None:
+            response_text, context_used = shortcut
+            yield {"type": "context", "context_used": context_used}
+            yield {"type": "delta", "text": response_text}
+            return
+
+        # 検索結果は LLM の応答を待たずに先に返す
+        context_used = self._build_context_used(relevant_docs)
+        yield {"type": "context", "context_used": context_used}
+
+        permit = self.circuit_breaker.allow()
+        if permit is None:
+            async for event in self._fallback_events(relevant_docs):
+                yield event
+            return
+
+        response_parts = []
+        try:
+            with stage("prompt_build"):
+                request_params = self._build_request_params(user_message, relevant_docs, session_history, session_summary)
+            async with self.llm_admission:
+                with stage("llm"):
+                    started = time.perf_counter()
+                    async with aclosing(self._astream_message(request_params)) as texts:
+                        async for text in texts:
+                            if not response_parts:
+                                record_stage("llm_first_token", time.perf_counter() - started)
+                            response_parts.append(text)
+                            yield {"type": "delta", "text": text}
+        except Exception as e:
+            # 途中まで送った回答は差し替えられないため、代替回答は最初のトークン前の失敗に限る
+            if response_parts or not is_upstream_error(e):
+                raise
+            logger.warning("Claude API の呼び出しに失敗したため代替回答を返します: %r", e)
+            async for event in self._fallback_events(relevant_docs):
+                yield event
+            return
+        finally:
+            self.circuit_breaker.release(permit)
+
+        # 最後まで生成できた回答のみキャッシュする
+        if cacheable:
+            self.response_cache.store(query_embedding, self._source_ids(relevant_docs), "".join(response_parts), context_used)
+
+    async def _aretrieve(self, user_message: str) -> tuple[List[float], List[Dict]]:
+        """
+        RAGで関連情報を検索
+        埋め込みはイベントループ上でバッチャの結果を待ち(同時に届いた質問を1回の encode にまとめる)、
+        ベクトル検索・BM25・再ランキングだけを専用エグゼキュータで実行する
+        """
+        query_embedding = await rag_system.aembed_query(user_message)
+        relevant_docs = await run_in_executor(embedding_executor, self._search, user_message, query_embedding)
+        return query_embedding, relevant_docs
+
+    def _search(self, user_message: str, query_embedding: List[float]) -> List[Dict]:
+        """埋め込み済みの質問で検索し、再ランキングする場合は候補を広めに取ってから上位に絞る"""
+        top_k = settings.retrieval_top_k
+        n_results = max(settings.rerank_candidates, top_k) if self.rerank_stage.enabled else top_k
+        candidates = rag_system.search(user_message, n_results=n_results, query_embedding=query_embedding)
+        return self.rerank_stage.rerank(user_message, candidates, top_k)
+
+    async def _acreate_message(self, request_params: Dict):
+        """Claude API を全体の期限つきで呼び出し、再試行可能なエラーはバックオフして再試行"""
+        deadline = time.monotonic() + settings.anthropic_deadline_seconds
+        attempt = 0
+        while True:
+            try:
+                response = await self.async_client.messages.create(**request_params, timeout=self._attempt_timeout(deadline))
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.circuit_breaker.record_success()
+            return response
+
+    async def _astream_message(self, request_params: Dict) -> AsyncIterator[str]:
+        """
+        Claude API をストリーミングで呼び出す
+        最初のトークンを受け取るまでの失敗のみ再試行する(受信後の失敗はそのまま送出)
+        """
+        deadline = time.monotonic() + settings.anthropic_deadline_seconds
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self.async_client.messages.stream(**request_params, timeout=self._attempt_timeout(deadline)) as stream:
+                    async for text in stream.text_stream:
+                        started = True
+                        yield text
+                    final_message = await stream.get_final_message()
+            except Exception as e:
+                if started:
+                    if is_retryable(e):
+                        self.circuit_breaker.record_failure()
+                    raise
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._record_usage(final_message.usage)
+            self.circuit_breaker.record_success()
+            return
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        """1回の呼び出しのタイムアウト(全体の期限の残り時間を超えない。最低1秒)"""
+        return max(1.0, min(settings.anthropic_timeout_seconds, deadline - time.monotonic()))
+
+    def _retry_delay(self, exc: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """
+        再試行までの待ち時間を返す(再試行しない場合は None)
+        上流の障害(接続エラー・タイムアウト・429・5xx)で再試行を諦めた場合はブレーカーに失敗を記録する
+        """
+        if not is_retryable(exc):
+            if is_upstream_error(exc):
+                self._record_non_retryable(exc)
+            return None
+        if attempt < settings.anthropic_max_retries:
+            delay = backoff_delay(attempt, settings.anthropic_retry_base_delay, settings.anthropic_retry_max_delay)
+            # 待った後に1回分の呼び出し時間が残らない場合は諦める
+            if time.monotonic() + delay + 1.0 < deadline:
+                self.llm_retries.inc()
+                return delay
+        self.circuit_breaker.record_failure()
+        return None
+
+    def _record_non_retryable(self, exc: Exception):
+        """
+        再試行しないエラーを記録(代替回答で応答は続くため、ここで記録しないと気付けない)
+        APIキーの失効などの設定の誤りは全リクエストに共通するため、ブレーカーにも失敗として数える
+        """
+        self.llm_non_retryable_errors.inc()
+        logger.error("Claude API が再試行不可のエラーを返しました(status=%s): %r", getattr(exc, "status_code", None), exc)
+        if is_configuration_error(exc):
+            self.circuit_breaker.record_failure()
+
+    def _fallback_answer(self, relevant_docs: List[Dict]) -> tuple[str, List[Dict]]:
+        """
+        Claude API を利用できない場合の代替回答
+        最上位の検索結果(FAQは回答部分、ドキュメントは冒頭)とお問い合わせ先を返す
+        """
+        self.llm_fallback_answers.inc()
+        if not relevant_docs:
+            return f"{FALLBACK_NO_CONTEXT}\n\n{FALLBACK_CONTACT}", []
+
+        top = relevant_docs[0]
+        body = self._faq_answer(top) if (top.get('metadata') or {}).get('source') == 'FAQ' else None
+        if body is None:
+            body = top['document'][:300] + ('…' if len(top['document']) > 300 else '')
+
+        context_used = self._build_context_used([top])
+        context_used[0]['fallback'] = True
+        return f"{FALLBACK_INTRO}\n\n{body}\n\n{FALLBACK_CONTACT}", context_used
+
+    async def _fallback_events(self, relevant_docs: List[Dict]) -> AsyncIterator[Dict]:
+        """ストリーミング用の代替回答(代替回答であることを示す context を送り直す)"""
+        response_text, context_used = self._fallback_answer(relevant_docs)
+        yield {"type": "context", "context_used": context_used}
+        yield {"type": "delta", "text": response_text}
+
+    def _answer_without_llm(self, query_embedding: List[float], relevant_docs: List[Dict], use_cache: bool) -> Optional[tuple[str, List[Dict]]]:
+        """
+        LLMを呼ばずに回答できる場合はその回答を返す
+        (1) 確度の高いFAQ一致 → FAQの回答をそのまま返す
+        (2) 回答キャッシュのヒット
+        """
+        fast_path = self._faq_fast_path(relevant_docs)
+        if fast_path is not None:
+            return fast_path
+
+        if use_cache:
+            cached = self.response_cache.lookup(query_embedding, self._source_ids(relevant_docs))
+            if cached is not None:
+                response_text, context_used = cached
+                # キャッシュ内の値は書き換えず、LLM を呼ばなかったことの印を付けたコピーを返す
+                context_used = [dict(context) for context in context_used]
+                if context_used:
+                    context_used[0]['cached'] = True
+                return response_text, context_used
+
+        return None
+
+    def _faq_fast_path(self, relevant_docs: List[Dict]) -> Optional[tuple[str, List[Dict]]]:
+        """
+        最上位の検索結果が有効なFAQで、距離が閾値未満かつ次点との差が十分な場合に
+        FAQの回答を返す
+        上位2件のどちらかに距離がない(ハイブリッド検索で n-gram 索引のみに一致した)場合は、
+        次点との差を確かめられないため使わない
+        """
+        if not settings.faq_fast_path_enabled or not relevant_docs:
+            return None
+
+        top = relevant_docs[0]
+        metadata = top.get('metadata') or {}
+        distance = top.get('distance')
+        if metadata.get('source') != 'FAQ' or not metadata.get('is_active', True) or distance is None:
+            return None
+        if distance >= settings.faq_fast_path_max_distance:
+            return None
+
+        if len(relevant_docs) > 1:
+            runner_up = relevant_docs[1].get('distance')
+            if runner_up is None or runner_up - distance < settings.faq_fast_path_min_margin:
+                return None
+
+        answer = self._faq_answer(top)
+        if answer is None:
+            return None
+
+        self.faq_fast_path_answers.inc()
+        context_used = self._build_context_used([top])
+        context_used[0]['fast_path'] = True
+        return answer, context_used
+
+    def _faq_answer(self, doc: Dict) -> Optional[str]:
+        """FAQの検索結果から回答部分を取り出す(「質問: …\n回答: …」の形式で登録されている)"""
+        _, separator, answer = doc['document'].partition("\n回答: ")
+        if not separator or not answer.strip():
+            return None
+        return answer.strip()
+
+    def _source_ids(self, relevant_docs: List[Dict]) -> List[str]:
+        """検索結果の根拠となったドキュメントID(チャンクの場合は親ドキュメントのID)"""
+        return [(doc.get('metadata') or {}).get('parent_id', doc['id']) for doc in relevant_docs]
+
+    def _build_request_params(self, user_message: str, relevant_docs: List[Dict], session_history: List[Dict] = None, session_summary: Optional[str] = None) -> Dict:
+        """
+        Claude APIへのリクエストパラメータを構築
+        入力トークンが PROMPT_MAX_INPUT_TOKENS に収まるよう、
+        システムプロンプト > 質問 > 参考情報(上位から) > 直近の履歴 > 要約 の優先度で詰める
+        """
+        # システムプロンプト(キャッシュ対象の不変部分)を構築
+        system_prompt = self._build_system_prompt()
+        used = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user_message)
 
         # コンテキストを構築
-        context = self._build_context(relevant_docs)
+        full_context = self._build_context(relevant_docs)
+        context = self._build_context(relevant_docs, self._remaining_budget(settings.prompt_context_tokens, used))
+        used += estimate_tokens(context)
+
+        session_history = session_history or []
+        history = fit_history(
+            session_history,
+            self._remaining_budget(settings.prompt_history_tokens, used),
+            settings.prompt_history_turn_max_tokens
+        )
+        used += sum(estimate_tokens(turn["user_message"]) + estimate_tokens(turn["bot_response"]) for turn in history)
 
-        # システムプロンプトを構築
-        system_prompt = self._build_system_prompt(context)
+        summary = None
+        if session_summary:
+            summary = truncate_to_tokens(session_summary, self._remaining_budget(settings.prompt_summary_tokens, used)) or None
+            used += estimate_tokens(summary or "")
 
-        # 会話履歴を構築
-        messages = self._build_messages(user_message, session_history)
+        # 会話履歴と参考情報付きの質問を構築
+        messages = self._build_messages(user_message, history, context, summary)
 
-        # Claude APIを呼び出し
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=2000,
-            system=system_prompt,
-            messages=messages
+        self.prompt_tokens.observe(used)
+        self.prompt_untrimmed_tokens.observe(
+            estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user_message) + estimate_tokens(full_context)
+            + sum(estimate_tokens(turn.get("user_message", "")) + estimate_tokens(turn.get("bot_response", "")) for turn in session_history)
+            + estimate_tokens(session_summary or "")
         )
 
-        response_text = response.content[0].text
+        return {
+            "model": self.model,
+            "max_tokens": 2000,
+            "system": system_prompt,
+            "messages": messages
+        }
 
-        # 使用したコンテキストを返す
-        context_used = [
+    def _remaining_budget(self, part_budget: int, used: int) -> int:
+        """部分ごとの予算と、全体予算の残りの小さい方"""
+        return max(0, min(part_budget, settings.prompt_max_input_tokens - used))
+
+    def _build_context_used(self, relevant_docs: List[Dict]) -> List[Dict]:
+        """使用したコンテキストを返却用に整形"""
+        return [
             {
                 'document': doc['document'][:200] + '...',
                 'metadata': doc['metadata']
@@ -44,10 +465,11 @@ class ChatbotService:
             for doc in relevant_docs
         ]
 
-        return response_text, context_used
-
-    def _build_context(self, relevant_docs: List[Dict]) -> str:
-        """関連ドキュメントからコンテキストを構築"""
+    def _build_context(self, relevant_docs: List[Dict], max_tokens: Optional[int] = None) -> str:
+        """
+        関連ドキュメントからコンテキストを構築
+        max_tokens: 指定時は検索順位の高い順に予算内で採用し、溢れた分は切り詰める/捨てる
+        """
         if not relevant_docs:
             return "関連情報が見つかりませんでした。"
 
@@ -57,48 +479,33 @@ class ChatbotService:
             source = metadata.get('source', '不明')
             context_parts.append(f"【参考情報{i}】({source})\n{doc['document']}")
 
-        return "\n\n".join(context_parts)
-
-    def _build_system_prompt(self, context: str) -> str:
-        """システムプロンプトを構築"""
-        return f"""あなたは株式会社カンマンの公式チャットボットアシスタントです。
-
-【会社概要】
-株式会社カンマンは、生成AIとブランディングで企業の競争力を高めるAI導入支援パートナーです。
-主に徳島県を中心に地方の中小企業向けにサービスを提供しています。
-
-【主要サービス】
-1. 生成AI研修 - 生成AIの基本知識と実務的な活用方法を教育
-2. ホームページ制作 - 目標設定から成果に繋がるサイト制作
-3. システム開発 - 業務効率化やデジタル化推進のためのシステム・アプリ開発
-4. ブランディング研修 - 企業の独自性と目指す姿を導き出す支援
-5. その他 - 集客コンサルティング、Web・SNS広告運用、動画制作、保守サービス
-
-【会社情報】
-- 所在地: 徳島県
-- 電話: 088-611-2333
-- 営業時間: 平日 9:30～18:00
-- 実績: 徳島県内で500プロジェクト以上のホームページ制作実績
-
-【対応方針】
-- 丁寧で親しみやすい日本語で応答してください
-- 専門用語は必要に応じて分かりやすく説明してください
-- 以下の参考情報を活用して、具体的で正確な回答を心がけてください
-- 分からないことは正直に「確認が必要です」と答え、お問い合わせへの誘導を提案してください
-- お問い合わせ先: 088-611-2333 (平日 9:30～18:00)
+        if max_tokens is not None:
+            # 区切りの空行の分も見込んで予算を割り当てる
+            context_parts = fit_texts(context_parts, max(0, max_tokens - len(context_parts)))
+            if not context_parts:
+                return "関連情報が見つかりませんでした。"
 
-【参考情報】
-{context}
+        return "\n\n".join(context_parts)
 
-上記の参考情報を基に、ユーザーの質問に適切に回答してください。"""
+    def _build_system_prompt(self) -> List[Dict]:
+        """
+        システムプロンプトを構築
+        リクエストによらず不変の内容だけを置く(検索結果はユーザーメッセージ側に入れる)
+        現在のシステムプロンプトは PROMPT_CACHE_MIN_TOKENS に満たずキャッシュされないため、
+        キャッシュの区切りはシステムプロンプトを含む会話履歴の末尾(_build_messages)にだけ置く
+        """
+        block = {"type": "text", "text": SYSTEM_PROMPT}
+        if estimate_tokens(SYSTEM_PROMPT) >= PROMPT_CACHE_MIN_TOKENS:
+            block["cache_control"] = {"type": "ephemeral"}
+        return [block]
 
-    def _build_messages(self, user_message: str, session_history: List[Dict] = None) -> List[Dict]:
+    def _build_messages(self, user_message: str, session_history: List[Dict] = None, context: str = None, session_summary: Optional[str] = None) -> List[Dict]:
         """会話履歴を含むメッセージリストを構築"""
         messages = []
 
-        # 過去の会話履歴を追加(最大5件)
+        # 過去の会話履歴を追加(最大 HISTORY_MAX_TURNS 件)
         if session_history:
-            for history in session_history[-5:]:
+            for history in session_history[-settings.history_max_turns:]:
                 messages.append({
                     "role": "user",
                     "content": history.get("user_message", "")
@@ -108,13 +515,43 @@ class ChatbotService:
                     "content": history.get("bot_response", "")
                 })
 
-        # 現在のユーザーメッセージを追加
+            # 同じセッションの次のターンではシステムプロンプトと履歴部分までキャッシュから読めるようにする
+            # (この区切りまでの合計が PROMPT_CACHE_MIN_TOKENS に達するまでは無視され、初回のターンには効かない)
+            messages[-1]["content"] = [{
+                "type": "text",
+                "text": messages[-1]["content"],
+                "cache_control": {"type": "ephemeral"}
+            }]
+
+        # 現在のユーザーメッセージを追加(参考情報はリクエストごとに変わるため末尾に置く)
+        content = user_message
+        if context is not None:
+            content = f"【参考情報】\n{context}\n\n上記の参考情報を基に、以下の質問に適切に回答してください。\n\n【ご質問】\n{user_message}"
+        if session_summary:
+            content = f"【これまでの会話の要約】\n{session_summary}\n\n{content}"
         messages.append({
             "role": "user",
-            "content": user_message
+            "content": content
         })
 
         return messages
 
+    def _record_usage(self, usage):
+        """トークン使用量(プロンプトキャッシュの読み書きを含む)を記録"""
+        if usage is None:
+            return
+        counts = {
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+            "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        }
+        for name, value in counts.items():
+            self.token_counters[name].inc(value)
+        for name, histogram in self.request_tokens.items():
+            histogram.observe(counts[name])
+        describe_stage("llm", f"input_tokens={counts['input_tokens']} output_tokens={counts['output_tokens']}")
+        logger.info("Claude API usage: %s", counts)
+
 # シングルトンインスタンス
 chatbot_service = ChatbotService()
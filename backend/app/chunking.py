@@ -0,0 +1,78 @@
+import re
+from typing import Iterable, Iterator, List
+
+# 文末(。！？ など)の直後で文を区切る
+_SENTENCE_END = re.compile(r"(?<=[。！？!?])")
+
+# 見出しとみなす行(Markdown見出し、【…】だけの行、■で始まる行、「第N章」など)
+# ●・○・◆ などは箇条書きの行頭記号として使われるため見出しとはみなさない
+_HEADING = re.compile(
+    r"^\s*(#{1,6}\s|【[^】]+】\s*$|■|第[0-9０-９一二三四五六七八九十百]+[章節条項部])"
+)
+
+def is_heading(line: str) -> bool:
+    """見出し行かどうか"""
+    return bool(_HEADING.match(line))
+
+def split_sentences(text: str) -> Iterator[tuple[str, bool]]:
+    """
+    テキストを文単位に分割
+    Yields: (sentence, is_heading)
+    """
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if is_heading(line):
+            yield line, True
+            continue
+        for sentence in _SENTENCE_END.split(line):
+            sentence = sentence.strip()
+            if sentence:
+                yield sentence, False
+
+def _split_long(sentence: str, chunk_size: int, overlap: int) -> List[str]:
+    """chunk_size を超える文を文字数で分割"""
+    step = max(chunk_size - overlap, 1)
+    return [sentence[i:i + chunk_size] for i in range(0, len(sentence), step) if sentence[i:i + chunk_size]]
+
+def iter_chunks(segments: Iterable[str], chunk_size: int, overlap: int) -> Iterator[str]:
+    """
+    テキスト(ページ単位など)の列を、文の境界に沿ってチャンクに分割
+    - 1チャンクは chunk_size 文字以内
+    - 見出しの前では必ずチャンクを区切る
+    - 隣接チャンク間で overlap 文字以内の文を重複させる
+    """
+    overlap = min(overlap, chunk_size // 2)
+    current: List[str] = []
+    current_len = 0
+
+    def overlap_tail(sentences: List[str]) -> List[str]:
+        tail, length = [], 0
+        for sentence in reversed(sentences):
+            if length + len(sentence) > overlap:
+                break
+            tail.insert(0, sentence)
+            length += len(sentence)
+        return tail
+
+    for segment in segments:
+        for sentence, heading in split_sentences(segment):
+            pieces = [sentence] if len(sentence) <= chunk_size else _split_long(sentence, chunk_size, overlap)
+            for piece in pieces:
+                if current and (heading or current_len + len(piece) > chunk_size):
+                    yield "\n".join(current)
+                    # 見出しで区切った場合は前の節の文を持ち越さない
+                    current = [] if heading else overlap_tail(current)
+                    current_len = sum(len(s) for s in current)
+                    while current and current_len + len(piece) > chunk_size:
+                        current_len -= len(current.pop(0))
+                current.append(piece)
+                current_len += len(piece)
+
+    if current:
+        yield "\n".join(current)
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """テキストをチャンクのリストに分割"""
+    return list(iter_chunks([text], chunk_size, overlap))
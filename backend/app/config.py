@@ -1,28 +1,144 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # Anthropic API
     anthropic_api_key: str
+    # 1回の呼び出しのタイムアウトと、再試行を含めた全体の期限(秒)
+    anthropic_timeout_seconds: float = 20.0
+    anthropic_deadline_seconds: float = 45.0
+    anthropic_max_retries: int = 2
+    anthropic_retry_base_delay: float = 0.5
+    anthropic_retry_max_delay: float = 4.0
+    # 連続失敗がこの回数に達したら reset 秒間は呼び出さずに代替回答を返す(0 で無効)
+    anthropic_circuit_failure_threshold: int = 5
+    anthropic_circuit_reset_seconds: float = 30.0
+    # API の接続先(ベンチマークでローカルの代替サーバーに向ける場合のみ指定)
+    anthropic_base_url: Optional[str] = None
 
     # Database
     database_url: str
+    # 非同期ドライバ用のURL(未指定時は database_url から導出)
+    async_database_url: Optional[str] = None
+    # コネクションプール(同期・非同期エンジンそれぞれに適用)
+    db_pool_size: int = 20
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
 
     # Security
     secret_key: str
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    # 解決済みユーザーのキャッシュ(無効化・権限変更は別ワーカーには TTL 経過後に反映)
+    auth_user_cache_size: int = 1024
+    auth_user_cache_ttl_seconds: int = 30
 
     # CORS
     allowed_origins: str = "http://localhost:3000"
 
     # ChromaDB
     chroma_persist_directory: str = "./chroma_db"
+    # 起動時にデータベースとベクトル索引を照合する
+    reconcile_index_on_startup: bool = True
+
+    # Embedding
+    embedding_model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"
+    # hashing: モデルを読み込まない決定的な埋め込み(ベンチマーク用。検索品質は評価できない)
+    embedding_backend: str = "sentence-transformers"  # sentence-transformers / hashing
+    embedding_hashing_dimension: int = 384
+    query_embedding_cache_size: int = 1024
+    query_embedding_cache_max_mb: float = 16.0
+    embedding_batch_size: int = 32
+    # リクエストをまたいだ埋め込みのマイクロバッチ
+    embedding_max_batch_size: int = 32
+    embedding_max_wait_ms: float = 5.0
+
+    # Hybrid search (ベクトル検索 + 文字 n-gram の BM25 を RRF で統合)
+    hybrid_search_enabled: bool = True
+    hybrid_search_candidates: int = 10
+    rrf_k: int = 60
+
+    # Retrieval / reranking
+    retrieval_top_k: int = 3
+    rerank_backend: str = "none"  # none / lexical / cross-encoder
+    rerank_candidates: int = 20
+    rerank_budget_ms: float = 150.0
+    rerank_cross_encoder_model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+    # Chunking (文字数。MiniLM は先頭128トークン程度しか見ないため短めにする)
+    chunk_size: int = 150
+    chunk_overlap: int = 30
+
+    # Response cache
+    response_cache_size: int = 512
+    response_cache_ttl_seconds: int = 3600
+    response_cache_max_distance: float = 0.05
+
+    # FAQ fast path (距離はコサイン距離)
+    faq_fast_path_enabled: bool = True
+    faq_fast_path_max_distance: float = 0.12
+    faq_fast_path_min_margin: float = 0.05
+
+    # Prompt budget (トークン数は概算。日本語1文字≒1トークン)
+    prompt_max_input_tokens: int = 6000
+    prompt_context_tokens: int = 2500
+    prompt_history_tokens: int = 2000
+    prompt_history_turn_max_tokens: int = 600
+    prompt_summary_tokens: int = 400
+    # 生のまま再送する直近の会話ターン数(それより古いターンは要約に畳み込む)
+    history_max_turns: int = 5
+
+    # Session history cache (直近の履歴をメモリに保持)
+    session_history_cache_sessions: int = 10000
+    session_history_cache_ttl_seconds: int = 1800
+    session_history_cache_max_mb: float = 64.0
+
+    # Chat history write-behind (件数か経過時間のどちらかでまとめて保存)
+    chat_history_batch_size: int = 100
+    chat_history_flush_interval_ms: float = 200.0
+    chat_history_queue_size: int = 10000
+
+    # Stats (日別集計の日付の区切り。既定は日本時間)
+    stats_utc_offset_hours: int = 9
+
+    # Rate limiting (/api/chat。0 でその制限を無効化)
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"  # memory / sqlite (同一ホストの複数ワーカーで共有)
+    rate_limit_sqlite_path: str = "./rate_limit.db"
+    rate_limit_ip_per_minute: float = 30.0
+    rate_limit_ip_burst: float = 10.0
+    rate_limit_session_per_minute: float = 10.0
+    rate_limit_session_burst: float = 5.0
+    # リバースプロキシの背後で X-Forwarded-For の先頭をクライアントIPとみなす
+    # プロキシ配下では true にしないと全訪問者がプロキシのIPで1つのバケットを共有する(直接公開時は偽装を防ぐため false)
+    rate_limit_trust_forwarded_for: bool = False
+
+    # LLM admission control (ワーカーごと)
+    llm_max_concurrency: int = 16
+    llm_max_queue: int = 64
+    llm_queue_timeout_seconds: float = 10.0
+
+    # Monitoring (/metrics。設定した場合は Bearer トークンを要求する)
+    metrics_token: Optional[str] = None
 
     # Server
     host: str = "0.0.0.0"
     port: int = 8000
 
+    # File upload
+    upload_directory: str = "./uploads"
+    max_upload_size_mb: int = 50
+    # 取り込みジョブのリース。処理中のワーカーが定期的に延長し、切れたジョブは中断扱いにする
+    ingestion_job_lease_seconds: float = 120.0
+
+    # Executors
+    embedding_executor_workers: int = 4
+    threadpool_max_workers: int = 40
+    ingestion_workers: int = 1
+    auth_executor_workers: int = 2
+
     class Config:
         env_file = ".env"
 
@@ -30,4 +146,11 @@ class Settings(BaseSettings):
     def origins_list(self) -> List[str]:
         return [origin.strip() for origin in self.allowed_origins.split(",")]
 
+    @property
+    def embedding_model_id(self) -> str:
+        """埋め込みの識別子(索引の内容ハッシュ・埋め込みキャッシュのキーに使う)"""
+        if self.embedding_backend == "hashing":
+            return f"hashing-{self.embedding_hashing_dimension}"
+        return self.embedding_model_name
+
 settings = Settings()
@@ -1,16 +1,33 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Text, Date, DateTime, Boolean, Float, JSON, Index
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from app.config import settings
+from app.db_pool import engine_options
 
-engine = create_engine(settings.database_url)
+engine = create_engine(settings.database_url, **engine_options(settings.database_url))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _derive_async_database_url(url: str) -> str:
+    """同期用のURLから非同期ドライバ用のURLを導出"""
+    if url.startswith(("postgresql://", "postgresql+psycopg2://", "postgres://")):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+_async_database_url = settings.async_database_url or _derive_async_database_url(settings.database_url)
+async_engine = create_async_engine(_async_database_url, **engine_options(_async_database_url, is_async=True))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Models
 class FAQ(Base):
     __tablename__ = "faqs"
+    __table_args__ = (
+        Index("ix_faqs_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     question = Column(String(500), nullable=False)
@@ -23,6 +40,9 @@ class FAQ(Base):
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        Index("ix_documents_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
@@ -36,6 +56,12 @@ class Document(Base):
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    __table_args__ = (
+        # 管理画面の一覧(キーセットページネーション)用
+        Index("ix_chat_history_created_at_id", "created_at", "id"),
+        # セッションごとの直近履歴の取得用
+        Index("ix_chat_history_session_id_created_at", "session_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(100), nullable=False, index=True)
@@ -44,6 +70,45 @@ class ChatHistory(Base):
     context_used = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class ChatSessionSummary(Base):
+    __tablename__ = "chat_session_summaries"
+
+    session_id = Column(String(100), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    turns_summarized = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ChatDailyStats(Base):
+    """日別の会話集計(会話履歴の保存時に加算し、管理画面の統計はここから返す)"""
+    __tablename__ = "chat_daily_stats"
+
+    date = Column(Date, primary_key=True)
+    chats = Column(Integer, nullable=False, default=0)
+    # その日に始まったセッション数
+    sessions = Column(Integer, nullable=False, default=0)
+    faq_answers = Column(Integer, nullable=False, default=0)
+    llm_answers = Column(Integer, nullable=False, default=0)
+    latency_ms_total = Column(Float, nullable=False, default=0.0)
+    latency_samples = Column(Integer, nullable=False, default=0)
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String(36), primary_key=True)
+    filename = Column(String(255), nullable=False)
+    file_path = Column(String(500), nullable=False)
+    file_type = Column(String(50), nullable=False)
+    title = Column(String(200), nullable=False)
+    category = Column(String(100))
+    status = Column(String(20), nullable=False, default="queued")  # queued / running / completed / failed
+    total_pages = Column(Integer)
+    pages_processed = Column(Integer, default=0)
+    chunks_indexed = Column(Integer, default=0)
+    document_id = Column(Integer)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -58,6 +123,16 @@ class User(Base):
 # Database initialization
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _create_missing_indexes()
+
+def _create_missing_indexes():
+    """
+    既存テーブルに後から追加したインデックスを作成
+    create_all は既存テーブルのインデックスを作らないため、存在しないものだけを個別に作る
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 def get_db():
     db = SessionLocal()
@@ -65,3 +140,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,68 @@
+# コネクションプールの設定と、接続取得の待ち時間・使用率の計測
+import time
+from typing import Dict, Type
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.config import settings
+from app.metrics import metrics
+
+def instrumented_pool_class(base: Type[QueuePool], name: str) -> Type[QueuePool]:
+    """
+    接続の取り出しごとに待ち時間と使用中の接続数を記録するプールクラスを生成
+    name: メトリクスの engine ラベルの値(sync / async)
+    """
+    labels = {"engine": name}
+    wait_seconds = metrics.histogram(
+        "db_pool_checkout_wait_seconds", "コネクションプールからの接続取得の待ち時間(秒)",
+        buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0), labels=labels
+    )
+    timeouts = metrics.counter("db_pool_checkout_timeouts_total", "コネクションプールの取得タイムアウト数", labels=labels)
+    checked_out = metrics.gauge("db_pool_checked_out", "コネクションプールで使用中の接続数", labels=labels)
+    saturation = metrics.gauge("db_pool_saturation", "コネクションプールの使用率(使用中 / (pool_size + max_overflow))", labels=labels)
+
+    class InstrumentedPool(base):
+        def _update_gauges(self):
+            in_use = self.checkedout()
+            checked_out.set(in_use)
+            capacity = self.size() + max(self._max_overflow, 0)
+            saturation.set(in_use / capacity if capacity > 0 else 0.0)
+
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                timeouts.inc()
+                raise
+            finally:
+                wait_seconds.observe(time.perf_counter() - start)
+            self._update_gauges()
+            return connection
+
+        def _do_return_conn(self, record):
+            super()._do_return_conn(record)
+            self._update_gauges()
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+def engine_options(url: str, is_async: bool = False) -> Dict:
+    """
+    create_engine / create_async_engine に渡すプール設定
+    SQLite(ベンチマーク・ローカル開発用)はドライバ既定のプールのままにする
+    """
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": ASYNC_POOL_CLASS if is_async else SYNC_POOL_CLASS,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+SYNC_POOL_CLASS = instrumented_pool_class(QueuePool, "sync")
+ASYNC_POOL_CLASS = instrumented_pool_class(AsyncAdaptedQueuePool, "async")
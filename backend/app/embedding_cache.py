@@ -0,0 +1,85 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from app.metrics import metrics
+
+_WHITESPACE = re.compile(r"\s+")
+_SPACE_AROUND_WIDE = re.compile(r" ?([^\x00-\x7f]) ?")
+
+def normalize_query(text: str) -> str:
+    """
+    キャッシュキー用にクエリを正規化
+    NFKC で全角/半角を統一し、句読点を除去、空白を畳む(日本語の前後の空白は除去)
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = "".join(ch for ch in text if not unicodedata.category(ch).startswith("P"))
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _SPACE_AROUND_WIDE.sub(r"\1", text)
+
+class QueryEmbeddingCache:
+    """クエリ埋め込みのLRUキャッシュ(件数・メモリ量の両方で上限を設ける)"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = metrics.counter("query_embedding_cache_hits_total", "クエリ埋め込みキャッシュのヒット数")
+        self.misses = metrics.counter("query_embedding_cache_misses_total", "クエリ埋め込みキャッシュのミス数")
+        self.evictions = metrics.counter("query_embedding_cache_evictions_total", "クエリ埋め込みキャッシュの追い出し数")
+        self.size = metrics.gauge("query_embedding_cache_entries", "クエリ埋め込みキャッシュの件数")
+        self.size_bytes = metrics.gauge("query_embedding_cache_bytes", "クエリ埋め込みキャッシュの使用メモリ(バイト)")
+
+    @staticmethod
+    def _entry_bytes(key: Tuple[str, str], embedding: np.ndarray) -> int:
+        return embedding.nbytes + len(key[0].encode()) + len(key[1].encode())
+
+    def get(self, model_name: str, text: str) -> Optional[List[float]]:
+        """キャッシュ済みの埋め込みを取得(モデル名もキーに含める)"""
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses.inc()
+                return None
+            self._entries.move_to_end(key)
+        self.hits.inc()
+        return embedding.tolist()
+
+    def put(self, model_name: str, text: str, embedding: Sequence[float]):
+        """埋め込みを登録し、上限を超えた分を古い順に追い出す"""
+        if self.max_entries <= 0:
+            return
+        key = (model_name, normalize_query(text))
+        value = np.asarray(embedding, dtype=np.float32)
+        value.setflags(write=False)
+        entry_bytes = self._entry_bytes(key, value)
+        if entry_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._entry_bytes(key, previous)
+            self._entries[key] = value
+            self._bytes += entry_bytes
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self._bytes -= self._entry_bytes(old_key, old_value)
+                self.evictions.inc()
+
+            self.size.set(len(self._entries))
+            self.size_bytes.set(self._bytes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.size.set(0)
+            self.size_bytes.set(0)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Sequence
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """
+    同時に届いた埋め込み要求を1回の encode にまとめるマイクロバッチャ
+    最初の要求から max_wait_ms 待つか、max_batch_size 件たまった時点でまとめて計算する
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], Sequence], max_batch_size: int, max_wait_ms: float):
+        self._encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[tuple[str, Future, float]]" = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        self.batch_sizes = metrics.histogram(
+            "embedding_batch_size", "1回の encode にまとめた件数",
+            buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+        )
+        self.queue_delay = metrics.histogram(
+            "embedding_queue_delay_seconds", "埋め込み要求がバッチに入るまでの待ち時間",
+            buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+        )
+        self.encode_seconds = metrics.histogram("embedding_encode_seconds", "1バッチの encode 所要時間")
+        self.queue_depth = metrics.gauge("embedding_queue_depth", "バッチ待ちの埋め込み要求数")
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """テキストを埋め込みに変換(他のリクエストの要求とまとめて計算される)"""
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def encode_one(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aencode_one(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def submit(self, text: str) -> Future:
+        """埋め込み要求をキューに入れる"""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        self.queue_depth.inc()
+        return future
+
+    def _ensure_worker(self):
+        # 予期しない例外でスレッドが終了していた場合も起動し直す
+        if self._worker is None or not self._worker.is_alive():
+            with self._start_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _collect_batch(self) -> list:
+        """最初の要求から max_wait 経過するか max_batch_size 件になるまで要求を集める"""
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            self.queue_depth.dec(len(batch))
+            try:
+                self._process_batch(batch)
+            except Exception:
+                # 1つのバッチの失敗で唯一のワーカーを終わらせない
+                logger.exception("埋め込みバッチの処理に失敗しました")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("埋め込みバッチの処理に失敗しました"))
+
+    def _process_batch(self, batch: list):
+        # 呼び出し元がキャンセルした要求(SSE の切断など)は計算しない。
+        # 実行中にした要求はキャンセルできなくなるため、以降の set_result は失敗しない
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            self.queue_delay.observe(started - enqueued_at)
+        self.batch_sizes.observe(len(batch))
+
+        try:
+            embeddings = self._encode_fn([text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self.encode_seconds.observe(time.perf_counter() - started)
+
+        for (_, future, _), embedding in zip(batch, embeddings):
+            future.set_result(embedding.tolist() if hasattr(embedding, "tolist") else list(embedding))
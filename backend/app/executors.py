@@ -0,0 +1,47 @@
+import asyncio
+import contextvars
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar
+from app.config import settings
+
+T = TypeVar("T")
+
+# 埋め込み計算・ベクトル検索専用のスレッドプール
+# (Starletteの共有スレッドプールを CPU 処理で埋めないよう分離する)
+embedding_executor = ThreadPoolExecutor(
+    max_workers=settings.embedding_executor_workers,
+    thread_name_prefix="embedding"
+)
+
+# アップロードされたファイルの解析・取り込み用(チャットの埋め込み計算とは分離)
+ingestion_executor = ThreadPoolExecutor(
+    max_workers=settings.ingestion_workers,
+    thread_name_prefix="ingestion"
+)
+
+# パスワードのハッシュ化・照合(bcrypt)用。同時実行数を絞り、ログインの集中でCPUを占有しない
+auth_executor = ThreadPoolExecutor(
+    max_workers=settings.auth_executor_workers,
+    thread_name_prefix="auth"
+)
+
+async def run_in_executor(executor: Executor, func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    ブロッキング処理を指定したエグゼキュータで実行して待機
+    (asyncio.to_thread と同様にコンテキスト変数を引き継ぎ、段階別の計測をリクエストに紐づける)
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, partial(context.run, func, *args, **kwargs))
+
+def configure_default_threadpool():
+    """同期エンドポイント用のスレッドプール(anyio)の上限を設定値に合わせる"""
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_max_workers
+
+def shutdown_executors():
+    """エグゼキュータを停止"""
+    embedding_executor.shutdown(wait=False, cancel_futures=True)
+    ingestion_executor.shutdown(wait=False, cancel_futures=True)
+    auth_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,39 @@
+# ベンチマーク・評価用の決定的な埋め込み(モデルの読み込みなしで CPU だけで動く)
+import hashlib
+from typing import List
+
+import numpy as np
+
+from app.lexical import ngrams
+
+class HashingEmbedder:
+    """
+    文字 n-gram をハッシュで固定次元に振り分けた正規化ベクトル
+    SentenceTransformer と同じ encode(texts, batch_size=...) を持ち、RAGSystem から差し替えて使う
+    同じテキストはプロセスやマシンをまたいでも同じベクトルになる(組み込みの hash() は使わない)
+    意味の近さは扱えないため、検索品質の評価ではなく負荷試験のためのもの
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _bucket(self, token: str) -> int:
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in ngrams(text, sizes=(1, 2, 3)):
+            value = self._bucket(token)
+            # 最下位ビットで符号を決め、衝突による偏りを打ち消す
+            vector[(value >> 1) % self.dimension] += 1.0 if value & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        else:
+            # 空文字列でもコサイン距離が定義できるようにする
+            vector[0] = 1.0
+        return vector
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        return np.stack([self._embed(text) for text in texts]) if texts else np.zeros((0, self.dimension), dtype=np.float32)
@@ -0,0 +1,115 @@
+# FAQ・ドキュメントをRAGシステムに登録/削除する処理
+# 登録内容が変わったときは、そのドキュメントを根拠にした回答キャッシュも破棄する
+import hashlib
+from app.config import settings
+from app.database import FAQ, Document
+from app.chunking import chunk_text
+from app.rag import rag_system
+from app.chatbot import chatbot_service
+
+def faq_vector_id(faq_id: int) -> str:
+    return f"faq_{faq_id}"
+
+def document_vector_id(doc_id: int) -> str:
+    return f"doc_{doc_id}"
+
+def faq_text(faq: FAQ) -> str:
+    return f"質問: {faq.question}\n回答: {faq.answer}"
+
+def _update_hash(digest, part):
+    digest.update(str(part).encode("utf-8"))
+    digest.update(b"\0")
+
+def _content_hash(*parts) -> str:
+    """登録内容のハッシュ(埋め込みモデルやチャンク設定が変わった場合も変化する)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        _update_hash(digest, part)
+    return digest.hexdigest()[:32]
+
+def faq_content_hash(faq: FAQ) -> str:
+    return _content_hash(settings.embedding_model_id, faq_text(faq), faq.category, bool(faq.is_active))
+
+def document_content_hash(document: Document) -> str:
+    return _content_hash(
+        settings.embedding_model_id, settings.chunk_size, settings.chunk_overlap,
+        document.title, document.content, document.category
+    )
+
+class DocumentContentHasher:
+    """
+    本文を先頭から少しずつ受け取り、document_content_hash と同じ値を計算する
+    (ファイルの取り込み中に本文全体をメモリに保持しないため)
+    """
+
+    def __init__(self, title: str, category):
+        self._digest = hashlib.sha256()
+        for part in (settings.embedding_model_id, settings.chunk_size, settings.chunk_overlap, title):
+            _update_hash(self._digest, part)
+        self._category = category
+
+    def update(self, text: str):
+        self._digest.update(text.encode("utf-8"))
+
+    def hexdigest(self) -> str:
+        digest = self._digest.copy()
+        digest.update(b"\0")
+        _update_hash(digest, self._category)
+        return digest.hexdigest()[:32]
+
+def faq_metadata(faq: FAQ) -> dict:
+    metadata = {"source": "FAQ", "id": faq.id, "is_active": bool(faq.is_active), "content_hash": faq_content_hash(faq)}
+    if faq.category:
+        metadata["category"] = faq.category
+    return metadata
+
+def document_metadata(document: Document) -> dict:
+    metadata = {"source": "Document", "id": document.id, "content_hash": document_content_hash(document)}
+    if document.category:
+        metadata["category"] = document.category
+    return metadata
+
+def format_document_chunk(title: str, chunk: str) -> str:
+    """チャンクにドキュメントのタイトルを付ける"""
+    return f"タイトル: {title}\n内容: {chunk}"
+
+def document_chunk_texts(document: Document) -> list:
+    """ドキュメント本文をチャンクに分割し、各チャンクにタイトルを付ける"""
+    return [
+        format_document_chunk(document.title, chunk)
+        for chunk in chunk_text(document.content, settings.chunk_size, settings.chunk_overlap)
+    ]
+
+def index_faq(faq: FAQ):
+    """FAQを登録(既存のものは置き換え)"""
+    vector_id = faq_vector_id(faq.id)
+    rag_system.update_document(
+        doc_id=vector_id,
+        text=faq_text(faq),
+        metadata=faq_metadata(faq)
+    )
+    chatbot_service.response_cache.invalidate([vector_id])
+
+def index_document(document: Document):
+    """ドキュメントをチャンク単位で登録(既存のチャンクは置き換え)"""
+    vector_id = document_vector_id(document.id)
+    rag_system.add_document_chunks(vector_id, document_chunk_texts(document), document_metadata(document))
+    chatbot_service.response_cache.invalidate([vector_id])
+
+def remove_faq(faq_id: int):
+    """FAQを削除"""
+    vector_id = faq_vector_id(faq_id)
+    try:
+        rag_system.delete_document(vector_id)
+    except Exception:
+        pass
+    chatbot_service.response_cache.invalidate([vector_id])
+
+def remove_document(doc_id: int):
+    """ドキュメントの全チャンクを削除"""
+    vector_id = document_vector_id(doc_id)
+    try:
+        rag_system.delete_document_chunks(vector_id)
+    except Exception:
+        pass
+    chatbot_service.response_cache.invalidate([vector_id])
@@ -0,0 +1,276 @@
+# アップロードされたファイル(PDF/DOCX/XLSX/HTML/テキスト)をバックグラウンドで解析・取り込む処理
+# ページ(またはそれに相当するまとまり)単位で読み出し、チャンク化と埋め込みも逐次行う
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, Set
+from sqlalchemy import update
+from app.config import settings
+from app.database import SessionLocal, Document, IngestionJob
+from app.chunking import iter_chunks
+from app.executors import ingestion_executor
+from app.indexing import DocumentContentHasher, document_vector_id, document_metadata, format_document_chunk
+from app.rag import rag_system
+from app.chatbot import chatbot_service
+
+SUPPORTED_FILE_TYPES = {
+    ".pdf": "pdf",
+    ".docx": "docx",
+    ".xlsx": "xlsx",
+    ".html": "html",
+    ".htm": "html",
+    ".txt": "text",
+    ".md": "text",
+}
+
+# ページ概念のない形式で、1回に読み出す段落・行数
+_PARAGRAPHS_PER_PAGE = 50
+_ROWS_PER_PAGE = 100
+_LINES_PER_PAGE = 200
+
+logger = logging.getLogger(__name__)
+
+# このプロセスが受け付けた(実行待ち・実行中の)ジョブ。定期的に updated_at を更新してリースを延長する
+# (複数ワーカー構成で、他のワーカーが処理中のジョブを中断扱いにしないため)
+_owned_jobs: Set[str] = set()
+_owned_jobs_lock = threading.Lock()
+
+def detect_file_type(filename: str) -> Optional[str]:
+    """拡張子からファイル形式を判定"""
+    return SUPPORTED_FILE_TYPES.get(os.path.splitext(filename)[1].lower())
+
+def count_pages(file_path: str, file_type: str) -> Optional[int]:
+    """総ページ数(PDF以外は事前に分からないため None)"""
+    if file_type == "pdf":
+        from pypdf import PdfReader
+        return len(PdfReader(file_path).pages)
+    return None
+
+def iter_pages(file_path: str, file_type: str) -> Iterator[str]:
+    """ファイルからテキストをページ単位で読み出す"""
+    if file_type == "pdf":
+        from pypdf import PdfReader
+        reader = PdfReader(file_path)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+
+    elif file_type == "docx":
+        from docx import Document as DocxDocument
+        docx = DocxDocument(file_path)
+        paragraphs = [p.text for p in docx.paragraphs if p.text.strip()]
+        for i in range(0, len(paragraphs), _PARAGRAPHS_PER_PAGE):
+            yield "\n".join(paragraphs[i:i + _PARAGRAPHS_PER_PAGE])
+        for table in docx.tables:
+            yield "\n".join("\t".join(cell.text for cell in row.cells) for row in table.rows)
+
+    elif file_type == "xlsx":
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                rows = [f"【シート: {sheet.title}】"]
+                for row in sheet.iter_rows(values_only=True):
+                    values = [str(v) for v in row if v is not None]
+                    if values:
+                        rows.append("\t".join(values))
+                    if len(rows) >= _ROWS_PER_PAGE:
+                        yield "\n".join(rows)
+                        rows = []
+                if rows:
+                    yield "\n".join(rows)
+        finally:
+            workbook.close()
+
+    elif file_type == "html":
+        from bs4 import BeautifulSoup
+        with open(file_path, "rb") as f:
+            soup = BeautifulSoup(f, "html.parser")
+        for tag in soup(["script", "style", "noscript"]):
+            tag.decompose()
+        yield soup.get_text("\n")
+
+    else:
+        with open(file_path, encoding="utf-8", errors="replace") as f:
+            lines = []
+            for line in f:
+                lines.append(line)
+                if len(lines) >= _LINES_PER_PAGE:
+                    yield "".join(lines)
+                    lines = []
+            if lines:
+                yield "".join(lines)
+
+def remove_upload(file_path: Optional[str]):
+    """アップロードされたファイルを削除(既にない場合は何もしない)"""
+    if not file_path:
+        return
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+def run_ingestion_job(job_id: str):
+    """取り込みジョブを実行(ingestion_executor 上で動く)"""
+    try:
+        _run_ingestion_job(job_id)
+    finally:
+        with _owned_jobs_lock:
+            _owned_jobs.discard(job_id)
+
+def _run_ingestion_job(job_id: str):
+    db = SessionLocal()
+    job = db.get(IngestionJob, job_id)
+    if job is None:
+        db.close()
+        return
+
+    document = None
+    try:
+        job.status = "running"
+        job.total_pages = count_pages(job.file_path, job.file_type)
+        document = Document(
+            title=job.title,
+            content="",
+            file_path=job.file_path,
+            file_type=job.file_type,
+            category=job.category
+        )
+        db.add(document)
+        db.commit()
+        job.document_id = document.id
+        db.commit()
+
+        parent_id = document_vector_id(document.id)
+        metadata = document_metadata(document)
+        # 本文はチャンクの書き込みごとに追記し、読み終えたページはメモリに残さない
+        hasher = DocumentContentHasher(document.title, document.category)
+        pending_pages = []
+        content_started = False
+
+        def tracked_pages():
+            for text in iter_pages(job.file_path, job.file_type):
+                pending_pages.append(text)
+                yield text
+                job.pages_processed += 1
+
+        def append_content():
+            """読み終えたページを本文に追記(ページ間は空行で区切る)"""
+            nonlocal content_started
+            if not pending_pages:
+                return
+            text = "\n\n".join(pending_pages)
+            if content_started:
+                text = "\n\n" + text
+            content_started = True
+            pending_pages.clear()
+            hasher.update(text)
+            db.execute(
+                update(Document).where(Document.id == document.id).values(content=Document.content + text)
+                .execution_options(synchronize_session=False)
+            )
+
+        def flush(batch):
+            rag_system.upsert_chunks(parent_id, batch, metadata, start_index=job.chunks_indexed)
+            job.chunks_indexed += len(batch)
+            append_content()
+            db.commit()
+
+        batch = []
+        for chunk in iter_chunks(tracked_pages(), settings.chunk_size, settings.chunk_overlap):
+            batch.append(format_document_chunk(document.title, chunk))
+            if len(batch) >= settings.embedding_batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        append_content()
+        job.status = "completed"
+        db.commit()
+        # 取り込み開始時点では本文が未確定のため、確定後のハッシュを記録
+        rag_system.update_chunk_metadata(parent_id, {"content_hash": hasher.hexdigest()})
+        chatbot_service.response_cache.invalidate([parent_id])
+
+    except Exception as e:
+        db.rollback()
+        # 途中まで取り込んだドキュメントは残さない
+        if document is not None and document.id is not None:
+            try:
+                rag_system.delete_document_chunks(document_vector_id(document.id))
+            except Exception:
+                pass
+            db.delete(document)
+            job.document_id = None
+        job.status = "failed"
+        job.error = str(e)
+        db.commit()
+        remove_upload(job.file_path)
+
+    finally:
+        db.close()
+
+def submit_ingestion_job(job_id: str):
+    """取り込みジョブをバックグラウンドで開始"""
+    with _owned_jobs_lock:
+        _owned_jobs.add(job_id)
+    ingestion_executor.submit(run_ingestion_job, job_id)
+
+def renew_job_leases():
+    """このプロセスが受け付けたジョブの updated_at を更新(リースの延長)"""
+    with _owned_jobs_lock:
+        job_ids = list(_owned_jobs)
+    if not job_ids:
+        return
+    db = SessionLocal()
+    try:
+        db.query(IngestionJob).filter(
+            IngestionJob.id.in_(job_ids), IngestionJob.status.in_(["queued", "running"])
+        ).update({IngestionJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def fail_interrupted_jobs():
+    """
+    処理していたプロセスが終了して中断されたジョブを失敗として記録
+    INGESTION_JOB_LEASE_SECONDS の間 updated_at が更新されていない(どのワーカーも持っていない)ジョブだけを対象にする
+    途中まで作成されたドキュメントとアップロードされたファイルも削除する(残ったチャンクは索引の再照合で削除される)
+    """
+    with _owned_jobs_lock:
+        owned = set(_owned_jobs)
+    expired_before = datetime.utcnow() - timedelta(seconds=settings.ingestion_job_lease_seconds)
+    db = SessionLocal()
+    try:
+        jobs = [
+            job for job in db.query(IngestionJob).filter(
+                IngestionJob.status.in_(["queued", "running"]), IngestionJob.updated_at < expired_before
+            ).all()
+            if job.id not in owned
+        ]
+        for job in jobs:
+            if job.document_id is not None:
+                db.query(Document).filter(Document.id == job.document_id).delete(synchronize_session=False)
+                job.document_id = None
+            job.status = "failed"
+            job.error = "処理していたサーバーの停止により中断されました"
+        db.commit()
+        for job in jobs:
+            remove_upload(job.file_path)
+    finally:
+        db.close()
+
+async def maintain_job_leases():
+    """
+    受け付けたジョブのリースを定期的に延長し、リースの切れたジョブ(停止したワーカーのもの)を中断扱いにする
+    起動時に各ワーカーで開始する
+    """
+    interval = settings.ingestion_job_lease_seconds / 4
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(renew_job_leases)
+            await asyncio.to_thread(fail_interrupted_jobs)
+        except Exception:
+            logger.exception("取り込みジョブのリースの更新に失敗しました")
@@ -0,0 +1,130 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+def ngrams(text: str, sizes: Sequence[int] = (2, 3)) -> List[str]:
+    """
+    文字 n-gram に分割(形態素解析器を使わずに日本語・型番・電話番号を扱うため)
+    NFKC で全角/半角を統一し、空白で区切られた語をまたがないようにする
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for word in _WHITESPACE.split(text):
+        if not word:
+            continue
+        if len(word) < min(sizes):
+            tokens.append(word)
+            continue
+        for size in sizes:
+            tokens.extend(word[i:i + size] for i in range(len(word) - size + 1))
+    return tokens
+
+class NgramIndex:
+    """文字 n-gram の転置インデックス(BM25 でスコアリング)"""
+
+    def __init__(self, ngram_sizes: Sequence[int] = (2, 3), k1: float = 1.2, b: float = 0.75):
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.k1 = k1
+        self.b = b
+        # doc_id -> (document, metadata, 文書長)
+        self._docs: Dict[str, Tuple[str, Dict, int]] = {}
+        # term -> {doc_id: 出現回数}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # 親ドキュメントID -> チャンクID
+        self._children: Dict[str, Set[str]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: str, document: str, metadata: Optional[Dict] = None):
+        """ドキュメントを登録(既存のものは置き換え)"""
+        metadata = metadata or {}
+        term_counts = Counter(ngrams(document, self.ngram_sizes))
+        length = sum(term_counts.values())
+
+        with self._lock:
+            self._remove(doc_id)
+            self._docs[doc_id] = (document, metadata, length)
+            self._total_length += length
+            for term, count in term_counts.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+            parent_id = metadata.get("parent_id")
+            if parent_id:
+                self._children.setdefault(parent_id, set()).add(doc_id)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def remove_parent(self, parent_id: str):
+        """親ドキュメントの全チャンクを削除"""
+        with self._lock:
+            for doc_id in list(self._children.get(parent_id, ())):
+                self._remove(doc_id)
+            self._remove(parent_id)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._children.clear()
+            self._total_length = 0
+
+    def get(self, doc_id: str) -> Optional[Tuple[str, Dict]]:
+        entry = self._docs.get(doc_id)
+        return (entry[0], entry[1]) if entry else None
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """BM25 スコアの高い順に (doc_id, score) を返す"""
+        terms = set(ngrams(query, self.ngram_sizes))
+        with self._lock:
+            doc_count = len(self._docs)
+            if not terms or doc_count == 0:
+                return []
+            avg_length = self._total_length / doc_count
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self._docs[doc_id][2]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+    def _remove(self, doc_id: str):
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+        document, metadata, length = entry
+        self._total_length -= length
+        for term in set(ngrams(document, self.ngram_sizes)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        parent_id = metadata.get("parent_id")
+        if parent_id and parent_id in self._children:
+            self._children[parent_id].discard(doc_id)
+            if not self._children[parent_id]:
+                del self._children[parent_id]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """複数の順位リストを Reciprocal Rank Fusion で統合"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,119 @@
+# Claude API 呼び出しの再試行判定・バックオフ・サーキットブレーカー
+import random
+import threading
+import time
+from typing import Optional
+from app.metrics import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+def is_upstream_error(exc: Exception) -> bool:
+    """Anthropic SDK が送出した API エラー(接続・タイムアウト・HTTPエラー)か"""
+    from anthropic import APIError
+    return isinstance(exc, APIError)
+
+def is_retryable(exc: Exception) -> bool:
+    """再試行で回復しうるエラーか(接続エラー・タイムアウト・429・5xx)"""
+    from anthropic import APIConnectionError, APIStatusError
+    if isinstance(exc, APIConnectionError):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+def is_configuration_error(exc: Exception) -> bool:
+    """APIキーの失効・権限・モデル名の誤りなど、設定を直すまで全リクエストで失敗し続けるエラーか(401・403・404)"""
+    from anthropic import APIStatusError
+    return isinstance(exc, APIStatusError) and exc.status_code in (401, 403, 404)
+
+class Permit:
+    """CircuitBreaker.allow() が返す呼び出しの許可(trial: half_open の試行枠を持つか)"""
+
+    __slots__ = ("trial",)
+
+    def __init__(self, trial: bool):
+        self.trial = trial
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """指数バックオフ(full jitter)。attempt は 0 始まり"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    連続失敗が閾値に達したら一定時間 open にして上流を呼ばない
+    open の期間が過ぎたら half_open で1件だけ試し、成功すれば closed に戻す
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+        self.state_gauge = metrics.gauge(f"{name}_circuit_state", "サーキットブレーカーの状態(0=closed, 1=open, 2=half_open)")
+        self.opened = metrics.counter(f"{name}_circuit_opened_total", "サーキットブレーカーが open になった回数")
+        self.short_circuited = metrics.counter(f"{name}_circuit_rejections_total", "open のため上流を呼ばなかった件数")
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> Optional[Permit]:
+        """
+        上流を呼んでよいか(half_open では試行中の1件だけ許可)
+        Returns: 許可しない場合は None。許可した場合は、呼び出しの終了時に release に渡す Permit
+        """
+        if not self.enabled:
+            return Permit(trial=False)
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self._state == CLOSED:
+                return Permit(trial=False)
+            if self._state == HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return Permit(trial=True)
+        self.short_circuited.inc()
+        return None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+                self.opened.inc()
+
+    def release(self, permit: Optional[Permit]):
+        """
+        呼び出しの終了時(成否・中断によらず)に呼ぶ
+        試行枠は、それを持つ呼び出しの終了時にだけ返す(並行する通常の呼び出しの終了では返さない)
+        """
+        if permit is None or not permit.trial:
+            return
+        with self._lock:
+            self._trial_in_progress = False
+
+    def _set_state(self, state: str):
+        self._state = state
+        self.state_gauge.set(_STATE_VALUES[state])
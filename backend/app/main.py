@@ -1,24 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, Optional
+import aiofiles
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
 import uuid
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from app.config import settings
-from app.database import get_db, init_db, FAQ, Document, ChatHistory, User
+from app.database import get_db, get_async_db, init_db, FAQ, Document, ChatHistory, User, IngestionJob
 from app.schemas import (
     ChatRequest, ChatResponse, FAQCreate, FAQUpdate, FAQResponse,
     DocumentCreate, DocumentUpdate, DocumentResponse, UserCreate, UserResponse,
-    LoginRequest, Token, ChatHistoryResponse
+    LoginRequest, Token, ChatHistoryPage, IngestionJobResponse,
+    FAQPage, DocumentPage, StatsResponse
 )
 from app.chatbot import chatbot_service
+from app.chat_history import load_session_history, save_chat_turn, chat_history_writer
 from app.rag import rag_system
+from app.indexing import index_faq, index_document, remove_faq, remove_document
+from app.ingestion import detect_file_type, submit_ingestion_job, fail_interrupted_jobs, maintain_job_leases, remove_upload
+from app.reconcile import reconcile_index
+from app.executors import configure_default_threadpool, shutdown_executors
+from app.metrics import metrics
+from app.pagination import paginate
+from app.rate_limit import (
+    ChatRateLimiter, LLMOverloadedError, RateLimitExceeded, create_rate_limit_backend, retry_after_header
+)
+from app.stats import answer_source, backfill_chat_stats, get_stats
+from app.timing import begin_request, record_stage, stage
 from app.auth import (
-    get_password_hash, verify_password, create_access_token,
+    aget_password_hash, averify_password, create_access_token,
     get_current_user, get_current_active_admin_user
 )
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Comman Chatbot API", version="1.0.0")
 
 # CORS設定
@@ -34,6 +59,42 @@ app.add_middleware(
 def startup_event():
     """起動時にデータベースを初期化"""
     init_db()
+    fail_interrupted_jobs()
+    backfill_chat_stats()
+
+def warm_up():
+    """モデル・クライアントを読み込み、ベクトル索引を照合してから ready にする"""
+    try:
+        rag_system.warm_up()
+        chatbot_service.warm_up()
+        if settings.reconcile_index_on_startup:
+            reconcile_index()
+        app.state.ready = True
+    except Exception:
+        logger.exception("ウォームアップに失敗しました")
+
+@app.on_event("startup")
+async def configure_executors():
+    """同期エンドポイント用スレッドプールの上限を設定し、ウォームアップ・会話履歴の書き込み・取り込みジョブのリース更新を開始"""
+    configure_default_threadpool()
+
+    # 待ち受けはすぐに開始し、ウォームアップ完了までは /api/ready が 503 を返す
+    app.state.ready = False
+    app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+
+    chat_history_writer.start()
+    app.state.job_lease_task = asyncio.create_task(maintain_job_leases())
+
+@app.on_event("shutdown")
+async def drain_chat_history():
+    """終了時に取り込みジョブのリース更新を止め、保存待ちの会話履歴を書き切る"""
+    app.state.job_lease_task.cancel()
+    await chat_history_writer.stop()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """終了時にエグゼキュータを停止"""
+    shutdown_executors()
 
 # ============ Public Endpoints ============
 
@@ -41,41 +102,93 @@ def startup_event():
 def read_root():
     return {"message": "Comman Chatbot API", "version": "1.0.0"}
 
+@app.get("/api/ready")
+def read_ready():
+    """ウォームアップが完了し、リクエストを受けられる状態かを返す"""
+    if not getattr(app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="ウォームアップ中です")
+    return {"status": "ready"}
+
+# /api/chat のレート制限(クライアントIPごと・セッションごとのトークンバケット)
+chat_rate_limiter = ChatRateLimiter(
+    create_rate_limit_backend(settings.rate_limit_backend, settings.rate_limit_sqlite_path),
+    ip_per_minute=settings.rate_limit_ip_per_minute,
+    ip_burst=settings.rate_limit_ip_burst,
+    session_per_minute=settings.rate_limit_session_per_minute,
+    session_burst=settings.rate_limit_session_burst
+) if settings.rate_limit_enabled else None
+
+def _client_ip(http_request: Request) -> str:
+    """レート制限のキーにするクライアントIP"""
+    if settings.rate_limit_trust_forwarded_for:
+        forwarded_for = http_request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return forwarded_for.split(",")[0].strip()
+    return http_request.client.host if http_request.client else "unknown"
+
+async def _check_rate_limit(http_request: Request, session_id: Optional[str]):
+    """制限超過時は Retry-After 付きの 429 を返す"""
+    if chat_rate_limiter is None:
+        return
+    try:
+        await chat_rate_limiter.acheck(_client_ip(http_request), session_id)
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="リクエストが多すぎます。しばらく待ってから再度お試しください。",
+            headers={"Retry-After": retry_after_header(e.retry_after)}
+        )
+
+def _overloaded_exception(e: LLMOverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="ただいま混み合っています。しばらく待ってから再度お試しください。",
+        headers={"Retry-After": retry_after_header(e.retry_after)}
+    )
+
+def _sse_event(event: str, data: Dict) -> str:
+    """Server-Sent Events 形式の1イベントを生成"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/api/chat", response_model=ChatResponse)
-def chat(request: ChatRequest, db: Session = Depends(get_db)):
-    """チャットエンドポイント(認証不要)"""
+async def chat(request: ChatRequest, http_request: Request, http_response: Response, db: AsyncSession = Depends(get_async_db)):
+    """
+    チャットエンドポイント(認証不要)
+    処理段階ごとの所要時間を Server-Timing ヘッダで返す(エラー応答を含む)
+    """
+    start = time.perf_counter()
+    timings = begin_request()
     try:
+        with stage("rate_limit"):
+            await _check_rate_limit(http_request, request.session_id)
+
         # セッションIDがない場合は生成
         session_id = request.session_id or str(uuid.uuid4())
 
-        # 会話履歴を取得(最新5件)
-        session_history = db.query(ChatHistory).filter(
-            ChatHistory.session_id == session_id
-        ).order_by(ChatHistory.created_at.desc()).limit(5).all()
-
-        history_list = [
-            {
-                "user_message": h.user_message,
-                "bot_response": h.bot_response
-            }
-            for h in reversed(session_history)
-        ]
+        # 会話履歴(直近分)と、それより古いターンの要約を取得
+        with stage("history_load"):
+            history_list, summary = await load_session_history(db, session_id)
 
         # チャットボットの応答を生成
-        response_text, context_used = chatbot_service.generate_response(
-            request.message,
-            history_list
-        )
-
-        # 会話履歴を保存
-        chat_record = ChatHistory(
-            session_id=session_id,
-            user_message=request.message,
-            bot_response=response_text,
-            context_used={"contexts": context_used}
-        )
-        db.add(chat_record)
-        db.commit()
+        with stage("generate"):
+            response_text, context_used = await chatbot_service.agenerate_response(
+                request.message,
+                history_list,
+                session_summary=summary
+            )
+
+        # 会話履歴を保存キューに追加(データベースへの書き込みは待たない)
+        with stage("history_enqueue"):
+            await save_chat_turn(
+                session_id,
+                request.message,
+                response_text,
+                {"contexts": context_used},
+                history_list,
+                summary,
+                answer_source=answer_source(context_used),
+                latency_ms=(time.perf_counter() - start) * 1000
+            )
 
         return ChatResponse(
             response=response_text,
@@ -83,17 +196,93 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)):
             context_used=context_used
         )
 
+    except HTTPException as e:
+        error = e
+    except LLMOverloadedError as e:
+        error = _overloaded_exception(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"エラーが発生しました: {str(e)}")
+        error = HTTPException(status_code=500, detail=f"エラーが発生しました: {str(e)}")
+    finally:
+        record_stage("total", time.perf_counter() - start)
+        http_response.headers["Server-Timing"] = timings.server_timing()
+
+    # エラー応答は http_response ではなく例外のヘッダで返るため、そちらにも付ける
+    error.headers = {**(error.headers or {}), "Server-Timing": http_response.headers["Server-Timing"]}
+    raise error
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    ストリーミングチャットエンドポイント(認証不要)
+    Server-Sent Events で session → context → delta... → done の順にイベントを送信
+    Server-Timing ヘッダはストリーム開始前の段階(レート制限・履歴の取得)のみ
+    """
+    timings = begin_request()
+    with stage("rate_limit"):
+        await _check_rate_limit(http_request, request.session_id)
+    session_id = request.session_id or str(uuid.uuid4())
+    with stage("history_load"):
+        history_list, summary = await load_session_history(db, session_id)
+
+    async def event_stream():
+        start = time.perf_counter()
+        response_parts = []
+        context_used = []
+        completed = False
+        try:
+            yield _sse_event("session", {"session_id": session_id})
+
+            async for event in chatbot_service.agenerate_response_stream(request.message, history_list, session_summary=summary):
+                if event["type"] == "context":
+                    context_used = event["context_used"]
+                    yield _sse_event("context", {"context_used": context_used})
+                else:
+                    response_parts.append(event["text"])
+                    yield _sse_event("delta", {"text": event["text"]})
+
+            completed = True
+            yield _sse_event("done", {"session_id": session_id})
+
+        except LLMOverloadedError as e:
+            # ストリームは開始済みのため、ステータスコードの代わりにイベントで再試行までの秒数を伝える
+            yield _sse_event("error", {
+                "detail": "ただいま混み合っています。しばらく待ってから再度お試しください。",
+                "retry_after": int(retry_after_header(e.retry_after))
+            })
+
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"エラーが発生しました: {str(e)}"})
+
+        finally:
+            # 完了時・クライアント切断時のどちらでも、生成済みの応答を保存
+            # (切断によるキャンセルで保存処理が中断されないよう shield する)
+            if response_parts:
+                await asyncio.shield(save_chat_turn(
+                    session_id,
+                    request.message,
+                    "".join(response_parts),
+                    {"contexts": context_used, "completed": completed},
+                    history_list,
+                    summary,
+                    answer_source=answer_source(context_used),
+                    latency_ms=(time.perf_counter() - start) * 1000 if completed else None
+                ))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Server-Timing": timings.server_timing()}
+    )
 
 # ============ Authentication ============
 
 @app.post("/api/auth/login", response_model=Token)
-def login(request: LoginRequest, db: Session = Depends(get_db)):
-    """ログイン"""
-    user = db.query(User).filter(User.username == request.username).first()
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    """ログイン(bcrypt の照合は専用エグゼキュータで実行)"""
+    result = await db.execute(select(User).where(User.username == request.username))
+    user = result.scalars().first()
 
-    if not user or not verify_password(request.password, user.hashed_password):
+    if not user or not await averify_password(request.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="ユーザー名またはパスワードが正しくありません"
@@ -110,29 +299,29 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/api/auth/register", response_model=UserResponse)
-def register(
+async def register(
     user: UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_admin_user)
 ):
     """ユーザー登録(管理者のみ)"""
     # ユーザー名の重複チェック
-    if db.query(User).filter(User.username == user.username).first():
+    if (await db.execute(select(User.id).where(User.username == user.username))).first():
         raise HTTPException(status_code=400, detail="ユーザー名は既に使用されています")
 
     # メールアドレスの重複チェック
-    if db.query(User).filter(User.email == user.email).first():
+    if (await db.execute(select(User.id).where(User.email == user.email))).first():
         raise HTTPException(status_code=400, detail="メールアドレスは既に使用されています")
 
     # 新規ユーザーを作成
     db_user = User(
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password)
+        hashed_password=await aget_password_hash(user.password)
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     return db_user
 
@@ -143,16 +332,26 @@ def read_users_me(current_user: User = Depends(get_current_user)):
 
 # ============ FAQ Management (Admin) ============
 
-@app.get("/api/admin/faqs", response_model=List[FAQResponse])
+def _paginate_or_400(query, model, limit: int, cursor: Optional[str],
+                     created_from: Optional[datetime], created_to: Optional[datetime]):
+    """キーセットページネーション(不正なカーソルは 400)"""
+    try:
+        return paginate(query, model, limit, cursor, created_from, created_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/faqs", response_model=FAQPage)
 def list_faqs(
-    skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_admin_user)
 ):
-    """FAQ一覧を取得"""
-    faqs = db.query(FAQ).offset(skip).limit(limit).all()
-    return faqs
+    """FAQ一覧を取得(新しい順。次ページは next_cursor を cursor に指定)"""
+    faqs, next_cursor = _paginate_or_400(db.query(FAQ), FAQ, limit, cursor, created_from, created_to)
+    return FAQPage(items=faqs, next_cursor=next_cursor)
 
 @app.post("/api/admin/faqs", response_model=FAQResponse)
 def create_faq(
@@ -167,11 +366,7 @@ def create_faq(
     db.refresh(db_faq)
 
     # RAGシステムに追加
-    rag_system.add_document(
-        text=f"質問: {faq.question}\n回答: {faq.answer}",
-        metadata={"source": "FAQ", "category": faq.category, "id": db_faq.id},
-        doc_id=f"faq_{db_faq.id}"
-    )
+    index_faq(db_faq)
 
     return db_faq
 
@@ -195,11 +390,7 @@ def update_faq(
     db.refresh(db_faq)
 
     # RAGシステムを更新
-    rag_system.update_document(
-        doc_id=f"faq_{faq_id}",
-        text=f"質問: {db_faq.question}\n回答: {db_faq.answer}",
-        metadata={"source": "FAQ", "category": db_faq.category, "id": db_faq.id}
-    )
+    index_faq(db_faq)
 
     return db_faq
 
@@ -218,25 +409,24 @@ def delete_faq(
     db.commit()
 
     # RAGシステムから削除
-    try:
-        rag_system.delete_document(f"faq_{faq_id}")
-    except:
-        pass
+    remove_faq(faq_id)
 
     return {"message": "FAQを削除しました"}
 
 # ============ Document Management (Admin) ============
 
-@app.get("/api/admin/documents", response_model=List[DocumentResponse])
+@app.get("/api/admin/documents", response_model=DocumentPage)
 def list_documents(
-    skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_admin_user)
 ):
-    """ドキュメント一覧を取得"""
-    documents = db.query(Document).offset(skip).limit(limit).all()
-    return documents
+    """ドキュメント一覧を取得(新しい順。次ページは next_cursor を cursor に指定)"""
+    documents, next_cursor = _paginate_or_400(db.query(Document), Document, limit, cursor, created_from, created_to)
+    return DocumentPage(items=documents, next_cursor=next_cursor)
 
 @app.post("/api/admin/documents", response_model=DocumentResponse)
 def create_document(
@@ -250,12 +440,8 @@ def create_document(
     db.commit()
     db.refresh(db_doc)
 
-    # RAGシステムに追加
-    rag_system.add_document(
-        text=f"タイトル: {document.title}\n内容: {document.content}",
-        metadata={"source": "Document", "category": document.category, "id": db_doc.id},
-        doc_id=f"doc_{db_doc.id}"
-    )
+    # RAGシステムにチャンク単位で追加
+    index_document(db_doc)
 
     return db_doc
 
@@ -278,12 +464,8 @@ def update_document(
     db.commit()
     db.refresh(db_doc)
 
-    # RAGシステムを更新
-    rag_system.update_document(
-        doc_id=f"doc_{doc_id}",
-        text=f"タイトル: {db_doc.title}\n内容: {db_doc.content}",
-        metadata={"source": "Document", "category": db_doc.category, "id": db_doc.id}
-    )
+    # RAGシステムを更新(全チャンクを置き換え)
+    index_document(db_doc)
 
     return db_doc
 
@@ -302,31 +484,126 @@ def delete_document(
     db.commit()
 
     # RAGシステムから削除
-    try:
-        rag_system.delete_document(f"doc_{doc_id}")
-    except:
-        pass
+    remove_document(doc_id)
 
     return {"message": "ドキュメントを削除しました"}
 
+@app.post("/api/admin/documents/upload", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_document(
+    file: UploadFile = File(...),
+    title: Optional[str] = Form(None),
+    category: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    ファイルをアップロードしてドキュメントとして取り込む
+    解析・チャンク化・埋め込みはバックグラウンドで行い、ジョブIDを即座に返す
+    """
+    file_type = detect_file_type(file.filename or "")
+    if file_type is None:
+        raise HTTPException(status_code=400, detail="対応していないファイル形式です(PDF/DOCX/XLSX/HTML/TXT/MD)")
+
+    job_id = str(uuid.uuid4())
+    os.makedirs(settings.upload_directory, exist_ok=True)
+    file_path = os.path.join(settings.upload_directory, job_id + os.path.splitext(file.filename)[1].lower())
+
+    # 1MB ずつディスクに書き出す(上限超過・切断などで中断した場合は書きかけのファイルを消す)
+    max_bytes = settings.max_upload_size_mb * 1024 * 1024
+    written = 0
+    try:
+        async with aiofiles.open(file_path, "wb") as out:
+            while chunk := await file.read(1024 * 1024):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"ファイルサイズは{settings.max_upload_size_mb}MB以下にしてください")
+                await out.write(chunk)
+    except BaseException:
+        remove_upload(file_path)
+        raise
+
+    job = IngestionJob(
+        id=job_id,
+        filename=file.filename,
+        file_path=file_path,
+        file_type=file_type,
+        title=title or os.path.splitext(file.filename)[0],
+        category=category,
+        status="queued",
+        pages_processed=0,
+        chunks_indexed=0
+    )
+    db.add(job)
+    try:
+        await db.commit()
+    except BaseException:
+        remove_upload(file_path)
+        raise
+    await db.refresh(job)
+
+    submit_ingestion_job(job_id)
+
+    return job
+
+@app.get("/api/admin/ingestion-jobs/{job_id}", response_model=IngestionJobResponse)
+def read_ingestion_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """取り込みジョブの進捗を取得"""
+    job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
+
 # ============ Chat History (Admin) ============
 
-@app.get("/api/admin/chat-history", response_model=List[ChatHistoryResponse])
+@app.get("/api/admin/chat-history", response_model=ChatHistoryPage)
 def list_chat_history(
-    skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
     session_id: str = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_admin_user)
 ):
-    """チャット履歴を取得"""
+    """チャット履歴を取得(新しい順。次ページは next_cursor を cursor に指定)"""
     query = db.query(ChatHistory)
 
     if session_id:
         query = query.filter(ChatHistory.session_id == session_id)
 
-    history = query.order_by(ChatHistory.created_at.desc()).offset(skip).limit(limit).all()
-    return history
+    history, next_cursor = _paginate_or_400(query, ChatHistory, limit, cursor, created_from, created_to)
+    return ChatHistoryPage(items=history, next_cursor=next_cursor)
+
+# ============ Monitoring (Admin) ============
+
+@app.get("/api/admin/stats", response_model=StatsResponse)
+def read_stats(
+    days: int = Query(30, ge=1, le=366),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """ダッシュボード用の統計(日別集計から取得するため会話履歴の件数によらず一定時間)"""
+    return get_stats(db, days)
+
+@app.get("/metrics", include_in_schema=False)
+def read_prometheus_metrics(http_request: Request):
+    """
+    Prometheus 形式のメトリクス(段階別の所要時間・トークン数など)
+    METRICS_TOKEN を設定した場合は Authorization: Bearer <token> を要求する
+    """
+    expected = f"Bearer {settings.metrics_token}"
+    if settings.metrics_token and not secrets.compare_digest(http_request.headers.get("authorization", "").encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="認証が必要です")
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/admin/metrics")
+def read_metrics(current_user: User = Depends(get_current_active_admin_user)):
+    """プロセス内メトリクス(キャッシュのヒット率など)を取得"""
+    return metrics.snapshot()
 
 if __name__ == "__main__":
     import uvicorn
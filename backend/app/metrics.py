@@ -0,0 +1,224 @@
+import bisect
+import math
+import re
+import threading
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+class Counter:
+    """単調増加するカウンタ"""
+
+    def __init__(self, name: str, description: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> float:
+        return self._value
+
+class Gauge:
+    """任意に増減する値"""
+
+    def __init__(self, name: str, description: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> float:
+        return self._value
+
+# 秒単位のレイテンシ向けの既定バケット
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """値の分布(バケットごとの件数)"""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        # 末尾は +Inf バケット
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def cumulative_counts(self) -> list:
+        """各バケット上限以下の累積件数(末尾は +Inf)"""
+        with self._lock:
+            counts = list(self._counts)
+        cumulative, total = [], 0
+        for count in counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, q: float) -> float:
+        """バケットから分位点を線形補間で推定"""
+        cumulative = self.cumulative_counts()
+        total = cumulative[-1]
+        if total == 0:
+            return 0.0
+        rank = q * total
+        for i, count in enumerate(cumulative):
+            if count >= rank:
+                if i >= len(self.buckets):
+                    return self.buckets[-1] if self.buckets else 0.0
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                previous = cumulative[i - 1] if i > 0 else 0
+                in_bucket = count - previous
+                fraction = (rank - previous) / in_bucket if in_bucket else 1.0
+                return lower + (self.buckets[i] - lower) * fraction
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self._count,
+            "sum": self._sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+Metric = Union[Counter, Gauge, Histogram]
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_:]")
+
+def _prometheus_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _label_string(labels: Dict[str, str]) -> str:
+    """ラベルを {key="value",...} の形にする(ラベルなしは空文字列)"""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{_INVALID_NAME_CHARS.sub("_", key)}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+def series_name(metric: Metric) -> str:
+    """ラベルを含む系列名(例: rate_limit_rejections_total{scope="ip"})"""
+    return metric.name + _label_string(metric.labels)
+
+def _prometheus_lines(family: list) -> list:
+    """同じ名前の系列(ラベル違い)をまとめて Prometheus のテキスト形式(0.0.4)の行にする"""
+    first = family[0]
+    name = _INVALID_NAME_CHARS.sub("_", first.name)
+    description = first.description.replace("\\", "\\\\").replace("\n", "\\n")
+    lines = [f"# HELP {name} {description}"]
+    if isinstance(first, Histogram):
+        lines.append(f"# TYPE {name} histogram")
+        for metric in family:
+            cumulative = metric.cumulative_counts()
+            for bound, count in zip(metric.buckets + (math.inf,), cumulative):
+                labels = _label_string({**metric.labels, "le": _prometheus_value(bound)})
+                lines.append(f"{name}_bucket{labels} {count}")
+            lines.append(f"{name}_sum{_label_string(metric.labels)} {_prometheus_value(metric.sum)}")
+            lines.append(f"{name}_count{_label_string(metric.labels)} {cumulative[-1]}")
+    else:
+        lines.append(f"# TYPE {name} {'counter' if isinstance(first, Counter) else 'gauge'}")
+        for metric in family:
+            lines.append(f"{name}{_label_string(metric.labels)} {_prometheus_value(metric.value)}")
+    return lines
+
+class MetricsRegistry:
+    """
+    プロセス内メトリクスの登録簿
+    同じ名前でラベルの異なる系列は別のインスタンスとして登録する(種類は名前ごとに揃える)
+    """
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, Tuple], Metric] = {}
+        self._kinds: Dict[str, type] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, description: str, labels: Optional[Dict[str, str]] = None, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            kind = self._kinds.setdefault(name, cls)
+            if kind is not cls:
+                raise ValueError(f"メトリクス '{name}' は別の種類で登録済みです")
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = cls(name, description, labels=labels, **kwargs)
+                self._metrics[key] = metric
+            return metric
+
+    def counter(self, name: str, description: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get_or_create(Counter, name, description, labels)
+
+    def gauge(self, name: str, description: str = "", labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get_or_create(Gauge, name, description, labels)
+
+    def histogram(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS,
+                  labels: Optional[Dict[str, str]] = None) -> Histogram:
+        return self._get_or_create(Histogram, name, description, labels, buckets=buckets)
+
+    def snapshot(self) -> Dict:
+        """全メトリクスの現在値を系列名(ラベル込み)をキーにした辞書で返す"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {series_name(metric): metric.snapshot() for metric in metrics}
+
+    def render_prometheus(self) -> str:
+        """全メトリクスを Prometheus のテキスト形式で返す(/metrics 用)"""
+        with self._lock:
+            metrics = [self._metrics[key] for key in sorted(self._metrics)]
+        families: Dict[str, list] = {}
+        for metric in metrics:
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for family in families.values():
+            lines.extend(_prometheus_lines(family))
+        return "\n".join(lines) + "\n"
+
+# シングルトンインスタンス
+metrics = MetricsRegistry()
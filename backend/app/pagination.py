@@ -0,0 +1,58 @@
+# 一覧APIのキーセット(カーソル)ページネーション
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, List, Optional
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """(created_at, id) を不透明なカーソル文字列にする"""
+    payload = json.dumps({"t": created_at.isoformat(), "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """カーソル文字列を (created_at, id) に戻す(不正な場合は ValueError)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), int(payload["id"])
+    except Exception as e:
+        raise ValueError("不正なカーソルです") from e
+
+def _to_naive_utc(value: datetime) -> datetime:
+    """タイムゾーン付きの日時を、DBに保存している naive な UTC に揃える"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def paginate(
+    query: Query,
+    model: Any,
+    limit: int,
+    cursor: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+) -> tuple[List[Any], Optional[str]]:
+    """
+    created_at の新しい順にキーセットでページを取得
+    OFFSET を使わず (created_at, id) < カーソル で絞り込むため、深いページでも
+    (created_at, id) の複合インデックスを辿るだけで済む
+    Returns: (items, next_cursor)  next_cursor は最終ページで None
+    """
+    if created_from is not None:
+        query = query.filter(model.created_at >= _to_naive_utc(created_from))
+    if created_to is not None:
+        query = query.filter(model.created_at < _to_naive_utc(created_to))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
@@ -0,0 +1,77 @@
+# プロンプトのトークン数見積もりと、予算内に収めるための切り詰め処理
+from typing import Dict, List
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算(トークナイザを呼ばずに済ませるため)
+    日本語などの非ASCII文字は1文字≒1トークン、ASCIIは4文字≒1トークンとみなす
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """テキストを max_tokens 以内に切り詰める(切り詰めた場合は末尾に…を付ける)"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) + 1 <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + "…"
+
+def fit_texts(texts: List[str], budget: int, min_tokens: int = 50) -> List[str]:
+    """
+    優先度順のテキストを予算内で採用
+    収まらない最初のテキストは、残り予算が min_tokens 以上なら切り詰めて採用し、以降は捨てる
+    """
+    selected = []
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if tokens <= budget:
+            selected.append(text)
+            budget -= tokens
+            continue
+        if budget >= min_tokens:
+            selected.append(truncate_to_tokens(text, budget))
+        break
+    return selected
+
+def fit_history(history: List[Dict], budget: int, turn_max_tokens: int) -> List[Dict]:
+    """
+    会話履歴を新しい順に予算内で採用(古い順に並べて返す)
+    1ターンの長い回答が以降のプロンプトを膨らませないよう、各発言は turn_max_tokens で切り詰める
+    """
+    selected = []
+    for turn in reversed(history):
+        user_message = truncate_to_tokens(turn.get("user_message", ""), turn_max_tokens)
+        bot_response = truncate_to_tokens(turn.get("bot_response", ""), turn_max_tokens)
+        tokens = estimate_tokens(user_message) + estimate_tokens(bot_response)
+        if tokens > budget:
+            break
+        selected.append({"user_message": user_message, "bot_response": bot_response})
+        budget -= tokens
+    selected.reverse()
+    return selected
+
+def summarize_turn(turn: Dict, user_chars: int = 60, bot_chars: int = 100) -> str:
+    """1ターンを要約の1行に縮める(LLMを呼ばない抽出的な要約)"""
+    def shorten(text: str, limit: int) -> str:
+        text = " ".join(text.split())
+        return text if len(text) <= limit else text[:limit] + "…"
+
+    return f"・ユーザー: {shorten(turn.get('user_message', ''), user_chars)} / 回答: {shorten(turn.get('bot_response', ''), bot_chars)}"
+
+def append_to_summary(summary: str, turn: Dict, max_tokens: int) -> str:
+    """要約にターンを追記し、予算を超えた分は古い行から捨てる"""
+    lines = [line for line in (summary or "").splitlines() if line]
+    lines.append(summarize_turn(turn))
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
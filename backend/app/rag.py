@@ -1,27 +1,108 @@
-import chromadb
-from chromadb.config import Settings as ChromaSettings
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from typing import List, Dict, Iterator
 from app.config import settings
+from app.embedding_cache import QueryEmbeddingCache
+from app.embedding_service import EmbeddingBatcher
+from app.lexical import NgramIndex, reciprocal_rank_fusion
+from app.timing import stage
+import threading
 import uuid
 
 class RAGSystem:
+    """
+    ベクトル検索による知識ベース
+    Chroma クライアントと埋め込みモデルは初回利用時(または warm_up)に読み込む
+    """
+
     def __init__(self):
-        self.client = chromadb.Client(ChromaSettings(
-            persist_directory=settings.chroma_persist_directory,
-            anonymized_telemetry=False
-        ))
-
-        # 既存のコレクションを取得または新規作成
-        try:
-            self.collection = self.client.get_collection(name="comman_knowledge")
-        except:
-            self.collection = self.client.create_collection(
-                name="comman_knowledge",
-                metadata={"description": "株式会社カンマンの知識ベース"}
-            )
+        self.model_name = settings.embedding_model_id
+        self._client = None
+        self._collection = None
+        self._embedding_model = None
+        self._lexical_index = None
+        self._init_lock = threading.Lock()
+
+        # 同時に届いた埋め込み要求を1回の encode にまとめる
+        self.embedder = EmbeddingBatcher(
+            self._encode_batch,
+            max_batch_size=settings.embedding_max_batch_size,
+            max_wait_ms=settings.embedding_max_wait_ms
+        )
+
+        # よく来る質問の埋め込み計算を省略するためのキャッシュ
+        self.query_cache = QueryEmbeddingCache(
+            max_entries=settings.query_embedding_cache_size,
+            max_bytes=int(settings.query_embedding_cache_max_mb * 1024 * 1024)
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._init_lock:
+                if self._client is None:
+                    import chromadb
+                    from chromadb.config import Settings as ChromaSettings
+
+                    # ディスクに永続化するクライアント(chromadb.Client はインメモリのため再起動で消える)
+                    self._client = chromadb.PersistentClient(
+                        path=settings.chroma_persist_directory,
+                        settings=ChromaSettings(anonymized_telemetry=False)
+                    )
+        return self._client
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            client = self.client
+            with self._init_lock:
+                if self._collection is None:
+                    # 既存のコレクションを取得または新規作成
+                    # 距離の閾値(FAQ fast path など)を扱いやすいようコサイン距離を使う
+                    self._collection = client.get_or_create_collection(
+                        name="comman_knowledge",
+                        metadata={"description": "株式会社カンマンの知識ベース", "hnsw:space": "cosine"}
+                    )
+        return self._collection
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            with self._init_lock:
+                if self._embedding_model is None:
+                    if settings.embedding_backend == "hashing":
+                        from app.hashing_embedder import HashingEmbedder
+                        self._embedding_model = HashingEmbedder(settings.embedding_hashing_dimension)
+                    else:
+                        from sentence_transformers import SentenceTransformer
+                        self._embedding_model = SentenceTransformer(settings.embedding_model_name)
+        return self._embedding_model
 
-        self.embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+    @property
+    def lexical_index(self) -> NgramIndex:
+        """語句一致検索用の n-gram 索引(初回アクセス時にベクトル索引の内容から構築)"""
+        if self._lexical_index is None:
+            collection = self.collection
+            with self._init_lock:
+                if self._lexical_index is None:
+                    index = NgramIndex()
+                    offset = 0
+                    while True:
+                        result = collection.get(include=["documents", "metadatas"], limit=1000, offset=offset)
+                        if not result['ids']:
+                            break
+                        for doc_id, document, metadata in zip(result['ids'], result['documents'], result['metadatas']):
+                            index.add(doc_id, document, metadata)
+                        offset += len(result['ids'])
+                    self._lexical_index = index
+        return self._lexical_index
+
+    def _encode_batch(self, texts: List[str]):
+        return self.embedding_model.encode(texts, batch_size=len(texts))
+
+    def warm_up(self):
+        """コレクションを開き、ダミーの埋め込み計算でモデルのバッファを確保しておく"""
+        self.collection.count()
+        self.lexical_index
+        self.embedder.encode(["ウォームアップ"])
 
     def add_document(self, text: str, metadata: Dict = None, doc_id: str = None):
         """ドキュメントを追加"""
@@ -29,58 +110,208 @@ class RAGSystem:
             doc_id = str(uuid.uuid4())
 
         # テキストを埋め込みに変換
-        embedding = self.embedding_model.encode(text).tolist()
+        with stage("index_embed"):
+            embedding = self.embedder.encode_one(text)
 
-        self.collection.add(
-            documents=[text],
-            embeddings=[embedding],
-            metadatas=[metadata or {}],
-            ids=[doc_id]
-        )
+        with stage("index_write"):
+            self.collection.add(
+                documents=[text],
+                embeddings=[embedding],
+                metadatas=[metadata or {}],
+                ids=[doc_id]
+            )
+            self.lexical_index.add(doc_id, text, metadata)
         return doc_id
 
     def add_documents_batch(self, texts: List[str], metadatas: List[Dict] = None):
         """複数のドキュメントをバッチで追加"""
         doc_ids = [str(uuid.uuid4()) for _ in texts]
-        embeddings = self.embedding_model.encode(texts).tolist()
+        embeddings = self.embedder.encode(texts)
+
+        metadatas = metadatas or [{} for _ in texts]
 
         self.collection.add(
             documents=texts,
             embeddings=embeddings,
-            metadatas=metadatas or [{} for _ in texts],
+            metadatas=metadatas,
             ids=doc_ids
         )
+        for doc_id, text, metadata in zip(doc_ids, texts, metadatas):
+            self.lexical_index.add(doc_id, text, metadata)
         return doc_ids
 
-    def search(self, query: str, n_results: int = 5) -> List[Dict]:
-        """類似ドキュメントを検索"""
-        query_embedding = self.embedding_model.encode(query).tolist()
-
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
+    def upsert_documents(self, doc_ids: List[str], texts: List[str], metadatas: List[Dict]):
+        """複数のドキュメントをIDを指定してまとめて登録/更新"""
+        if not doc_ids:
+            return
+        embeddings = self.embedder.encode(texts)
+        self.collection.upsert(
+            documents=texts,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=doc_ids
         )
+        for doc_id, text, metadata in zip(doc_ids, texts, metadatas):
+            self.lexical_index.add(doc_id, text, metadata)
+
+    def add_document_chunks(self, parent_id: str, chunks: List[str], metadata: Dict = None) -> List[str]:
+        """
+        1つのドキュメントをチャンク単位で登録
+        既存のチャンクは置き換える(新チャンクを upsert した後に余ったチャンクを削除するため、
+        更新中にドキュメントが検索から消えることはない)
+        """
+        chunk_ids = self.upsert_chunks(parent_id, chunks, metadata)
+        self.delete_stale_chunks(parent_id, len(chunks))
+        return chunk_ids
+
+    def upsert_chunks(self, parent_id: str, chunks: List[str], metadata: Dict = None, start_index: int = 0) -> List[str]:
+        """チャンクを start_index 番目から登録(逐次取り込み用)"""
+        chunk_ids = [f"{parent_id}#{start_index + i}" for i in range(len(chunks))]
+        if chunks:
+            with stage("index_embed"):
+                embeddings = self.embedder.encode(chunks)
+            metadatas = [
+                {**(metadata or {}), "parent_id": parent_id, "chunk_index": start_index + i}
+                for i in range(len(chunks))
+            ]
+            with stage("index_write"):
+                self.collection.upsert(
+                    documents=chunks,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    ids=chunk_ids
+                )
+                for chunk_id, chunk, chunk_metadata in zip(chunk_ids, chunks, metadatas):
+                    self.lexical_index.add(chunk_id, chunk, chunk_metadata)
+        return chunk_ids
+
+    def delete_stale_chunks(self, parent_id: str, keep_count: int):
+        """keep_count 番目以降の古いチャンクと、チャンク化以前の単一ベクトルを削除"""
+        keep_ids = {f"{parent_id}#{i}" for i in range(keep_count)}
+        existing_ids = self.collection.get(where={"parent_id": parent_id}, include=[])['ids']
+        stale_ids = [i for i in existing_ids if i not in keep_ids]
+        self.collection.delete(ids=stale_ids + [parent_id])
+        for stale_id in stale_ids + [parent_id]:
+            self.lexical_index.remove(stale_id)
+
+    def update_chunk_metadata(self, parent_id: str, updates: Dict):
+        """ドキュメントの全チャンクのメタデータを更新(再埋め込みはしない)"""
+        result = self.collection.get(where={"parent_id": parent_id}, include=["metadatas"])
+        if result['ids']:
+            self.collection.update(
+                ids=result['ids'],
+                metadatas=[{**(m or {}), **updates} for m in result['metadatas']]
+            )
+
+    def iter_indexed_metadata(self, batch_size: int = 1000) -> Iterator[tuple[str, Dict]]:
+        """登録済みの全ベクトルの (id, metadata) を順に返す"""
+        offset = 0
+        while True:
+            result = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not result['ids']:
+                break
+            for doc_id, metadata in zip(result['ids'], result['metadatas']):
+                yield doc_id, metadata or {}
+            offset += len(result['ids'])
+
+    def delete_document_chunks(self, parent_id: str):
+        """ドキュメントの全チャンクを削除"""
+        self.collection.delete(where={"parent_id": parent_id})
+        self.collection.delete(ids=[parent_id])
+        self.lexical_index.remove_parent(parent_id)
+
+    def embed_query(self, query: str) -> List[float]:
+        """検索クエリを埋め込みに変換(キャッシュがあれば再利用)"""
+        with stage("embed"):
+            embedding = self.query_cache.get(self.model_name, query)
+            if embedding is None:
+                embedding = self.embedder.encode_one(query)
+                self.query_cache.put(self.model_name, query, embedding)
+        return embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """
+        embed_query の非同期版
+        スレッドを占有せずにバッチャの結果を待つため、同時に届いた質問が最大 EMBEDDING_MAX_BATCH_SIZE 件までまとまる
+        """
+        with stage("embed"):
+            embedding = self.query_cache.get(self.model_name, query)
+            if embedding is None:
+                embedding = await self.embedder.aencode_one(query)
+                self.query_cache.put(self.model_name, query, embedding)
+        return embedding
+
+    def search(self, query: str, n_results: int = 5, query_embedding: List[float] = None) -> List[Dict]:
+        """
+        類似ドキュメントを検索
+        ハイブリッド検索が有効な場合は、ベクトル検索と n-gram 索引(BM25)の結果を RRF で統合する
+        """
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+
+        hybrid = settings.hybrid_search_enabled
+        candidates = max(n_results, settings.hybrid_search_candidates) if hybrid else n_results
+
+        with stage("vector_search"):
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=candidates
+            )
 
         # 結果を整形
         search_results = []
         if results['documents'] and len(results['documents']) > 0:
             for i, doc in enumerate(results['documents'][0]):
                 search_results.append({
+                    'id': results['ids'][0][i],
                     'document': doc,
                     'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
                     'distance': results['distances'][0][i] if results['distances'] else None
                 })
 
-        return search_results
+        if not hybrid:
+            return search_results
+
+        with stage("lexical_search"):
+            lexical_hits = self.lexical_index.search(query, candidates)
+
+        # 両方の順位を統合し、語句一致のみでヒットしたものは n-gram 索引から本文を補う
+        by_id = {result['id']: result for result in search_results}
+        fused = reciprocal_rank_fusion(
+            [[result['id'] for result in search_results], [doc_id for doc_id, _ in lexical_hits]],
+            k=settings.rrf_k
+        )
+
+        merged = []
+        for doc_id, _ in fused[:n_results]:
+            result = by_id.get(doc_id)
+            if result is None:
+                entry = self.lexical_index.get(doc_id)
+                if entry is None:
+                    continue
+                result = {'id': doc_id, 'document': entry[0], 'metadata': entry[1], 'distance': None}
+            merged.append(result)
+        return merged
 
     def delete_document(self, doc_id: str):
         """ドキュメントを削除"""
         self.collection.delete(ids=[doc_id])
+        self.lexical_index.remove(doc_id)
 
     def update_document(self, doc_id: str, text: str, metadata: Dict = None):
-        """ドキュメントを更新"""
-        self.delete_document(doc_id)
-        return self.add_document(text, metadata, doc_id)
+        """ドキュメントを更新(存在しなければ追加)"""
+        with stage("index_embed"):
+            embedding = self.embedder.encode_one(text)
+
+        with stage("index_write"):
+            self.collection.upsert(
+                documents=[text],
+                embeddings=[embedding],
+                metadatas=[metadata or {}],
+                ids=[doc_id]
+            )
+            self.lexical_index.add(doc_id, text, metadata)
+        return doc_id
 
 # シングルトンインスタンス
 rag_system = RAGSystem()
@@ -0,0 +1,230 @@
+# /api/chat のレート制限(トークンバケット)と、LLM 呼び出しの同時実行数制御
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.metrics import metrics
+from app.timing import record_stage
+
+class RateLimitExceeded(Exception):
+    """レート制限超過(429)"""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"rate limit exceeded: {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+class LLMOverloadedError(Exception):
+    """LLM 呼び出しの待ち行列が満杯、または待ち時間の上限超過(503)"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("LLM capacity exhausted")
+        self.retry_after = retry_after
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After ヘッダ値(整数秒、最低1秒)"""
+    return str(max(1, math.ceil(seconds)))
+
+class TokenBucketBackend:
+    """トークンバケットの状態の保存先"""
+
+    # True の場合はファイルI/Oを伴うため、イベントループ外で呼ぶ
+    blocking = False
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        """
+        key のバケットからトークンを1つ取り出す
+        rate: 1秒あたりの補充量 / burst: バケットの容量
+        Returns: (許可されたか, 拒否時に次のトークンが貯まるまでの秒数)
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _refill(tokens: float, updated: float, now: float, rate: float, burst: float) -> float:
+        return min(burst, tokens + max(0.0, now - updated) * rate)
+
+class MemoryTokenBucketBackend(TokenBucketBackend):
+    """プロセス内のバケット(ワーカーごとに独立。キー数に上限を設け古いものから捨てる)"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = self._refill(tokens, updated, now, rate, burst)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1.0 - tokens) / rate
+
+class SQLiteTokenBucketBackend(TokenBucketBackend):
+    """
+    SQLite ファイルに保存するバケット
+    同じホストの複数ワーカー(uvicorn --workers)で制限を共有する
+    """
+
+    blocking = True
+
+    # 満タンまで回復したバケットは不要なので、時々まとめて削除する
+    _CLEANUP_INTERVAL_SECONDS = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        # 複数プロセスで共有するため壁時計の時刻を使う
+        now = time.time()
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = self._refill(row[0], row[1], now, rate, burst) if row else burst
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            connection.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now)
+            )
+            if now - self._last_cleanup > self._CLEANUP_INTERVAL_SECONDS:
+                self._last_cleanup = now
+                # 1時間以上触られていないバケットは満タンに戻っているとみなして削除
+                connection.execute("DELETE FROM buckets WHERE updated < ?", (now - 3600,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, 0.0 if allowed else (1.0 - tokens) / rate
+
+def create_rate_limit_backend(name: str, sqlite_path: str) -> TokenBucketBackend:
+    """設定値からバックエンドを生成"""
+    if name == "memory":
+        return MemoryTokenBucketBackend()
+    if name == "sqlite":
+        return SQLiteTokenBucketBackend(sqlite_path)
+    raise ValueError(f"未対応のレート制限バックエンドです: {name}")
+
+class ChatRateLimiter:
+    """クライアントIPごと・セッションごとのトークンバケット"""
+
+    def __init__(self, backend: TokenBucketBackend, ip_per_minute: float, ip_burst: float,
+                 session_per_minute: float, session_burst: float):
+        self.backend = backend
+        self.limits = {
+            "ip": (ip_per_minute / 60.0, ip_burst),
+            "session": (session_per_minute / 60.0, session_burst),
+        }
+        self.rejections = {
+            scope: metrics.counter("rate_limit_rejections_total", "レート制限で拒否したリクエスト数", labels={"scope": scope})
+            for scope in self.limits
+        }
+
+    def check(self, client_ip: str, session_id: Optional[str] = None):
+        """制限を超えていれば RateLimitExceeded を送出(0以下の設定はその制限を無効にする)"""
+        for scope, key in (("ip", client_ip), ("session", session_id)):
+            rate, burst = self.limits[scope]
+            if not key or rate <= 0 or burst <= 0:
+                continue
+            allowed, retry_after = self.backend.take(f"{scope}:{key}", rate, burst)
+            if not allowed:
+                self.rejections[scope].inc()
+                raise RateLimitExceeded(scope, retry_after)
+
+    async def acheck(self, client_ip: str, session_id: Optional[str] = None):
+        """check の非同期版(ファイルを使うバックエンドはイベントループ外で実行)"""
+        if self.backend.blocking:
+            await asyncio.to_thread(self.check, client_ip, session_id)
+        else:
+            self.check(client_ip, session_id)
+
+class LLMAdmission:
+    """
+    LLM 呼び出しの同時実行数の上限と、上限の長さの待ち行列(ワーカーごと)
+    待ち行列が満杯、または待ち時間が上限を超えた場合はすぐに LLMOverloadedError を送出する
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._inflight = 0
+
+        self.inflight = metrics.gauge("llm_inflight_requests", "実行中の LLM 呼び出し数")
+        self.queue_depth = metrics.gauge("llm_admission_queue_depth", "LLM 呼び出しの待ち行列の長さ")
+        self.rejections = metrics.counter("llm_admission_rejections_total", "待ち行列の満杯・タイムアウトで拒否した LLM 呼び出し数")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # イベントループ上で生成する
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def __aenter__(self):
+        if not self.enabled:
+            return self
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self._waiting >= self.max_queue:
+                self.rejections.inc()
+                raise LLMOverloadedError(self.queue_timeout)
+
+        start = time.perf_counter()
+        self._waiting += 1
+        self.queue_depth.set(self._waiting)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejections.inc()
+            raise LLMOverloadedError(self.queue_timeout)
+        finally:
+            self._waiting -= 1
+            self.queue_depth.set(self._waiting)
+
+        record_stage("llm_queue", time.perf_counter() - start)
+        self._inflight += 1
+        self.inflight.set(self._inflight)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        self._get_semaphore().release()
+        self._inflight -= 1
+        self.inflight.set(self._inflight)
+        return False
@@ -0,0 +1,93 @@
+# データベース(faqs / documents)とベクトル索引の差分を照合し、必要な分だけ再登録する処理
+from typing import Dict, Set
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal, FAQ, Document, IngestionJob
+from app.indexing import (
+    faq_vector_id, document_vector_id, faq_text, faq_metadata,
+    faq_content_hash, document_content_hash, index_document
+)
+from app.rag import rag_system
+from app.chatbot import chatbot_service
+
+def _indexed_hashes() -> Dict[str, Set[str]]:
+    """索引済みのドキュメントID(チャンクは親ID) -> 記録されている content_hash の集合"""
+    indexed: Dict[str, Set[str]] = {}
+    for vector_id, metadata in rag_system.iter_indexed_metadata():
+        parent_id = metadata.get("parent_id", vector_id)
+        indexed.setdefault(parent_id, set()).add(metadata.get("content_hash"))
+    return indexed
+
+def reconcile_index(db: Session = None, dry_run: bool = False) -> Dict[str, int]:
+    """
+    各行の content_hash を索引と比較し、新規・変更・欠落した行だけを再埋め込みし、
+    データベースに存在しない索引(孤児)を削除する
+    Returns: {"added", "updated", "deleted", "unchanged"} の件数
+    """
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+
+    stats = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    try:
+        indexed = _indexed_hashes()
+        expected: Set[str] = set()
+
+        # FAQ はまとめて埋め込む
+        pending_ids, pending_texts, pending_metadatas = [], [], []
+
+        def flush_faqs():
+            if pending_ids and not dry_run:
+                rag_system.upsert_documents(pending_ids, pending_texts, pending_metadatas)
+                chatbot_service.response_cache.invalidate(pending_ids)
+            pending_ids.clear()
+            pending_texts.clear()
+            pending_metadatas.clear()
+
+        for faq in db.query(FAQ).yield_per(500):
+            vector_id = faq_vector_id(faq.id)
+            expected.add(vector_id)
+            current = indexed.get(vector_id)
+            if current == {faq_content_hash(faq)}:
+                stats["unchanged"] += 1
+                continue
+            stats["updated" if current else "added"] += 1
+            pending_ids.append(vector_id)
+            pending_texts.append(faq_text(faq))
+            pending_metadatas.append(faq_metadata(faq))
+            if len(pending_ids) >= settings.embedding_batch_size:
+                flush_faqs()
+        flush_faqs()
+
+        # 取り込み中のドキュメントは本文が未確定のため対象外
+        ingesting = {
+            job.document_id
+            for job in db.query(IngestionJob).filter(IngestionJob.status.in_(["queued", "running"]))
+            if job.document_id is not None
+        }
+
+        for document in db.query(Document).yield_per(100):
+            vector_id = document_vector_id(document.id)
+            expected.add(vector_id)
+            if document.id in ingesting:
+                continue
+            current = indexed.get(vector_id)
+            if current == {document_content_hash(document)}:
+                stats["unchanged"] += 1
+                continue
+            stats["updated" if current else "added"] += 1
+            if not dry_run:
+                index_document(document)
+
+        # データベースに存在しない索引を削除
+        for parent_id in set(indexed) - expected:
+            stats["deleted"] += 1
+            if not dry_run:
+                rag_system.delete_document_chunks(parent_id)
+                chatbot_service.response_cache.invalidate([parent_id])
+
+        return stats
+
+    finally:
+        if own_session:
+            db.close()
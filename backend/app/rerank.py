@@ -0,0 +1,124 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional
+from app.lexical import ngrams
+from app.metrics import metrics
+from app.timing import record_stage
+
+class Reranker:
+    """検索候補を質問との関連度で並べ替えるための基底クラス"""
+
+    def score(self, query: str, candidates: List[Dict]) -> List[float]:
+        raise NotImplementedError
+
+    def warm_up(self):
+        pass
+
+class LexicalReranker(Reranker):
+    """
+    軽量な再スコアリング
+    質問の文字 n-gram が候補に含まれる割合と、ベクトル検索の類似度を重み付けして合算する
+    """
+
+    def __init__(self, lexical_weight: float = 0.5):
+        self.lexical_weight = lexical_weight
+
+    def score(self, query: str, candidates: List[Dict]) -> List[float]:
+        query_terms = set(ngrams(query))
+        scores = []
+        for candidate in candidates:
+            coverage = 0.0
+            if query_terms:
+                coverage = len(query_terms & set(ngrams(candidate['document']))) / len(query_terms)
+            distance = candidate.get('distance')
+            similarity = 1.0 - distance if distance is not None else 0.0
+            scores.append(self.lexical_weight * coverage + (1 - self.lexical_weight) * similarity)
+        return scores
+
+class CrossEncoderReranker(Reranker):
+    """クロスエンコーダによる再スコアリング(モデルは初回利用時に読み込む)"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def score(self, query: str, candidates: List[Dict]) -> List[float]:
+        return [float(s) for s in self.model.predict([(query, c['document']) for c in candidates])]
+
+    def warm_up(self):
+        self.model.predict([("ウォームアップ", "ウォームアップ")])
+
+def create_reranker(backend: str, cross_encoder_model: str) -> Optional[Reranker]:
+    """設定値から再ランキング手法を生成("none" の場合は None)"""
+    if backend == "lexical":
+        return LexicalReranker()
+    if backend == "cross-encoder":
+        return CrossEncoderReranker(cross_encoder_model)
+    if backend == "none":
+        return None
+    raise ValueError(f"不明な再ランキング手法です: {backend}")
+
+class RerankStage:
+    """
+    検索と回答生成の間に入る再ランキング段
+    時間予算を超えそうな場合は再ランキングをあきらめ、元の検索順位のまま返す
+    実行中の計算は打ち切れないため、空いているワーカーがなければ投入せずに元の順位を返す
+    """
+
+    def __init__(self, reranker: Optional[Reranker], budget_ms: float, max_workers: int = 2):
+        self.reranker = reranker
+        self.budget = budget_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank") if reranker else None
+        # 投入済み(実行中・時間切れ後も計算中のものを含む)の件数をワーカー数までに抑える
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+        self.applied = metrics.counter("rerank_applied_total", "再ランキングを適用した件数")
+        self.fallbacks = metrics.counter("rerank_fallbacks_total", "時間予算超過・エラーで元の順位を使った件数")
+        self.skipped = metrics.counter("rerank_skipped_busy_total", "ワーカーが空いておらず再ランキングを省略した件数")
+
+    @property
+    def enabled(self) -> bool:
+        return self.reranker is not None
+
+    def rerank(self, query: str, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """候補を再ランキングして上位 top_k 件を返す"""
+        if not self.enabled or len(candidates) <= 1:
+            return candidates[:top_k]
+
+        if not self._slots.acquire(blocking=False):
+            self.skipped.inc()
+            return candidates[:top_k]
+
+        started = time.perf_counter()
+        future = self._executor.submit(self.reranker.score, query, candidates)
+        # 時間切れで結果を捨てた場合も、計算が終わるまで枠を返さない
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            scores = future.result(timeout=self.budget)
+        except FutureTimeoutError:
+            self.fallbacks.inc()
+            return candidates[:top_k]
+        except Exception:
+            self.fallbacks.inc()
+            return candidates[:top_k]
+        finally:
+            record_stage("rerank", time.perf_counter() - started)
+
+        self.applied.inc()
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:top_k]]
+
+    def warm_up(self):
+        if self.enabled:
+            self.reranker.warm_up()
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+import numpy as np
+from app.metrics import metrics
+
+class SemanticResponseCache:
+    """
+    意味的に近い質問への回答キャッシュ
+    埋め込みのコサイン距離が閾値以内、かつ検索で得たドキュメントIDの集合が一致する場合にヒットとする
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, max_distance: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        # ドキュメントID -> そのドキュメントを根拠にしたエントリのキー
+        self._doc_index: Dict[str, Set[int]] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+        self.hits = metrics.counter("response_cache_hits_total", "回答キャッシュのヒット数")
+        self.misses = metrics.counter("response_cache_misses_total", "回答キャッシュのミス数")
+        self.invalidations = metrics.counter("response_cache_invalidations_total", "ナレッジ更新による回答キャッシュの無効化数")
+        self.size = metrics.gauge("response_cache_entries", "回答キャッシュの件数")
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, embedding: Sequence[float], doc_ids: Iterable[str]) -> Optional[tuple[str, List[Dict]]]:
+        """
+        キャッシュ済みの回答を検索
+        Returns: (response_text, context_used) または None
+        """
+        if self.max_entries <= 0:
+            return None
+        query = self._normalize(embedding)
+        doc_set = frozenset(doc_ids)
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_expired(now)
+            best_key, best_distance = None, None
+            for key, entry in self._entries.items():
+                if entry["doc_ids"] != doc_set:
+                    continue
+                distance = 1.0 - float(np.dot(query, entry["embedding"]))
+                if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                    best_key, best_distance = key, distance
+
+            if best_key is None:
+                self.misses.inc()
+                return None
+
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+
+        self.hits.inc()
+        return entry["response_text"], entry["context_used"]
+
+    def store(self, embedding: Sequence[float], doc_ids: Iterable[str], response_text: str, context_used: List[Dict]):
+        """回答を登録"""
+        if self.max_entries <= 0:
+            return
+        doc_set = frozenset(doc_ids)
+
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = {
+                "embedding": self._normalize(embedding),
+                "doc_ids": doc_set,
+                "response_text": response_text,
+                "context_used": context_used,
+                "expires_at": time.monotonic() + self.ttl_seconds
+            }
+            for doc_id in doc_set:
+                self._doc_index.setdefault(doc_id, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self.size.set(len(self._entries))
+
+    def invalidate(self, doc_ids: Iterable[str]) -> int:
+        """指定ドキュメントを根拠にした回答をすべて無効化"""
+        removed = 0
+        with self._lock:
+            for doc_id in doc_ids:
+                for key in list(self._doc_index.get(doc_id, ())):
+                    self._remove(key)
+                    removed += 1
+            self.size.set(len(self._entries))
+        if removed:
+            self.invalidations.inc(removed)
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._doc_index.clear()
+            self.size.set(0)
+
+    def _evict_expired(self, now: float):
+        expired = [key for key, entry in self._entries.items() if entry["expires_at"] <= now]
+        for key in expired:
+            self._remove(key)
+        if expired:
+            self.size.set(len(self._entries))
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for doc_id in entry["doc_ids"]:
+            keys = self._doc_index.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._doc_index[doc_id]
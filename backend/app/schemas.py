@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Dict
-from datetime import datetime
+from datetime import date, datetime
 
 # Chat schemas
 class ChatRequest(BaseModel):
@@ -38,6 +38,10 @@ class FAQResponse(FAQBase):
     class Config:
         from_attributes = True
 
+class FAQPage(BaseModel):
+    items: List[FAQResponse]
+    next_cursor: Optional[str] = None
+
 # Document schemas
 class DocumentBase(BaseModel):
     title: str
@@ -64,6 +68,29 @@ class DocumentResponse(DocumentBase):
     class Config:
         from_attributes = True
 
+class DocumentPage(BaseModel):
+    items: List[DocumentResponse]
+    next_cursor: Optional[str] = None
+
+# Ingestion schemas
+class IngestionJobResponse(BaseModel):
+    id: str
+    filename: str
+    file_type: str
+    title: str
+    category: Optional[str] = None
+    status: str
+    total_pages: Optional[int] = None
+    pages_processed: int = 0
+    chunks_indexed: int = 0
+    document_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
 # User schemas
 class UserBase(BaseModel):
     username: str
@@ -100,3 +127,27 @@ class ChatHistoryResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class ChatHistoryPage(BaseModel):
+    items: List[ChatHistoryResponse]
+    next_cursor: Optional[str] = None
+
+# Stats schemas
+class DailyStats(BaseModel):
+    date: date
+    chats: int
+    sessions: int
+    faq_answers: int
+    llm_answers: int
+    avg_latency_ms: Optional[float] = None
+
+class StatsResponse(BaseModel):
+    total_chats: int
+    today_chats: int
+    total_sessions: int
+    faq_count: int
+    document_count: int
+    faq_answers: int
+    llm_answers: int
+    avg_latency_ms: Optional[float] = None
+    daily: List[DailyStats]
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+from app.metrics import metrics
+
+class SessionHistoryCache:
+    """
+    セッションごとの直近の会話履歴(リングバッファ)と要約のキャッシュ
+    件数・メモリ量・TTLで上限を設け、古いセッションから追い出す
+    複数ワーカー構成では他ワーカーの書き込みは反映されないため、TTLで古さを抑える
+    """
+
+    def __init__(self, max_turns: int, max_sessions: int, ttl_seconds: float, max_bytes: int):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = metrics.counter("session_history_cache_hits_total", "会話履歴キャッシュのヒット数")
+        self.misses = metrics.counter("session_history_cache_misses_total", "会話履歴キャッシュのミス数")
+        self.evictions = metrics.counter("session_history_cache_evictions_total", "会話履歴キャッシュの追い出し数")
+        self.size = metrics.gauge("session_history_cache_sessions", "会話履歴キャッシュのセッション数")
+        self.size_bytes = metrics.gauge("session_history_cache_bytes", "会話履歴キャッシュの使用メモリ(バイト)")
+
+    @staticmethod
+    def _turn_bytes(turn: Dict) -> int:
+        return len(turn["user_message"].encode()) + len(turn["bot_response"].encode())
+
+    def _entry_bytes(self, entry: Dict) -> int:
+        return sum(self._turn_bytes(turn) for turn in entry["turns"]) + len((entry["summary"] or "").encode())
+
+    def get(self, session_id: str) -> Optional[tuple[List[Dict], Optional[str]]]:
+        """
+        キャッシュ済みの履歴を取得
+        Returns: (history_list, summary) または None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry["expires_at"] <= now:
+                if entry is not None:
+                    self._remove(session_id)
+                    self._update_gauges()
+                self.misses.inc()
+                return None
+            self._entries.move_to_end(session_id)
+            history_list = [dict(turn) for turn in entry["turns"]]
+            summary = entry["summary"]
+        self.hits.inc()
+        return history_list, summary
+
+    def put(self, session_id: str, history_list: List[Dict], summary: Optional[str]):
+        """データベースから読み込んだ履歴を登録"""
+        if self.max_sessions <= 0:
+            return
+        turns = deque(
+            ({"user_message": turn["user_message"], "bot_response": turn["bot_response"]} for turn in history_list),
+            maxlen=self.max_turns
+        )
+        with self._lock:
+            self._remove(session_id)
+            self._insert(session_id, turns, summary)
+
+    def append(self, session_id: str, turn: Dict, summary: Optional[str]):
+        """
+        書き込んだターンを追加(キャッシュにないセッションは次回の読み込みに任せる)
+        リングバッファから押し出されたターンは要約側に畳み込まれている前提
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None:
+                return
+            self._bytes -= entry["bytes"]
+            entry["turns"].append({"user_message": turn["user_message"], "bot_response": turn["bot_response"]})
+            self._insert(session_id, entry["turns"], summary)
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._remove(session_id)
+            self._update_gauges()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._update_gauges()
+
+    def _insert(self, session_id: str, turns: deque, summary: Optional[str]):
+        entry = {"turns": turns, "summary": summary, "expires_at": time.monotonic() + self.ttl_seconds}
+        entry["bytes"] = self._entry_bytes(entry)
+        self._entries[session_id] = entry
+        self._bytes += entry["bytes"]
+
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions.inc()
+        self._update_gauges()
+
+    def _remove(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry["bytes"]
+
+    def _update_gauges(self):
+        self.size.set(len(self._entries))
+        self.size_bytes.set(self._bytes)
@@ -0,0 +1,140 @@
+# 管理画面の統計(日別集計の加算・初回のバックフィル・集計の読み出し)
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, ChatDailyStats, ChatHistory, FAQ, Document
+
+logger = logging.getLogger(__name__)
+
+ANSWER_SOURCE_FAQ = "faq"
+ANSWER_SOURCE_LLM = "llm"
+ANSWER_SOURCE_FALLBACK = "fallback"
+ANSWER_SOURCE_CACHE = "cache"
+
+_COUNTER_COLUMNS = ("chats", "sessions", "faq_answers", "llm_answers", "latency_ms_total", "latency_samples")
+
+def answer_source(context_used: List[Dict]) -> str:
+    """回答の種別(FAQ即答・代替回答・回答キャッシュは context_used の先頭に fast_path / fallback / cached が付く)"""
+    if context_used and context_used[0].get("fast_path"):
+        return ANSWER_SOURCE_FAQ
+    if context_used and context_used[0].get("fallback"):
+        return ANSWER_SOURCE_FALLBACK
+    if context_used and context_used[0].get("cached"):
+        return ANSWER_SOURCE_CACHE
+    return ANSWER_SOURCE_LLM
+
+def stats_date(created_at: datetime) -> date:
+    """UTC で保存した日時を集計日(STATS_UTC_OFFSET_HOURS の時差で区切る)に変換"""
+    return (created_at + timedelta(hours=settings.stats_utc_offset_hours)).date()
+
+def _empty_counts() -> Dict[str, float]:
+    return {column: 0 for column in _COUNTER_COLUMNS}
+
+def aggregate_chat_records(records: Iterable[Dict]) -> Dict[date, Dict[str, float]]:
+    """保存する会話履歴を日別の加算量にまとめる"""
+    deltas: Dict[date, Dict[str, float]] = defaultdict(_empty_counts)
+    for record in records:
+        counts = deltas[stats_date(record["created_at"])]
+        counts["chats"] += 1
+        if record.get("new_session"):
+            counts["sessions"] += 1
+        if record.get("answer_source") == ANSWER_SOURCE_FAQ:
+            counts["faq_answers"] += 1
+        elif record.get("answer_source") == ANSWER_SOURCE_LLM:
+            counts["llm_answers"] += 1
+        if record.get("latency_ms") is not None:
+            counts["latency_ms_total"] += record["latency_ms"]
+            counts["latency_samples"] += 1
+    return deltas
+
+async def apply_chat_stats(db: AsyncSession, deltas: Dict[date, Dict[str, float]]):
+    """
+    日別集計に加算(呼び出し側のトランザクション内で実行)
+    複数ワーカーからの同時加算で値を失わないよう、読み出さずに SQL 側で加算する
+    """
+    for day, counts in deltas.items():
+        result = await db.execute(
+            update(ChatDailyStats)
+            .where(ChatDailyStats.date == day)
+            .values({column: getattr(ChatDailyStats, column) + counts[column] for column in _COUNTER_COLUMNS})
+        )
+        if result.rowcount == 0:
+            # 同時に別ワーカーが同じ日の行を作った場合は主キー違反となり、バッチごと再試行される
+            await db.execute(insert(ChatDailyStats).values(date=day, **counts))
+
+def backfill_chat_stats():
+    """
+    集計テーブルが空で会話履歴がある場合(集計導入前のデータ)に一度だけ集計を作る
+    回答の種別と応答時間は記録がないため、会話数とセッション数のみ
+    """
+    db = SessionLocal()
+    try:
+        if db.query(ChatDailyStats).first() is not None or db.query(ChatHistory.id).first() is None:
+            return
+
+        deltas: Dict[date, Dict[str, float]] = defaultdict(_empty_counts)
+        for (created_at,) in db.execute(select(ChatHistory.created_at).execution_options(yield_per=10000)):
+            deltas[stats_date(created_at)]["chats"] += 1
+        first_turns = select(func.min(ChatHistory.created_at)).group_by(ChatHistory.session_id)
+        for (created_at,) in db.execute(first_turns.execution_options(yield_per=10000)):
+            deltas[stats_date(created_at)]["sessions"] += 1
+
+        db.add_all(ChatDailyStats(date=day, **counts) for day, counts in deltas.items())
+        db.commit()
+        logger.info("Backfilled chat stats for %d days", len(deltas))
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to backfill chat stats")
+    finally:
+        db.close()
+
+def _average_latency(latency_ms_total: float, latency_samples: int):
+    return round(latency_ms_total / latency_samples, 1) if latency_samples else None
+
+def get_stats(db: Session, days: int) -> Dict:
+    """
+    統計を集計テーブルから取得
+    会話履歴の件数によらず、日数分の行と FAQ/ドキュメント件数の読み出しだけで済む
+    """
+    today = stats_date(datetime.utcnow())
+
+    totals = db.query(*(func.coalesce(func.sum(getattr(ChatDailyStats, column)), 0) for column in _COUNTER_COLUMNS)).one()
+    totals = dict(zip(_COUNTER_COLUMNS, totals))
+
+    since = today - timedelta(days=days - 1)
+    rows = {
+        row.date: row
+        for row in db.query(ChatDailyStats).filter(ChatDailyStats.date >= since).all()
+    }
+
+    daily = []
+    for offset in range(days):
+        day = since + timedelta(days=offset)
+        row = rows.get(day)
+        daily.append({
+            "date": day,
+            "chats": row.chats if row else 0,
+            "sessions": row.sessions if row else 0,
+            "faq_answers": row.faq_answers if row else 0,
+            "llm_answers": row.llm_answers if row else 0,
+            "avg_latency_ms": _average_latency(row.latency_ms_total, row.latency_samples) if row else None,
+        })
+
+    return {
+        "total_chats": int(totals["chats"]),
+        "today_chats": daily[-1]["chats"],
+        "total_sessions": int(totals["sessions"]),
+        "faq_count": db.query(func.count(FAQ.id)).scalar(),
+        "document_count": db.query(func.count(Document.id)).scalar(),
+        "faq_answers": int(totals["faq_answers"]),
+        "llm_answers": int(totals["llm_answers"]),
+        "avg_latency_ms": _average_latency(totals["latency_ms_total"], int(totals["latency_samples"])),
+        "daily": daily,
+    }
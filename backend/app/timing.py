@@ -0,0 +1,72 @@
+# リクエスト内の処理段階ごとの所要時間(段階別ヒストグラムと Server-Timing ヘッダ)
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from app.metrics import Histogram, metrics
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class RequestTimings:
+    """1リクエスト分の段階ごとの所要時間(同じ段階を複数回通った場合は合算)"""
+
+    def __init__(self):
+        self._durations: Dict[str, float] = {}
+        self._descriptions: Dict[str, str] = {}
+        # 検索はエグゼキュータのスレッドで計測されるため
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self._durations[name] = self._durations.get(name, 0.0) + seconds
+
+    def describe(self, name: str, description: str):
+        """段階に補足を付ける(Server-Timing の desc。トークン数など)"""
+        with self._lock:
+            self._descriptions[name] = description
+
+    def server_timing(self) -> str:
+        """Server-Timing ヘッダ値(計測した順)"""
+        with self._lock:
+            entries = []
+            for name, seconds in self._durations.items():
+                entry = f"{name};dur={seconds * 1000:.1f}"
+                description = self._descriptions.get(name)
+                if description:
+                    entry += f';desc="{description}"'
+                entries.append(entry)
+            return ", ".join(entries)
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+def begin_request() -> RequestTimings:
+    """このリクエスト(コンテキスト)の計測を開始"""
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+def stage_histogram(name: str) -> Histogram:
+    return metrics.histogram("stage_seconds", "処理段階ごとの所要時間(秒)", buckets=STAGE_BUCKETS, labels={"stage": name})
+
+def record_stage(name: str, seconds: float):
+    """計測済みの所要時間を記録"""
+    stage_histogram(name).observe(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """with ブロックの所要時間を段階 name として記録(例外で抜けた場合も記録する)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def describe_stage(name: str, description: str):
+    timings = _current.get()
+    if timings is not None:
+        timings.describe(name, description)
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from app.database import User
+from app.metrics import metrics
+
+# キャッシュに保持するユーザーの列(リクエストのセッションに紐づかない値だけを持つ)
+_USER_COLUMNS = ("id", "username", "email", "hashed_password", "is_active", "is_admin", "created_at")
+
+class UserCache:
+    """
+    トークンの subject(ユーザー名)から解決したユーザーの短時間キャッシュ
+    セッションから切り離した値を保持し、ヒットのたびに新しい User インスタンスを作って返す
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = metrics.counter("auth_user_cache_hits_total", "認証ユーザーキャッシュのヒット数")
+        self.misses = metrics.counter("auth_user_cache_misses_total", "認証ユーザーキャッシュのミス数")
+        self.invalidations = metrics.counter("auth_user_cache_invalidations_total", "ユーザー更新による認証ユーザーキャッシュの無効化数")
+
+    def get(self, username: str) -> Optional[User]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry["expires_at"] <= now:
+                if entry is not None:
+                    del self._entries[username]
+                self.misses.inc()
+                return None
+            self._entries.move_to_end(username)
+            values = entry["values"]
+        self.hits.inc()
+        return User(**values)
+
+    def put(self, user: User):
+        if self.max_entries <= 0:
+            return
+        values = {column: getattr(user, column) for column in _USER_COLUMNS}
+        with self._lock:
+            self._entries[user.username] = {"values": values, "expires_at": time.monotonic() + self.ttl_seconds}
+            self._entries.move_to_end(user.username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            removed = self._entries.pop(username, None)
+        if removed is not None:
+            self.invalidations.inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
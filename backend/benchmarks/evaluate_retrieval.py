@@ -0,0 +1,376 @@
+"""
+検索品質(recall@k・MRR)と速度・メモリの評価
+質問と正解の FAQ/ドキュメントID の組(評価セット)を RAGSystem.search に流し、
+設定(埋め込みモデル・チャンクサイズ・ハイブリッド検索など)ごとに比較する
+
+設定ごとに別プロセスで一時ディレクトリに索引を作り直すため、本番の索引には触れず、
+メモリ使用量も設定ごとに独立して計測できる(GPU は使わない)
+
+使い方(backend ディレクトリで実行。データベースの FAQ・ドキュメントを索引に使う):
+    # 評価セットの作成(FAQ の質問文と、その機械的な言い換え。手書きの言い換えを追加できる)
+    python benchmarks/evaluate_retrieval.py seed --output retrieval_set.jsonl
+    python benchmarks/evaluate_retrieval.py seed --output retrieval_set.jsonl --extra paraphrases.jsonl
+
+    # 評価(--config は「名前:環境変数=値,...」。.env の設定を上書きする)
+    python benchmarks/evaluate_retrieval.py run --dataset retrieval_set.jsonl \\
+        --config current \\
+        --config "no_hybrid:HYBRID_SEARCH_ENABLED=false" \\
+        --config "chunk300:CHUNK_SIZE=300,CHUNK_OVERLAP=60" \\
+        --top-k 1,3,5 --output retrieval_eval.json
+
+    # 設定変更の判定(いずれかの設定が下回ったら終了コード1)
+    python benchmarks/evaluate_retrieval.py run --dataset retrieval_set.jsonl --min-recall 3:0.9 --min-mrr 0.7
+
+評価セットは1行1件の JSON:
+    {"question": "料金を教えてください", "expected": ["faq_12"], "kind": "verbatim"}
+expected はベクトル索引のID(faq_<id> / doc_<id>)。ドキュメントのチャンクは親のIDで判定する
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# 質問を1件ずつ流すため、バッチ待ちとクエリ埋め込みキャッシュは無効にして検索そのものを計測する
+DEFAULT_OVERRIDES = {
+    "QUERY_EMBEDDING_CACHE_SIZE": "0",
+    "EMBEDDING_MAX_WAIT_MS": "0",
+    "RECONCILE_INDEX_ON_STARTUP": "false",
+}
+
+# ============ Dataset ============
+
+# (パターン, 置換) の組。FAQ の質問文から機械的な言い換えを作る
+_PARAPHRASE_RULES = [
+    (r"を教えてください$", "について知りたいです"),
+    (r"を教えてください$", "は?"),
+    (r"について教えてください$", "が知りたい"),
+    (r"ですか$", "でしょうか"),
+    (r"できますか$", "は可能ですか"),
+    (r"(ください|ですか|でしょうか)$", ""),
+]
+_TRAILING_PUNCTUATION = re.compile(r"[??。.!!\s]+$")
+
+def paraphrases(question: str) -> List[str]:
+    """質問文の言い換え(語尾の言い回しを変えたもの・語尾を落としたもの)"""
+    base = _TRAILING_PUNCTUATION.sub("", question)
+    variants = []
+    for pattern, replacement in _PARAPHRASE_RULES:
+        variant = re.sub(pattern, replacement, base).strip()
+        if variant and variant != base and variant not in variants:
+            variants.append(variant)
+    return variants
+
+def seed_dataset(output: str, extra: Optional[str], max_paraphrases: int):
+    """データベースの有効な FAQ から評価セットを作成"""
+    from app.database import SessionLocal, FAQ
+    from app.indexing import faq_vector_id
+
+    cases = []
+    db = SessionLocal()
+    try:
+        for faq in db.query(FAQ).filter(FAQ.is_active == True).order_by(FAQ.id).yield_per(500):  # noqa: E712
+            expected = [faq_vector_id(faq.id)]
+            cases.append({"question": faq.question, "expected": expected, "kind": "verbatim"})
+            for variant in paraphrases(faq.question)[:max_paraphrases]:
+                cases.append({"question": variant, "expected": expected, "kind": "paraphrase"})
+    finally:
+        db.close()
+
+    if extra:
+        for case in load_dataset(extra):
+            case.setdefault("kind", "manual")
+            cases.append(case)
+
+    with open(output, "w", encoding="utf-8") as f:
+        for case in cases:
+            f.write(json.dumps(case, ensure_ascii=False) + "\n")
+    kinds: Dict[str, int] = {}
+    for case in cases:
+        kinds[case["kind"]] = kinds.get(case["kind"], 0) + 1
+    print(f"{len(cases)} 件の評価セットを {output} に保存しました ({', '.join(f'{k}: {v}' for k, v in kinds.items())})")
+
+def load_dataset(path: str) -> List[Dict]:
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if not case.get("question") or not case.get("expected"):
+                raise ValueError(f"{path}:{line_number}: question と expected が必要です")
+            cases.append(case)
+    return cases
+
+# ============ Metrics ============
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """線形補間による百分位数(sorted_values は昇順)"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * p / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def score_case(result_parents: List[str], expected: List[str], top_ks: List[int]) -> Dict:
+    """
+    1件分の recall@k と逆順位
+    result_parents: 検索結果の順に並べた親ID(チャンクは親ドキュメントのID)。k は本番の n_results と同じく結果の件数で数える
+    """
+    expected_set = set(expected)
+    scores = {}
+    for k in top_ks:
+        found = expected_set.intersection(result_parents[:k])
+        scores[f"recall@{k}"] = len(found) / len(expected_set)
+    rank = next((i for i, parent in enumerate(result_parents, 1) if parent in expected_set), None)
+    scores["reciprocal_rank"] = 1.0 / rank if rank else 0.0
+    return scores
+
+def aggregate_scores(case_scores: List[Dict], top_ks: List[int]) -> Dict:
+    if not case_scores:
+        return {}
+    summary = {
+        f"recall@{k}": round(sum(s[f"recall@{k}"] for s in case_scores) / len(case_scores), 4)
+        for k in top_ks
+    }
+    summary["mrr"] = round(sum(s["reciprocal_rank"] for s in case_scores) / len(case_scores), 4)
+    summary["count"] = len(case_scores)
+    return summary
+
+def _rss_mb() -> float:
+    """現在の常駐メモリ(MB)。/proc がない環境ではピーク値で代用"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_mb()
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# ============ Evaluation (1設定・子プロセス) ============
+
+def evaluate_current_settings(dataset: List[Dict], top_ks: List[int], trace_memory: bool) -> Dict:
+    """現在の設定(環境変数)で索引を作り、評価セットを流す"""
+    import tracemalloc
+    from app.config import settings
+    from app.database import init_db
+    from app.rag import rag_system
+    from app.reconcile import reconcile_index
+
+    rss_start = _rss_mb()
+    started = time.perf_counter()
+    rag_system.warm_up()
+    load_seconds = time.perf_counter() - started
+
+    init_db()
+    started = time.perf_counter()
+    index_stats = reconcile_index()
+    index_seconds = time.perf_counter() - started
+    rss_indexed = _rss_mb()
+
+    n_results = max(top_ks)
+    latencies, allocations, case_scores, by_kind = [], [], [], {}
+    for case in dataset:
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        results = rag_system.search(case["question"], n_results=n_results)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if trace_memory:
+            allocations.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+
+        parents = [(result.get("metadata") or {}).get("parent_id", result["id"]) for result in results]
+        scores = score_case(parents, case["expected"], top_ks)
+        case_scores.append(scores)
+        by_kind.setdefault(case.get("kind", "unknown"), []).append(scores)
+
+    latencies.sort()
+    memory = {
+        "rss_start_mb": round(rss_start, 1),
+        "rss_after_index_mb": round(rss_indexed, 1),
+        "rss_end_mb": round(_rss_mb(), 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+    if allocations:
+        allocations.sort()
+        memory["query_alloc_peak_kb_p50"] = round(percentile(allocations, 50), 1)
+        memory["query_alloc_peak_kb_max"] = round(allocations[-1], 1)
+
+    return {
+        "settings": {
+            "embedding_model": settings.embedding_model_id,
+            "chunk_size": settings.chunk_size,
+            "chunk_overlap": settings.chunk_overlap,
+            "hybrid_search_enabled": settings.hybrid_search_enabled,
+            "hybrid_search_candidates": settings.hybrid_search_candidates,
+            "rrf_k": settings.rrf_k,
+        },
+        "index": {
+            "vectors": rag_system.collection.count(),
+            "load_seconds": round(load_seconds, 3),
+            "index_seconds": round(index_seconds, 3),
+            "added": index_stats["added"],
+        },
+        "quality": aggregate_scores(case_scores, top_ks),
+        "quality_by_kind": {kind: aggregate_scores(scores, top_ks) for kind, scores in sorted(by_kind.items())},
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+        "memory": memory,
+    }
+
+# ============ Runner ============
+
+def parse_config(spec: str) -> tuple:
+    """「名前:環境変数=値,...」を (名前, {環境変数: 値}) にする"""
+    name, _, assignments = spec.partition(":")
+    overrides = {}
+    for assignment in filter(None, (part.strip() for part in assignments.split(","))):
+        key, separator, value = assignment.partition("=")
+        if not separator:
+            raise ValueError(f"設定の指定が不正です: {assignment}(環境変数=値 の形式で指定)")
+        overrides[key.strip().upper()] = value.strip()
+    return name.strip() or "current", overrides
+
+def run_config(name: str, overrides: Dict[str, str], args) -> Dict:
+    """1つの設定を別プロセスで評価"""
+    workdir = tempfile.mkdtemp(prefix="comman-retrieval-eval-")
+    result_path = os.path.join(workdir, "result.json")
+    env = dict(os.environ)
+    # 索引の作成に Claude API は使わないが、設定の読み込みに必要
+    env.setdefault("ANTHROPIC_API_KEY", "unused")
+    env.update(DEFAULT_OVERRIDES)
+    env.update(overrides)
+    env["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, "chroma_db")
+    try:
+        command = [
+            sys.executable, os.path.abspath(__file__), "_evaluate",
+            "--dataset", os.path.abspath(args.dataset), "--top-k", args.top_k, "--result-file", result_path,
+        ]
+        if args.trace_memory:
+            command.append("--trace-memory")
+        subprocess.run(command, cwd=BACKEND_DIR, env=env, check=True)
+        with open(result_path, encoding="utf-8") as f:
+            result = json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"name": name, "overrides": overrides, **result}
+
+def check_gates(results: List[Dict], min_recall: List[str], min_mrr: Optional[float]) -> List[str]:
+    failures = []
+    for result in results:
+        quality = result["quality"]
+        for gate in min_recall:
+            k, _, threshold = gate.partition(":")
+            key = f"recall@{k}"
+            if key not in quality:
+                failures.append(f"{result['name']}: {key} は計測していません(--top-k に {k} を含めてください)")
+            elif quality[key] < float(threshold):
+                failures.append(f"{result['name']}: {key} = {quality[key]:.3f} < {float(threshold):.3f}")
+        if min_mrr is not None and quality["mrr"] < min_mrr:
+            failures.append(f"{result['name']}: MRR = {quality['mrr']:.3f} < {min_mrr:.3f}")
+    return failures
+
+def print_table(results: List[Dict], top_ks: List[int]):
+    recall_columns = "".join(f"{f'R@{k}':>8}" for k in top_ks)
+    print(f"{'config':<20}{recall_columns}{'MRR':>8}{'p50':>10}{'p95':>10}{'RSS':>10}{'index':>9}")
+    for result in results:
+        quality, latency = result["quality"], result["latency_ms"]
+        recalls = "".join(f"{quality[f'recall@{k}']:>8.3f}" for k in top_ks)
+        print(
+            f"{result['name']:<20}{recalls}{quality['mrr']:>8.3f}"
+            f"{latency['p50']:>8.1f}ms{latency['p95']:>8.1f}ms"
+            f"{result['memory']['peak_rss_mb']:>8.0f}MB{result['index']['index_seconds']:>8.1f}s"
+        )
+
+def _parse_top_ks(value: str) -> List[int]:
+    return sorted({int(k) for k in value.split(",") if k.strip()})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="検索品質と速度・メモリの評価")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="FAQ から評価セットを作成")
+    seed_parser.add_argument("--output", required=True)
+    seed_parser.add_argument("--extra", help="追加する評価セット(手書きの言い換えなど。同じ JSONL 形式)")
+    seed_parser.add_argument("--max-paraphrases", type=int, default=2, help="FAQ 1件あたりの機械的な言い換えの数")
+
+    run_parser = subparsers.add_parser("run", help="設定ごとに評価")
+    run_parser.add_argument("--dataset", required=True)
+    run_parser.add_argument("--config", action="append", default=[], help="名前:環境変数=値,...(複数指定可。未指定時は現在の設定のみ)")
+    run_parser.add_argument("--top-k", default="1,3,5", help="recall を計測する k(カンマ区切り)")
+    run_parser.add_argument("--trace-memory", action="store_true", help="質問ごとの Python のメモリ確保量も計測(遅くなる)")
+    run_parser.add_argument("--output", help="結果の JSON の出力先")
+    run_parser.add_argument("--min-recall", action="append", default=[], help="k:下限(例 3:0.9。複数指定可)")
+    run_parser.add_argument("--min-mrr", type=float)
+
+    # 設定ごとの子プロセス用
+    evaluate_parser = subparsers.add_parser("_evaluate")
+    evaluate_parser.add_argument("--dataset", required=True)
+    evaluate_parser.add_argument("--top-k", required=True)
+    evaluate_parser.add_argument("--result-file", required=True)
+    evaluate_parser.add_argument("--trace-memory", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        seed_dataset(args.output, args.extra, args.max_paraphrases)
+        sys.exit(0)
+
+    if args.command == "_evaluate":
+        result = evaluate_current_settings(load_dataset(args.dataset), _parse_top_ks(args.top_k), args.trace_memory)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        sys.exit(0)
+
+    top_ks = _parse_top_ks(args.top_k)
+    dataset_size = len(load_dataset(args.dataset))
+    configs = [parse_config(spec) for spec in (args.config or ["current"])]
+
+    results = []
+    for name, overrides in configs:
+        print(f"評価中: {name} {overrides or ''}", flush=True)
+        try:
+            results.append(run_config(name, overrides, args))
+        except subprocess.CalledProcessError:
+            print(f"エラー: 設定 {name} の評価に失敗しました")
+            sys.exit(1)
+
+    print(f"評価セット: {args.dataset} ({dataset_size} 件)")
+    print_table(results, top_ks)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "dataset": {"path": args.dataset, "size": dataset_size},
+                "top_k": top_ks,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果を {args.output} に保存しました")
+
+    failures = check_gates(results, args.min_recall, args.min_mrr)
+    if failures:
+        print("❌ 基準を下回りました:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    if args.min_recall or args.min_mrr is not None:
+        print("✓ 基準を満たしています")
@@ -0,0 +1,123 @@
+"""
+ベンチマーク用の Anthropic Messages API の代替サーバー
+POST /v1/messages に、指定した遅延で決まった文面を返す(stream=true の場合は SSE で1トークンずつ送る)
+
+使い方:
+    python benchmarks/fake_anthropic.py --port 8090 --ttft-ms 400 --token-ms 20 --output-tokens 80
+    # アプリ側は ANTHROPIC_BASE_URL=http://127.0.0.1:8090 で接続する
+"""
+import argparse
+import asyncio
+import json
+import random
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 応答の文面(トークン1つ=この語の1つとして送る)
+ANSWER_WORDS = ["お問い合わせ", "ありがとう", "ございます。", "カンマンの", "サービスに", "ついて", "ご案内", "いたします。"]
+
+class FakeAnthropicConfig:
+    def __init__(self, ttft_ms: float, token_ms: float, output_tokens: int, jitter_ms: float, error_rate: float, seed: int):
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.output_tokens = output_tokens
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    def first_token_delay(self) -> float:
+        return max(0.0, self.ttft_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+
+def _estimate_input_tokens(body: dict) -> int:
+    """入力トークン数の概算(日本語1文字≒1トークン、英数字は4文字≒1トークン)"""
+    texts = [body.get("system") or ""]
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(block.get("text", "") for block in content if isinstance(block, dict))
+    ascii_chars = sum(1 for text in texts for char in text if ord(char) < 128)
+    other_chars = sum(len(text) for text in texts) - ascii_chars
+    return other_chars + ascii_chars // 4
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def create_app(config: FakeAnthropicConfig) -> FastAPI:
+    app = FastAPI(title="Fake Anthropic API")
+
+    @app.post("/v1/messages")
+    async def create_message(request: Request):
+        body = await request.json()
+        model = body.get("model", "claude-fake")
+        input_tokens = _estimate_input_tokens(body)
+        output_tokens = min(config.output_tokens, body.get("max_tokens", config.output_tokens))
+        words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(output_tokens)]
+        message_id = f"msg_bench_{uuid.uuid4().hex[:24]}"
+
+        if config.random.random() < config.error_rate:
+            # 過負荷の応答(アプリ側の再試行・サーキットブレーカーの経路を通す)
+            await asyncio.sleep(config.first_token_delay())
+            return JSONResponse(
+                status_code=529,
+                content={"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}
+            )
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.first_token_delay() + output_tokens * config.token_ms / 1000.0)
+            return {
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": "".join(words)}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            }
+
+        async def event_stream():
+            yield _sse("message_start", {
+                "type": "message_start",
+                "message": {
+                    "id": message_id, "type": "message", "role": "assistant", "model": model,
+                    "content": [], "stop_reason": None, "stop_sequence": None,
+                    "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+                },
+            })
+            yield _sse("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+            await asyncio.sleep(config.first_token_delay())
+            for i, word in enumerate(words):
+                if i > 0:
+                    await asyncio.sleep(config.token_ms / 1000.0)
+                yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}})
+            yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield _sse("message_delta", {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": output_tokens},
+            })
+            yield _sse("message_stop", {"type": "message_stop"})
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ベンチマーク用の Anthropic API 代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--ttft-ms", type=float, default=400.0, help="最初のトークンまでの遅延")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="トークン間の遅延")
+    parser.add_argument("--output-tokens", type=int, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="最初のトークンまでの遅延のゆらぎ(±)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="529 を返す割合")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = FakeAnthropicConfig(args.ttft_ms, args.token_ms, args.output_tokens, args.jitter_ms, args.error_rate, args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
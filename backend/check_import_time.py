@@ -0,0 +1,39 @@
+"""
+app.main のインポート時間を計測し、予算を超えていれば失敗するスクリプト
+(モデルやクライアントの読み込みがインポート時に紛れ込んでいないかの確認用)
+
+使い方:
+    python check_import_time.py               # 予算 1500ms
+    python check_import_time.py --budget-ms 800
+"""
+import argparse
+import subprocess
+import sys
+
+def measure_import_ms(module: str, runs: int) -> float:
+    """別プロセスでモジュールをインポートし、最短の所要時間(ms)を返す"""
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; "
+        "print((time.perf_counter() - started) * 1000)"
+    )
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="app.main のインポート時間を計測")
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--module", default="app.main")
+    args = parser.parse_args()
+
+    elapsed_ms = measure_import_ms(args.module, args.runs)
+    print(f"{args.module} のインポート時間: {elapsed_ms:.0f}ms (予算: {args.budget_ms:.0f}ms)")
+
+    if elapsed_ms > args.budget_ms:
+        print("❌ インポート時間が予算を超えています")
+        sys.exit(1)
+    print("✓ 予算内です")
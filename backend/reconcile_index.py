@@ -0,0 +1,37 @@
+"""
+ベクトル索引をデータベース(FAQ・ドキュメント)と照合するスクリプト
+変更・欠落のある行だけを再埋め込みし、孤児となった索引を削除します
+
+使い方:
+    python reconcile_index.py            # 照合して反映
+    python reconcile_index.py --dry-run  # 差分の件数のみ表示
+"""
+import sys
+import time
+from app.database import init_db
+from app.reconcile import reconcile_index
+
+if __name__ == "__main__":
+    dry_run = "--dry-run" in sys.argv[1:]
+
+    print("=" * 50)
+    print("株式会社カンマン チャットボット")
+    print("ベクトル索引 照合スクリプト" + (" (dry-run)" if dry_run else ""))
+    print("=" * 50)
+
+    init_db()
+
+    started = time.perf_counter()
+    try:
+        stats = reconcile_index(dry_run=dry_run)
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    print(f"追加: {stats['added']} 件")
+    print(f"更新: {stats['updated']} 件")
+    print(f"削除: {stats['deleted']} 件")
+    print(f"変更なし: {stats['unchanged']} 件")
+    print(f"所要時間: {elapsed:.2f} 秒")
+    sys.exit(0)
@@ -0,0 +1,13 @@
+# テスト用の設定(app の import 前に環境変数を用意する)
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="comman-test-")
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+os.environ.setdefault("CHROMA_PERSIST_DIRECTORY", os.path.join(_workdir, "chroma_db"))
+os.environ.setdefault("UPLOAD_DIRECTORY", os.path.join(_workdir, "uploads"))
+os.environ.setdefault("RATE_LIMIT_SQLITE_PATH", os.path.join(_workdir, "rate_limit.db"))
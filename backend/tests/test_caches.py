@@ -0,0 +1,105 @@
+import time
+
+from app.database import User
+from app.embedding_cache import QueryEmbeddingCache, normalize_query
+from app.session_cache import SessionHistoryCache
+from app.user_cache import UserCache
+
+def _turn(i: int) -> dict:
+    return {"user_message": f"質問{i}", "bot_response": f"回答{i}"}
+
+# ============ SessionHistoryCache ============
+
+def test_session_cache_returns_copies():
+    cache = SessionHistoryCache(max_turns=5, max_sessions=10, ttl_seconds=60, max_bytes=10000)
+    cache.put("s1", [_turn(1)], "要約")
+    history, summary = cache.get("s1")
+    history[0]["user_message"] = "変更"
+    assert cache.get("s1") == ([_turn(1)], "要約")
+    assert summary == "要約"
+
+def test_session_cache_append_keeps_last_turns():
+    cache = SessionHistoryCache(max_turns=2, max_sessions=10, ttl_seconds=60, max_bytes=10000)
+    cache.put("s1", [_turn(1), _turn(2)], None)
+    cache.append("s1", _turn(3), "要約")
+    assert cache.get("s1") == ([_turn(2), _turn(3)], "要約")
+    # キャッシュにないセッションへの追加は無視
+    cache.append("s2", _turn(1), None)
+    assert cache.get("s2") is None
+
+def test_session_cache_evicts_least_recently_used():
+    cache = SessionHistoryCache(max_turns=5, max_sessions=2, ttl_seconds=60, max_bytes=10000)
+    cache.put("s1", [_turn(1)], None)
+    cache.put("s2", [_turn(2)], None)
+    cache.get("s1")
+    cache.put("s3", [_turn(3)], None)
+    assert cache.get("s2") is None
+    assert cache.get("s1") is not None
+
+def test_session_cache_respects_byte_limit():
+    cache = SessionHistoryCache(max_turns=5, max_sessions=10, ttl_seconds=60, max_bytes=20)
+    cache.put("s1", [_turn(1)], None)
+    cache.put("s2", [_turn(2)], None)
+    assert cache.get("s1") is None
+    assert cache.get("s2") is not None
+
+def test_session_cache_expires():
+    cache = SessionHistoryCache(max_turns=5, max_sessions=10, ttl_seconds=0.05, max_bytes=10000)
+    cache.put("s1", [_turn(1)], None)
+    time.sleep(0.06)
+    assert cache.get("s1") is None
+
+# ============ UserCache ============
+
+def _user(username: str = "admin") -> User:
+    return User(id=1, username=username, email=f"{username}@example.com", hashed_password="hash",
+                is_active=True, is_admin=True)
+
+def test_user_cache_returns_new_instances():
+    cache = UserCache(max_entries=10, ttl_seconds=60)
+    cache.put(_user())
+    first = cache.get("admin")
+    second = cache.get("admin")
+    assert first is not second
+    assert (first.username, first.email, first.is_admin) == ("admin", "admin@example.com", True)
+
+def test_user_cache_invalidate_and_expire():
+    cache = UserCache(max_entries=10, ttl_seconds=0.05)
+    cache.put(_user())
+    cache.invalidate("admin")
+    assert cache.get("admin") is None
+    cache.put(_user())
+    time.sleep(0.06)
+    assert cache.get("admin") is None
+
+def test_user_cache_evicts_oldest():
+    cache = UserCache(max_entries=1, ttl_seconds=60)
+    cache.put(_user("a"))
+    cache.put(_user("b"))
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+# ============ QueryEmbeddingCache ============
+
+def test_normalize_query():
+    assert normalize_query("  料金は？ ") == normalize_query("料金は?")
+    assert normalize_query("ＡＩ 研修") == "ai研修"
+
+def test_embedding_cache_hit_by_normalized_text_and_model():
+    cache = QueryEmbeddingCache(max_entries=10, max_bytes=100000)
+    cache.put("model-a", "料金は？", [0.5, 0.25])
+    assert cache.get("model-a", "料金は?") == [0.5, 0.25]
+    assert cache.get("model-b", "料金は？") is None
+
+def test_embedding_cache_evicts_by_count_and_bytes():
+    cache = QueryEmbeddingCache(max_entries=2, max_bytes=100000)
+    for text in ("a", "b", "c"):
+        cache.put("model", text, [1.0])
+    assert cache.get("model", "a") is None
+    assert cache.get("model", "c") == [1.0]
+
+    small = QueryEmbeddingCache(max_entries=10, max_bytes=30)
+    small.put("m", "a", [1.0] * 4)
+    small.put("m", "b", [1.0] * 4)
+    assert small.get("m", "a") is None
+    assert small.get("m", "b") is not None
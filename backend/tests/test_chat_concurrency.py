@@ -0,0 +1,60 @@
+# /api/chat の同時リクエストがイベントループ上で並行に処理されることの確認
+import asyncio
+import time
+
+import httpx
+
+from app import main
+from app.database import get_async_db
+
+CONCURRENCY = 10
+GENERATE_SECONDS = 0.2
+
+async def _no_db():
+    yield None
+
+def test_concurrent_chat_requests_overlap(monkeypatch):
+    active = 0
+    max_active = 0
+
+    async def fake_generate(user_message, session_history=None, use_cache=True, session_summary=None):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(GENERATE_SECONDS)
+        active -= 1
+        return f"回答: {user_message}", []
+
+    async def fake_load_history(db, session_id):
+        return [], None
+
+    async def fake_save_turn(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(main.chatbot_service, "agenerate_response", fake_generate)
+    monkeypatch.setattr(main, "load_session_history", fake_load_history)
+    monkeypatch.setattr(main, "save_chat_turn", fake_save_turn)
+    monkeypatch.setattr(main, "chat_rate_limiter", None)
+    main.app.dependency_overrides[get_async_db] = _no_db
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post("/api/chat", json={"message": f"質問{i}", "session_id": f"session-{i}"})
+                for i in range(CONCURRENCY)
+            ))
+            return responses, time.perf_counter() - started
+
+    try:
+        responses, elapsed = asyncio.run(run())
+    finally:
+        main.app.dependency_overrides.pop(get_async_db, None)
+
+    assert [response.status_code for response in responses] == [200] * CONCURRENCY
+    assert [response.json()["response"] for response in responses] == [f"回答: 質問{i}" for i in range(CONCURRENCY)]
+    assert "generate;dur=" in responses[0].headers["server-timing"]
+    # 直列に処理されると GENERATE_SECONDS * CONCURRENCY かかる
+    assert max_active == CONCURRENCY
+    assert elapsed < GENERATE_SECONDS * CONCURRENCY / 2
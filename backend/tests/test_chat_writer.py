@@ -0,0 +1,29 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app.chat_writer import ChatHistoryWriter
+from app.database import AsyncSessionLocal, ChatHistory, init_db
+
+def test_poison_row_does_not_drop_the_rest_of_the_batch():
+    init_db()
+    writer = ChatHistoryWriter(batch_size=10, flush_interval_ms=10, max_queue_size=100,
+                               summary_max_tokens=100, max_retries=1)
+    failures_before = writer.write_failures.value
+
+    async def run():
+        writer.start()
+        for i in range(5):
+            # 3件目は NOT NULL 制約に違反する
+            message = None if i == 2 else f"質問{i}"
+            await writer.enqueue("poison-batch", message, f"回答{i}", {"contexts": []}, answer_source="llm")
+        await writer.stop()
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ChatHistory.bot_response).where(ChatHistory.session_id == "poison-batch").order_by(ChatHistory.id)
+            )
+            return list(result.scalars().all())
+
+    assert asyncio.run(run()) == ["回答0", "回答1", "回答3", "回答4"]
+    assert writer.write_failures.value == failures_before + 1
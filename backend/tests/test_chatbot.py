@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+from app.chatbot import chatbot_service
+from app.llm_resilience import HALF_OPEN, CircuitBreaker
+
+def _half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test_chatbot_llm", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    return breaker
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_prompt_build_error_releases_the_trial_slot(monkeypatch, stream):
+    breaker = _half_open_breaker()
+
+    async def fake_retrieve(user_message):
+        return [0.0], []
+
+    def failing_build(*args, **kwargs):
+        raise ValueError("broken prompt")
+
+    monkeypatch.setattr(chatbot_service, "circuit_breaker", breaker)
+    monkeypatch.setattr(chatbot_service, "_aretrieve", fake_retrieve)
+    monkeypatch.setattr(chatbot_service, "_answer_without_llm", lambda *args: None)
+    monkeypatch.setattr(chatbot_service, "_build_request_params", failing_build)
+
+    async def run():
+        if stream:
+            async for _ in chatbot_service.agenerate_response_stream("質問"):
+                pass
+        else:
+            await chatbot_service.agenerate_response("質問")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+    # 試行枠が返っていれば、次の呼び出しが試行を行える
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow().trial
+
+def _faq(distance, question="料金は?"):
+    return {
+        "id": "faq_1",
+        "document": f"質問: {question}\n回答: 月額1万円からです。",
+        "metadata": {"source": "FAQ", "is_active": True},
+        "distance": distance,
+    }
+
+def test_fast_path_answers_a_clear_faq_match():
+    answer = chatbot_service._faq_fast_path([_faq(0.01), _faq(0.5, "営業時間は?")])
+    assert answer is not None
+    assert answer[1][0]["fast_path"]
+
+def test_fast_path_skips_when_runner_up_has_no_distance():
+    # ハイブリッド検索で n-gram 索引のみに一致した次点(距離なし)
+    lexical_only = {"id": "doc_2", "document": "料金表", "metadata": {"source": "Document"}, "distance": None}
+    assert chatbot_service._faq_fast_path([_faq(0.01), lexical_only]) is None
+
+def test_fast_path_skips_ambiguous_match():
+    assert chatbot_service._faq_fast_path([_faq(0.01), _faq(0.02, "料金の支払い方法は?")]) is None
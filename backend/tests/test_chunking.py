@@ -0,0 +1,20 @@
+from app.chunking import chunk_text, is_heading
+
+def test_heading_markers():
+    assert is_heading("■ 料金について")
+    assert is_heading("【お問い合わせ】")
+    assert is_heading("## 概要")
+    assert is_heading("第3章 サポート")
+    assert not is_heading("● 平日 9:00〜18:00")
+    assert not is_heading("○ 土日祝日は休業")
+    assert not is_heading("【注意】土日は休業です。")
+
+def test_bullet_list_stays_in_one_chunk():
+    text = "■ 営業時間\n● 平日 9:00〜18:00\n○ 土曜 10:00〜15:00\n◆ 日曜・祝日は休業"
+    chunks = chunk_text(text, chunk_size=200, overlap=20)
+    assert chunks == [text]
+
+def test_headings_start_new_chunks():
+    text = "■ 料金\n月額1万円からです。\n【お問い合わせ】\nメールで受け付けています。"
+    chunks = chunk_text(text, chunk_size=200, overlap=20)
+    assert chunks == ["■ 料金\n月額1万円からです。", "【お問い合わせ】\nメールで受け付けています。"]
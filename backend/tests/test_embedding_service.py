@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+from app.embedding_service import EmbeddingBatcher
+
+def _batcher(encode_fn=None) -> EmbeddingBatcher:
+    return EmbeddingBatcher(encode_fn or (lambda texts: [[float(len(text))] for text in texts]),
+                            max_batch_size=8, max_wait_ms=1)
+
+def test_requests_are_batched():
+    batcher = _batcher()
+    assert batcher.encode(["a", "bb", "ccc"]) == [[1.0], [2.0], [3.0]]
+
+def test_cancelled_request_does_not_stop_the_worker():
+    release = threading.Event()
+
+    def slow_encode(texts):
+        release.wait(5)
+        return [[float(len(text))] for text in texts]
+
+    batcher = _batcher(slow_encode)
+
+    async def run():
+        # 計算前にキャンセル(キューで待っている要求)と、計算中にキャンセルの両方
+        running = asyncio.ensure_future(batcher.aencode_one("running"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(batcher.aencode_one("queued"))
+        await asyncio.sleep(0)
+        running.cancel()
+        queued.cancel()
+        release.set()
+        await asyncio.gather(running, queued, return_exceptions=True)
+        return await asyncio.wait_for(batcher.aencode_one("next"), timeout=5)
+
+    assert asyncio.run(run()) == [4.0]
+    assert batcher._worker.is_alive()
+
+def test_encode_error_is_returned_to_callers():
+    def failing_encode(texts):
+        raise ValueError("boom")
+
+    batcher = _batcher(failing_encode)
+    future = batcher.submit("a")
+    assert isinstance(future.exception(timeout=5), ValueError)
+    assert batcher._worker.is_alive()
+
+def test_dead_worker_is_restarted():
+    batcher = _batcher()
+    batcher.encode_one("a")
+    batcher._worker = threading.Thread(target=lambda: None)
+    batcher._worker.start()
+    batcher._worker.join()
+    assert batcher.encode_one("abc") == [3.0]
@@ -0,0 +1,70 @@
+import uuid
+from datetime import datetime, timedelta
+
+from app import ingestion
+from app.database import Document, IngestionJob, SessionLocal, init_db
+from app.indexing import DocumentContentHasher, document_content_hash
+
+def test_streamed_content_hash_matches_document_hash():
+    pages = ["1ページ目", "2ページ目", "3ページ目"]
+    hasher = DocumentContentHasher("タイトル", "カテゴリ")
+    hasher.update(pages[0])
+    hasher.update("\n\n" + "\n\n".join(pages[1:]))
+    document = Document(title="タイトル", content="\n\n".join(pages), category="カテゴリ")
+    assert hasher.hexdigest() == document_content_hash(document)
+
+def _add_job(db, updated_at: datetime) -> str:
+    job_id = str(uuid.uuid4())
+    db.add(IngestionJob(id=job_id, filename="a.txt", file_path=f"/nonexistent/{job_id}.txt", file_type="text",
+                        title="a", status="running", pages_processed=0, chunks_indexed=0,
+                        created_at=updated_at, updated_at=updated_at))
+    return job_id
+
+def test_only_jobs_with_expired_leases_are_failed():
+    init_db()
+    db = SessionLocal()
+    try:
+        stale = datetime.utcnow() - timedelta(hours=1)
+        expired = _add_job(db, stale)
+        fresh = _add_job(db, datetime.utcnow())
+        owned = _add_job(db, stale)
+        db.commit()
+    finally:
+        db.close()
+
+    ingestion._owned_jobs.add(owned)
+    try:
+        ingestion.fail_interrupted_jobs()
+    finally:
+        ingestion._owned_jobs.discard(owned)
+
+    db = SessionLocal()
+    try:
+        statuses = {job_id: db.get(IngestionJob, job_id).status for job_id in (expired, fresh, owned)}
+    finally:
+        db.close()
+    assert statuses == {expired: "failed", fresh: "running", owned: "running"}
+
+def test_renew_job_leases_extends_owned_jobs():
+    init_db()
+    db = SessionLocal()
+    try:
+        job_id = _add_job(db, datetime.utcnow() - timedelta(hours=1))
+        db.commit()
+    finally:
+        db.close()
+
+    ingestion._owned_jobs.add(job_id)
+    try:
+        ingestion.renew_job_leases()
+        ingestion.fail_interrupted_jobs()
+    finally:
+        ingestion._owned_jobs.discard(job_id)
+
+    db = SessionLocal()
+    try:
+        job = db.get(IngestionJob, job_id)
+        assert job.status == "running"
+        assert job.updated_at > datetime.utcnow() - timedelta(minutes=1)
+    finally:
+        db.close()
@@ -0,0 +1,79 @@
+import time
+
+from app.llm_resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, backoff_delay
+
+def _breaker(threshold: int = 2, reset: float = 0.05) -> CircuitBreaker:
+    return CircuitBreaker("test_llm", failure_threshold=threshold, reset_timeout=reset)
+
+def test_opens_after_consecutive_failures():
+    breaker = _breaker()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+def test_success_resets_failure_count():
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+def test_half_open_allows_a_single_trial():
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+def test_failed_trial_reopens():
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+def test_release_returns_the_trial_slot():
+    breaker = _breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+    trial = breaker.allow()
+    assert trial.trial
+    breaker.release(trial)
+    assert breaker.allow().trial
+
+def test_non_trial_call_does_not_release_the_trial_slot():
+    breaker = _breaker()
+    # closed の間に許可された呼び出しが、half_open になってから終わる
+    normal = breaker.allow()
+    assert not normal.trial
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+    trial = breaker.allow()
+    assert trial.trial
+    breaker.release(normal)
+    assert breaker.allow() is None
+    breaker.release(trial)
+    assert breaker.allow().trial
+
+def test_zero_threshold_disables_breaker():
+    breaker = _breaker(threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+    assert breaker.allow()
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base_delay=0.5, max_delay=4.0) <= 4.0
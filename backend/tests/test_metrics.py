@@ -0,0 +1,67 @@
+import contextvars
+
+import pytest
+
+from app.metrics import MetricsRegistry, metrics
+from app.timing import begin_request, describe_stage, record_stage, stage
+
+def test_labeled_series_share_one_family():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "リクエスト数", labels={"scope": "ip"}).inc()
+    registry.counter("requests_total", "リクエスト数", labels={"scope": "session"}).inc(2)
+    assert registry.counter("requests_total", labels={"scope": "ip"}).value == 1
+
+    text = registry.render_prometheus()
+    assert text.count("# TYPE requests_total counter") == 1
+    assert 'requests_total{scope="ip"} 1' in text
+    assert 'requests_total{scope="session"} 2' in text
+    assert registry.snapshot() == {'requests_total{scope="ip"}': 1, 'requests_total{scope="session"}': 2}
+
+def test_histogram_renders_cumulative_buckets_with_labels():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "所要時間", buckets=(0.1, 1.0), labels={"stage": "embed"})
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    lines = registry.render_prometheus().splitlines()
+    assert 'stage_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="embed",le="1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="embed",le="+Inf"} 3' in lines
+    assert 'stage_seconds_count{stage="embed"} 3' in lines
+    assert 'stage_seconds_sum{stage="embed"} 5.55' in lines
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.gauge("value", labels={"name": 'a"b\\c'}).set(1)
+    assert 'value{name="a\\"b\\\\c"} 1' in registry.render_prometheus()
+
+def test_kind_is_fixed_per_name():
+    registry = MetricsRegistry()
+    registry.counter("things_total", labels={"kind": "a"})
+    with pytest.raises(ValueError):
+        registry.gauge("things_total", labels={"kind": "b"})
+
+def test_stages_are_recorded_in_request_and_histogram():
+    def run():
+        timings = begin_request()
+        with stage("test_stage"):
+            pass
+        record_stage("test_stage", 0.25)
+        record_stage("test_other", 0.001)
+        describe_stage("test_other", "tokens=3")
+        return timings.server_timing()
+
+    count_before = metrics.histogram("stage_seconds", labels={"stage": "test_stage"}).count
+    # リクエストごとのコンテキストで実行する
+    server_timing = contextvars.copy_context().run(run)
+
+    assert metrics.histogram("stage_seconds", labels={"stage": "test_stage"}).count == count_before + 2
+    first, second = server_timing.split(", ")
+    assert first.startswith("test_stage;dur=250.")
+    assert second == 'test_other;dur=1.0;desc="tokens=3"'
+
+def test_record_stage_outside_request_only_updates_histogram():
+    histogram = metrics.histogram("stage_seconds", labels={"stage": "test_background"})
+    count_before = histogram.count
+    contextvars.Context().run(record_stage, "test_background", 0.1)
+    assert histogram.count == count_before + 1
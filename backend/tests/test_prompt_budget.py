@@ -0,0 +1,35 @@
+from app.prompt_budget import append_to_summary, estimate_tokens, fit_history, fit_texts, truncate_to_tokens
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("日本語") == 3
+    assert estimate_tokens("abcdefgh") == 2
+
+def test_truncate_to_tokens():
+    assert truncate_to_tokens("短い", 10) == "短い"
+    truncated = truncate_to_tokens("あ" * 20, 5)
+    assert truncated.endswith("…")
+    assert estimate_tokens(truncated) <= 5
+    assert truncate_to_tokens("あいう", 0) == ""
+
+def test_fit_texts_truncates_first_overflowing_text():
+    texts = ["あ" * 30, "い" * 100, "う" * 10]
+    selected = fit_texts(texts, budget=90, min_tokens=50)
+    assert selected[0] == texts[0]
+    assert len(selected) == 2
+    assert selected[1].endswith("…")
+    assert fit_texts(texts, budget=40, min_tokens=50) == [texts[0]]
+
+def test_fit_history_keeps_latest_turns_in_order():
+    history = [{"user_message": f"質問{i}", "bot_response": "回答" * 10} for i in range(5)]
+    selected = fit_history(history, budget=50, turn_max_tokens=100)
+    assert [turn["user_message"] for turn in selected] == ["質問3", "質問4"]
+
+def test_append_to_summary_drops_oldest_lines():
+    summary = ""
+    for i in range(20):
+        summary = append_to_summary(summary, {"user_message": f"質問{i}", "bot_response": "回答"}, max_tokens=60)
+    lines = summary.splitlines()
+    assert estimate_tokens(summary) <= 60
+    assert "質問19" in lines[-1]
+    assert not any("質問0 " in line for line in lines)
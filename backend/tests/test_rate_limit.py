@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+from app.rate_limit import (
+    ChatRateLimiter, LLMAdmission, LLMOverloadedError, MemoryTokenBucketBackend, RateLimitExceeded,
+    SQLiteTokenBucketBackend, retry_after_header
+)
+
+def test_memory_bucket_allows_burst_then_rejects():
+    backend = MemoryTokenBucketBackend()
+    assert [backend.take("ip:1", rate=1.0, burst=3)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = backend.take("ip:1", rate=1.0, burst=3)
+    assert not allowed
+    assert 0 < retry_after <= 1.0
+    # 別のキーは独立
+    assert backend.take("ip:2", rate=1.0, burst=3)[0]
+
+def test_memory_bucket_refills_over_time():
+    backend = MemoryTokenBucketBackend()
+    assert backend.take("key", rate=20.0, burst=1)[0]
+    assert not backend.take("key", rate=20.0, burst=1)[0]
+    time.sleep(0.06)
+    assert backend.take("key", rate=20.0, burst=1)[0]
+
+def test_memory_bucket_evicts_oldest_keys():
+    backend = MemoryTokenBucketBackend(max_keys=2)
+    for key in ("a", "b", "c"):
+        backend.take(key, rate=1.0, burst=1)
+    assert list(backend._buckets) == ["b", "c"]
+
+def test_sqlite_bucket_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "buckets.db")
+    first = SQLiteTokenBucketBackend(path)
+    second = SQLiteTokenBucketBackend(path)
+    assert first.take("ip:1", rate=1.0, burst=2)[0]
+    assert second.take("ip:1", rate=1.0, burst=2)[0]
+    assert not first.take("ip:1", rate=1.0, burst=2)[0]
+
+def test_chat_rate_limiter_checks_ip_and_session():
+    limiter = ChatRateLimiter(MemoryTokenBucketBackend(), ip_per_minute=60, ip_burst=5,
+                              session_per_minute=60, session_burst=1)
+    limiter.check("10.0.0.1", "session-a")
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.check("10.0.0.1", "session-a")
+    assert excinfo.value.scope == "session"
+    # セッションIDなしはIPの制限のみ
+    limiter.check("10.0.0.1")
+
+def test_chat_rate_limiter_zero_disables_limit():
+    limiter = ChatRateLimiter(MemoryTokenBucketBackend(), ip_per_minute=0, ip_burst=0,
+                              session_per_minute=0, session_burst=0)
+    for _ in range(10):
+        limiter.check("10.0.0.1", "session-a")
+
+def test_retry_after_header_rounds_up():
+    assert retry_after_header(0.2) == "1"
+    assert retry_after_header(2.1) == "3"
+
+def test_llm_admission_rejects_when_queue_is_full():
+    async def run():
+        admission = LLMAdmission(max_concurrency=1, max_queue=0, queue_timeout=1.0)
+        async with admission:
+            with pytest.raises(LLMOverloadedError):
+                async with admission:
+                    pass
+        # 解放後は入れる
+        async with admission:
+            pass
+
+    asyncio.run(run())
+
+def test_llm_admission_times_out_waiting():
+    async def run():
+        admission = LLMAdmission(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        async with admission:
+            with pytest.raises(LLMOverloadedError):
+                async with admission:
+                    pass
+
+    asyncio.run(run())
+
+def test_llm_admission_limits_concurrency():
+    async def run():
+        admission = LLMAdmission(max_concurrency=2, max_queue=10, queue_timeout=5.0)
+        active = 0
+        max_active = 0
+
+        async def call():
+            nonlocal active, max_active
+            async with admission:
+                active += 1
+                max_active = max(max_active, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        return max_active
+
+    assert asyncio.run(run()) == 2
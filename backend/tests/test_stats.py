@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from app.stats import (
+    ANSWER_SOURCE_CACHE, ANSWER_SOURCE_FALLBACK, ANSWER_SOURCE_FAQ, ANSWER_SOURCE_LLM,
+    aggregate_chat_records, answer_source
+)
+
+def test_answer_source():
+    assert answer_source([{"fast_path": True}]) == ANSWER_SOURCE_FAQ
+    assert answer_source([{"fallback": True}]) == ANSWER_SOURCE_FALLBACK
+    assert answer_source([{"cached": True}, {}]) == ANSWER_SOURCE_CACHE
+    assert answer_source([{"document": "..."}]) == ANSWER_SOURCE_LLM
+    assert answer_source([]) == ANSWER_SOURCE_LLM
+
+def test_cached_answers_are_not_counted_as_llm_answers():
+    created_at = datetime(2024, 4, 1, 3, 0)
+    records = [
+        {"created_at": created_at, "answer_source": ANSWER_SOURCE_LLM, "new_session": True, "latency_ms": 900.0},
+        {"created_at": created_at, "answer_source": ANSWER_SOURCE_CACHE, "latency_ms": 20.0},
+        {"created_at": created_at, "answer_source": ANSWER_SOURCE_FAQ, "latency_ms": 10.0},
+    ]
+    (counts,) = aggregate_chat_records(records).values()
+    assert counts["chats"] == 3
+    assert counts["sessions"] == 1
+    assert counts["llm_answers"] == 1
+    assert counts["faq_answers"] == 1
+    assert counts["latency_samples"] == 3
@@ -1,5 +1,4 @@
 import React, { useState, useEffect, useRef } from 'react';
-import axios from 'axios';
 import './ChatWidget.css';
 
 interface Message {
@@ -67,35 +66,88 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({
     setInputText('');
     setIsLoading(true);
 
+    const botMessageId = `bot_${Date.now()}`;
+    let receivedText = false;
+
+    // ボットメッセージのテキストを追記
+    const appendBotText = (text: string) => {
+      setMessages(prev => {
+        if (!prev.some(m => m.id === botMessageId)) {
+          return [...prev, { id: botMessageId, text, sender: 'bot', timestamp: new Date() }];
+        }
+        return prev.map(m => (m.id === botMessageId ? { ...m, text: m.text + text } : m));
+      });
+    };
+
+    // セッションIDを更新
+    const updateSessionId = (newSessionId?: string) => {
+      if (newSessionId) {
+        setSessionId(newSessionId);
+        localStorage.setItem('comman_chat_session_id', newSessionId);
+      }
+    };
+
     try {
-      const response = await axios.post(`${apiUrl}/api/chat`, {
-        message: inputText,
-        session_id: sessionId
+      const response = await fetch(`${apiUrl}/api/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify({ message: inputText, session_id: sessionId })
       });
 
-      const botMessage: Message = {
-        id: `bot_${Date.now()}`,
-        text: response.data.response,
-        sender: 'bot',
-        timestamp: new Date()
-      };
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+
+      // Server-Sent Events を逐次パースして描画
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
 
-      setMessages(prev => [...prev, botMessage]);
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf('\n\n');
 
-      // セッションIDを更新
-      if (response.data.session_id) {
-        setSessionId(response.data.session_id);
-        localStorage.setItem('comman_chat_session_id', response.data.session_id);
+          let eventName = 'message';
+          let data = '';
+          rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event: ')) eventName = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+          });
+          if (!data) continue;
+
+          const payload = JSON.parse(data);
+          if (eventName === 'session') {
+            updateSessionId(payload.session_id);
+          } else if (eventName === 'delta') {
+            receivedText = true;
+            appendBotText(payload.text);
+          } else if (eventName === 'error') {
+            throw new Error(payload.detail);
+          }
+        }
+      }
+
+      if (!receivedText) {
+        throw new Error('空の応答');
       }
     } catch (error) {
       console.error('チャットエラー:', error);
-      const errorMessage: Message = {
-        id: `error_${Date.now()}`,
-        text: '申し訳ございません。エラーが発生しました。しばらく経ってから再度お試しください。',
-        sender: 'bot',
-        timestamp: new Date()
-      };
-      setMessages(prev => [...prev, errorMessage]);
+      if (!receivedText) {
+        const errorMessage: Message = {
+          id: `error_${Date.now()}`,
+          text: '申し訳ございません。エラーが発生しました。しばらく経ってから再度お試しください。',
+          sender: 'bot',
+          timestamp: new Date()
+        };
+        setMessages(prev => [...prev, errorMessage]);
+      }
     } finally {
       setIsLoading(false);
     }
@@ -180,7 +232,7 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({
                 </div>
               </div>
             ))}
-            {isLoading && (
+            {isLoading && messages[messages.length - 1]?.sender !== 'bot' && (
               <div className="message message-bot">
                 <div className="message-content">
                   <div className="typing-indicator">